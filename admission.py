@@ -0,0 +1,182 @@
+import time
+import threading
+from collections import OrderedDict, Counter
+from flask import request, session, jsonify
+
+# Admission control in front of the routes that cost Sheets calls. Every
+# request is given a cost class by endpoint; it must get tokens from its
+# client's bucket for that class and from one global bucket, and expensive
+# routes also need one of a few concurrency slots. The last RESERVE share
+# of the global bucket can only be spent by the voting routes, so a crowd
+# refreshing results can never starve the booths. Turned-away requests get
+# a 429, or the route's fallback (the last results page) when it has one.
+
+COST_CLASSES = {
+    # cost: global tokens per request; client_rate/client_burst: per-client
+    # bucket (tokens per second, size); concurrency: slots per route
+    'voting': {'cost': 1, 'client_rate': 2.0, 'client_burst': 30, 'concurrency': None, 'reserved': True},
+    'expensive': {'cost': 5, 'client_rate': 0.2, 'client_burst': 5, 'concurrency': 4},
+    'page': {'cost': 1, 'client_rate': 2.0, 'client_burst': 20, 'concurrency': None},
+}
+# Endpoint (or 'endpoint:METHOD') -> cost class; anything else is 'page'
+ROUTE_CLASSES = {
+    'vote': 'voting',
+    'verify_voter': 'voting',
+    'start_ballot': 'voting',
+    'voting_flow': 'voting',
+    'confirm_votes': 'voting',
+    'upload_session_video': 'voting',
+    'public_results': 'expensive',
+    'recover_id:POST': 'expensive',
+}
+EXEMPT_ENDPOINTS = {'static', 'candidate_image', 'admin_login', 'pause_status'}
+EXEMPT_PREFIXES = ('/sync/',)  # booths authenticate with their own token
+RESERVE = 0.3
+MAX_CLIENTS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost, floor=0):
+        # Takes `cost` tokens if that leaves at least `floor`
+        self._refill(time.monotonic())
+        if self.tokens - cost < floor:
+            return False
+        self.tokens -= cost
+        return True
+
+    def retry_after(self, cost, floor=0):
+        return max(1, int((cost + floor - self.tokens) / self.rate) + 1)
+
+
+class AdmissionController:
+    def __init__(self, global_rate=40, global_burst=200, enabled=True):
+        self.enabled = enabled
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.clients = OrderedDict()  # (client, class) -> TokenBucket
+        self.slots = {}  # endpoint -> BoundedSemaphore
+        self.busy = Counter()  # endpoint -> slots held
+        self.fallbacks = {}  # endpoint -> callable returning a response or None
+        self.counts = Counter()  # (class, outcome)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def classify(endpoint, method):
+        return ROUTE_CLASSES.get(f"{endpoint}:{method}") or ROUTE_CLASSES.get(endpoint) or 'page'
+
+    def _client_bucket(self, client, cost_class):
+        key = (client, cost_class)
+        bucket = self.clients.get(key)
+        if bucket:
+            self.clients.move_to_end(key)
+            return bucket
+        spec = COST_CLASSES[cost_class]
+        bucket = self.clients[key] = TokenBucket(spec['client_rate'], spec['client_burst'])
+        while len(self.clients) > MAX_CLIENTS:
+            self.clients.popitem(last=False)
+        return bucket
+
+    def admit(self, endpoint, method, client):
+        # None when admitted (and a concurrency slot, if any, is held),
+        # otherwise (reason, retry_after seconds)
+        cost_class = self.classify(endpoint, method)
+        spec = COST_CLASSES[cost_class]
+        floor = 0 if spec.get('reserved') else RESERVE * self.global_bucket.burst
+        with self.lock:
+            bucket = self._client_bucket(client, cost_class)
+            if not bucket.take(1):
+                self.counts[(cost_class, 'client_limited')] += 1
+                return 'client rate limit', bucket.retry_after(1)
+            if not self.global_bucket.take(spec['cost'], floor):
+                self.counts[(cost_class, 'global_limited')] += 1
+                return 'server busy', self.global_bucket.retry_after(spec['cost'], floor)
+            slots = None
+            if spec['concurrency']:
+                slots = self.slots.setdefault(endpoint, threading.BoundedSemaphore(spec['concurrency']))
+        if slots and not slots.acquire(blocking=False):
+            with self.lock:
+                self.counts[(cost_class, 'concurrency_limited')] += 1
+            return 'too many concurrent requests', 1
+        with self.lock:
+            self.counts[(cost_class, 'admitted')] += 1
+            if slots:
+                self.busy[endpoint] += 1
+        return None
+
+    def release(self, endpoint):
+        slots = self.slots.get(endpoint)
+        if slots:
+            with self.lock:
+                if self.busy[endpoint] <= 0:
+                    return
+                self.busy[endpoint] -= 1
+            slots.release()
+
+    def record_fallback(self, cost_class):
+        with self.lock:
+            self.counts[(cost_class, 'fallback')] += 1
+
+    def status(self):
+        with self.lock:
+            self.global_bucket._refill(time.monotonic())
+            by_class = {}
+            for (cost_class, outcome), n in self.counts.items():
+                by_class.setdefault(cost_class, {})[outcome] = n
+            return {
+                'enabled': self.enabled,
+                'global_tokens': round(self.global_bucket.tokens, 1),
+                'global_burst': self.global_bucket.burst,
+                'reserved_for_voting': RESERVE,
+                'clients_tracked': len(self.clients),
+                'busy_slots': dict(self.busy),
+                'requests': by_class,
+            }
+
+
+def init_app(app, controller):
+    def admit_request():
+        if not controller.enabled or request.endpoint is None:
+            return None
+        if request.endpoint in EXEMPT_ENDPOINTS or request.path.startswith(EXEMPT_PREFIXES):
+            return None
+        if session.get('admin_logged_in'):
+            return None
+        # The peer address: X-Forwarded-For is only trusted through ProxyFix,
+        # set up with the number of proxies in front (TRUSTED_PROXIES)
+        refused = controller.admit(request.endpoint, request.method, request.remote_addr or '-')
+        if refused is None:
+            if COST_CLASSES[controller.classify(request.endpoint, request.method)]['concurrency']:
+                request.environ['admission.slot'] = request.endpoint
+            return None
+        reason, retry_after = refused
+        fallback = controller.fallbacks.get(request.endpoint)
+        response = fallback() if fallback else None
+        if response is not None:
+            controller.record_fallback(controller.classify(request.endpoint, request.method))
+            response.headers['X-Served-From'] = 'snapshot'
+            return response
+        if request.accept_mimetypes.best == 'application/json':
+            response = jsonify({'error': 'too many requests', 'reason': reason})
+        else:
+            response = app.response_class(f'Too many requests ({reason}). Please try again shortly.',
+                                          mimetype='text/plain')
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    def release_slot(exc):
+        endpoint = request.environ.pop('admission.slot', None)
+        if endpoint:
+            controller.release(endpoint)
+
+    app.before_request(admit_request)
+    app.teardown_request(release_slot)
@@ -0,0 +1,527 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import datetime
+import requests
+from flask import Blueprint, request, jsonify, session
+from google_sheets import GoogleSheetsDB, selected_candidate_names
+
+# Multi-booth mode. Every booth runs the normal app with ELECTION_MODE=booth:
+# its `db` is a BoothDB backed by a local SQLite file, so verification and
+# voting never leave the machine. A BoothNode thread pushes new ballots to
+# the coordinator (ELECTION_MODE=coordinator) and pulls back the roster,
+# candidates and merged Used state. The coordinator merges ballots, flags a
+# VotingID cast at two booths, and writes accepted ballots to Google Sheets.
+
+
+class LocalStore:
+    def __init__(self, path, schema):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(schema)
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return [dict(r) for r in self.conn.execute(sql, params).fetchall()]
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).rowcount
+
+    def transaction(self, statements):
+        # statements: list of (sql, params), applied atomically
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                counts = [self.conn.execute(sql, params).rowcount for sql, params in statements]
+                self.conn.execute('COMMIT')
+                return counts
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def get_meta(self, key, default=None):
+        rows = self.query('SELECT value FROM meta WHERE key = ?', (key,))
+        return json.loads(rows[0]['value']) if rows else default
+
+    def meta_statement(self, key, value):
+        return ('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+
+BOOTH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS voters (
+    voting_id TEXT PRIMARY KEY, class TEXT, section TEXT, roll_no TEXT, used INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS ballots (
+    voting_id TEXT PRIMARY KEY, votes TEXT, v_code TEXT, timestamp TEXT, sync_status TEXT DEFAULT 'pending'
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+COORDINATOR_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ballots (
+    voting_id TEXT PRIMARY KEY, booth_id TEXT, votes TEXT, v_code TEXT, timestamp TEXT,
+    received TEXT, written INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS conflicts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, voting_id TEXT, booth_id TEXT, votes TEXT,
+    v_code TEXT, timestamp TEXT, received TEXT
+);
+CREATE TABLE IF NOT EXISTS used_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, voting_id TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS booths (booth_id TEXT PRIMARY KEY, last_seen TEXT, pushed INTEGER DEFAULT 0);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class BoothDB(GoogleSheetsDB):
+    # Same interface as GoogleSheetsDB for the voting flow, served from the
+    # booth's local store. Setup writes (voters, candidates, posts) are only
+    # possible on the coordinator; with no client they fail like an
+    # unconfigured GoogleSheetsDB does.
+    def __init__(self, path):
+        self.sheet_id = None
+        self.credentials_json = None
+        self.client = None
+        self.store = LocalStore(path, BOOTH_SCHEMA)
+
+    def get_all_voters(self):
+        rows = self.store.query('SELECT * FROM voters ORDER BY rowid')
+        return [{'VotingID': r['voting_id'], 'Class': r['class'], 'Section': r['section'],
+                 'RollNo': r['roll_no'], 'Used': 'YES' if r['used'] else 'NO'} for r in rows]
+
+    def get_voter_details(self, voting_id):
+        rows = self.store.query('SELECT * FROM voters WHERE voting_id = ?', (str(voting_id),))
+        if not rows:
+            return None
+        r = rows[0]
+        return {'class': r['class'], 'section': r['section'], 'roll_no': r['roll_no'], 'used': bool(r['used'])}
+
+    find_voter = get_voter_details
+
+    def get_voter_by_details(self, class_val, section, roll_no):
+        rows = self.store.query(
+            'SELECT * FROM voters WHERE class = ? AND UPPER(section) = ? AND roll_no = ?',
+            (str(class_val), str(section).upper(), str(roll_no)))
+        if not rows:
+            return None
+        return {'voter_id': rows[0]['voting_id'], 'used': bool(rows[0]['used'])}
+
+    def validate_voting_id(self, voting_id):
+        details = self.get_voter_details(voting_id)
+        return bool(details) and not details['used']
+
+    def mark_voting_id_used(self, voting_id):
+        return self.store.execute('UPDATE voters SET used = 1 WHERE voting_id = ?', (str(voting_id),)) > 0
+
+    def store_vote(self, voting_id, votes_dict, v_code='000', timestamp=None):
+        timestamp = timestamp or datetime.datetime.now().isoformat()
+        try:
+            return self.store.execute(
+                'INSERT INTO ballots (voting_id, votes, v_code, timestamp) VALUES (?, ?, ?, ?)',
+                (str(voting_id), json.dumps(votes_dict), v_code, timestamp)) > 0
+        except sqlite3.IntegrityError:
+            print(f"Booth: ballot for {voting_id} already stored locally")
+            return False
+
+    def get_all_votes(self):
+        # Same shape as VOTES records: one 1/0 column per candidate name
+        names = []
+        for cands in self.get_candidates_by_post().values():
+            names += [c['name'] for c in cands]
+        records = []
+        for b in self.store.query("SELECT * FROM ballots WHERE sync_status != 'conflict' ORDER BY rowid"):
+            selected = selected_candidate_names(json.loads(b['votes']))
+            record = {'VotingID': b['voting_id']}
+            record.update({name: 1 if name in selected else 0 for name in names})
+            record['Timestamp'] = b['timestamp']
+            record['VerificationCode'] = b['v_code']
+            records.append(record)
+        return records
+
+    def get_all_records_safe(self, name, swallow=False):
+        if name == 'VOTERS':
+            return self.get_all_voters()
+        if name == 'VOTES':
+            return self.get_all_votes()
+        if name == 'VERIFICATIONS':
+            return [{'VotingID': b['voting_id'], 'VerificationCode': b['v_code'], 'Timestamp': b['timestamp']}
+                    for b in self.store.query('SELECT * FROM ballots ORDER BY rowid')]
+        return self.store.get_meta(name, [])
+
+    # The local store either answers or raises, so every read is strict
+    read_records = get_all_records_safe
+
+    def get_records_batch(self, names):
+        return {name: self.get_all_records_safe(name) for name in dict.fromkeys(names)}
+
+    # --- replication ---
+    def pending_ballots(self, limit=200):
+        return self.store.query("SELECT * FROM ballots WHERE sync_status = 'pending' ORDER BY rowid LIMIT ?", (limit,))
+
+    def mark_synced(self, voting_ids, status='synced'):
+        self.store.transaction([('UPDATE ballots SET sync_status = ? WHERE voting_id = ?', (status, vid))
+                                for vid in voting_ids])
+
+    def apply_state(self, state):
+        statements = []
+        if state.get('roster') is not None:
+            # Full roster refresh; locally cast ballots keep their Used flag
+            statements.append(('DELETE FROM voters', ()))
+            for v in state['roster']:
+                statements.append((
+                    'INSERT INTO voters (voting_id, class, section, roll_no, used) VALUES (?, ?, ?, ?, ?)',
+                    (str(v.get('VotingID')), str(v.get('Class', '')), str(v.get('Section', '')),
+                     str(v.get('RollNo', '')), 1 if str(v.get('Used', 'NO')).upper() == 'YES' else 0)))
+            statements.append(('UPDATE voters SET used = 1 WHERE voting_id IN (SELECT voting_id FROM ballots)', ()))
+            statements.append(self.store.meta_statement('roster_version', state['roster_version']))
+        for voting_id in state.get('used', []):
+            statements.append(('UPDATE voters SET used = 1 WHERE voting_id = ?', (str(voting_id),)))
+        if state.get('setup') is not None:
+            statements.append(self.store.meta_statement('POSTS', state['setup']['POSTS']))
+            statements.append(self.store.meta_statement('CANDIDATES', state['setup']['CANDIDATES']))
+            statements.append(self.store.meta_statement('setup_version', state['setup_version']))
+        statements.append(self.store.meta_statement('used_seq', state.get('used_seq', 0)))
+        self.store.transaction(statements)
+
+    def sync_cursor(self):
+        return {
+            'used_seq': self.store.get_meta('used_seq', 0),
+            'roster_version': self.store.get_meta('roster_version', ''),
+            'setup_version': self.store.get_meta('setup_version', ''),
+        }
+
+
+class BoothNode:
+    def __init__(self, db, coordinator_url, booth_id, token='', interval=5, on_change=None):
+        self.db = db
+        self.coordinator_url = coordinator_url.rstrip('/')
+        self.booth_id = booth_id
+        self.token = token
+        self.interval = interval
+        self.on_change = on_change
+        self.online = False
+        self.last_sync = None
+        self.last_error = None
+        self.thread = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name='booth-sync', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            self.sync_once()
+            time.sleep(self.interval)
+
+    def _post(self, path, payload):
+        response = requests.post(f"{self.coordinator_url}{path}", json=payload, timeout=10,
+                                 headers={'X-Booth-Token': self.token})
+        response.raise_for_status()
+        return response.json()
+
+    def sync_once(self):
+        # Push local ballots, then pull roster/used state. Any network error
+        # just leaves the ballots pending for the next round.
+        try:
+            pending = self.db.pending_ballots()
+            if pending:
+                result = self._post('/sync/push', {'booth_id': self.booth_id, 'ballots': [
+                    {k: b[k] for k in ('voting_id', 'votes', 'v_code', 'timestamp')} for b in pending]})
+                self.db.mark_synced(result.get('accepted', []) + result.get('duplicates', []))
+                self.db.mark_synced(result.get('conflicts', []), status='conflict')
+                if result.get('conflicts'):
+                    print(f"Booth {self.booth_id}: coordinator rejected {result['conflicts']} (already used online or at another booth)")
+            state = self._post('/sync/state', dict(self.db.sync_cursor(), booth_id=self.booth_id))
+            self.db.apply_state(state)
+            self.online = True
+            self.last_error = None
+            self.last_sync = datetime.datetime.now().isoformat()
+            if self.on_change and (pending or state.get('used') or state.get('roster') is not None
+                                   or state.get('setup') is not None):
+                self.on_change()
+            return True
+        except Exception as e:
+            if self.online or self.last_error is None:
+                print(f"Booth {self.booth_id}: coordinator unreachable, voting continues offline ({e})")
+            self.online = False
+            self.last_error = str(e)
+            return False
+
+    def status(self):
+        counts = self.db.store.query('SELECT sync_status, COUNT(*) AS n FROM ballots GROUP BY sync_status')
+        return {
+            'booth_id': self.booth_id,
+            'coordinator': self.coordinator_url,
+            'online': self.online,
+            'last_sync': self.last_sync,
+            'last_error': self.last_error,
+            'ballots': {r['sync_status']: r['n'] for r in counts},
+            'voters': self.db.store.query('SELECT COUNT(*) AS n FROM voters')[0]['n'],
+        }
+
+
+class SyncCoordinator:
+    # roster_source() returns VOTERS records, setup_source() returns
+    # {'POSTS': [...], 'CANDIDATES': [...]} records; both are normally the
+    # app's cached loaders. `roster` (a SharedRoster) hears about every
+    # ballot written, so online lookups see booth votes at once.
+    def __init__(self, db, path, roster_source, setup_source, on_change=None, flush_interval=5, roster=None):
+        self.db = db
+        self.roster = roster
+        self.store = LocalStore(path, COORDINATOR_SCHEMA)
+        self.roster_source = roster_source
+        self.setup_source = setup_source
+        self.on_change = on_change
+        self.flush_interval = flush_interval
+        self.versions = {}
+        self.thread = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name='sync-flush', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.flush_backend()
+            except Exception as e:
+                print(f"Coordinator: backend flush failed: {e}")
+            time.sleep(self.flush_interval)
+
+    def merge(self, booth_id, ballots):
+        now = datetime.datetime.now().isoformat()
+        accepted, duplicates, conflicts, statements = [], [], [], []
+        # IDs already marked used in VOTERS, e.g. by an online vote that never
+        # went through a booth; a booth ballot for one of them is a double vote
+        used_online = {str(v.get('VotingID')) for v in self.roster_source()
+                       if str(v.get('Used', '')).upper() == 'YES'}
+        with self.store.lock:
+            existing = {}
+            for b in ballots:
+                row = self.store.conn.execute('SELECT booth_id, v_code FROM ballots WHERE voting_id = ?',
+                                              (b['voting_id'],)).fetchone()
+                if row:
+                    existing[b['voting_id']] = (row['booth_id'], row['v_code'])
+        for b in ballots:
+            vid = str(b['voting_id'])
+            first = existing.get(vid)
+            if first is None and vid not in used_online:
+                existing[vid] = (booth_id, b['v_code'])
+                accepted.append(vid)
+                statements.append((
+                    'INSERT INTO ballots (voting_id, booth_id, votes, v_code, timestamp, received) VALUES (?, ?, ?, ?, ?, ?)',
+                    (vid, booth_id, b['votes'], b['v_code'], b['timestamp'], now)))
+                statements.append(('INSERT OR IGNORE INTO used_log (voting_id) VALUES (?)', (vid,)))
+            elif first == (booth_id, b['v_code']):
+                # Retransmit of a ballot we already hold
+                duplicates.append(vid)
+            else:
+                conflicts.append(vid)
+                statements.append((
+                    'INSERT INTO conflicts (voting_id, booth_id, votes, v_code, timestamp, received) VALUES (?, ?, ?, ?, ?, ?)',
+                    (vid, booth_id, b['votes'], b['v_code'], b['timestamp'], now)))
+                where = f"at booth {first[0]}" if first else "online"
+                print(f"Coordinator: VotingID {vid} used {where} and again at booth {booth_id}")
+        statements.append(('INSERT INTO booths (booth_id, last_seen, pushed) VALUES (?, ?, ?) '
+                           'ON CONFLICT(booth_id) DO UPDATE SET last_seen = excluded.last_seen, '
+                           'pushed = pushed + excluded.pushed', (booth_id, now, len(accepted))))
+        self.store.transaction(statements)
+        if accepted and self.on_change:
+            self.on_change()
+        return {'accepted': accepted, 'duplicates': duplicates, 'conflicts': conflicts}
+
+    def _version(self, name, records):
+        # Hashing is O(n); remember the result per loaded list object
+        cached = self.versions.get(name)
+        if cached and cached[0] is records:
+            return cached[1]
+        digest = hashlib.sha1(json.dumps(records, sort_keys=True).encode()).hexdigest()[:16]
+        self.versions[name] = (records, digest)
+        return digest
+
+    def state(self, booth_id, used_seq=0, roster_version='', setup_version=''):
+        roster = self.roster_source()
+        setup = self.setup_source()
+        state = {
+            'roster_version': self._version('roster', roster),
+            'setup_version': self._version('setup', setup),
+            'roster': None,
+            'setup': None,
+        }
+        if roster_version != state['roster_version']:
+            state['roster'] = roster
+        if setup_version != state['setup_version']:
+            state['setup'] = setup
+        rows = self.store.query('SELECT seq, voting_id FROM used_log WHERE seq > ? ORDER BY seq', (int(used_seq or 0),))
+        state['used'] = [r['voting_id'] for r in rows]
+        state['used_seq'] = rows[-1]['seq'] if rows else int(used_seq or 0)
+        now = datetime.datetime.now().isoformat()
+        self.store.execute('INSERT INTO booths (booth_id, last_seen) VALUES (?, ?) '
+                           'ON CONFLICT(booth_id) DO UPDATE SET last_seen = excluded.last_seen', (booth_id, now))
+        return state
+
+    def flush_backend(self, limit=50):
+        # Write merged ballots to Sheets; unwritten ones are retried next round
+        written = []
+        for b in self.store.query('SELECT * FROM ballots WHERE written = 0 ORDER BY rowid LIMIT ?', (limit,)):
+            votes = json.loads(b['votes'])
+            if not self.db.store_vote(b['voting_id'], votes, b['v_code'], timestamp=b['timestamp']):
+                break
+            self.store.execute('UPDATE ballots SET written = 1 WHERE voting_id = ?', (b['voting_id'],))
+            written.append(b['voting_id'])
+        if written:
+            # One status write for the whole round instead of one per ballot
+            self.db.set_voters_used(written, True)
+            if self.roster:
+                for vid in written:
+                    self.roster.mark_used(vid)
+        written = len(written)
+        if written and self.on_change:
+            self.on_change()
+        return written
+
+    def has_ballot(self, voting_id):
+        # True once a booth ballot for this ID was merged, written or not
+        return bool(self.store.query('SELECT 1 FROM ballots WHERE voting_id = ?', (str(voting_id),)))
+
+    def status(self):
+        return {
+            'booths': self.store.query('SELECT * FROM booths ORDER BY booth_id'),
+            'ballots': self.store.query('SELECT COUNT(*) AS n FROM ballots')[0]['n'],
+            'unwritten': self.store.query('SELECT COUNT(*) AS n FROM ballots WHERE written = 0')[0]['n'],
+            'conflicts': self.store.query('SELECT voting_id, booth_id, timestamp, received FROM conflicts ORDER BY id'),
+        }
+
+
+def sync_blueprint(coordinator, token=''):
+    bp = Blueprint('sync', __name__)
+
+    def authorized():
+        return not token or request.headers.get('X-Booth-Token') == token
+
+    @bp.route('/sync/push', methods=['POST'])
+    def sync_push():
+        if not authorized():
+            return jsonify({'error': 'unauthorized'}), 401
+        data = request.get_json(silent=True) or {}
+        if not data.get('booth_id'):
+            return jsonify({'error': 'booth_id required'}), 400
+        return jsonify(coordinator.merge(data['booth_id'], data.get('ballots', [])))
+
+    @bp.route('/sync/state', methods=['POST'])
+    def sync_state():
+        if not authorized():
+            return jsonify({'error': 'unauthorized'}), 401
+        data = request.get_json(silent=True) or {}
+        return jsonify(coordinator.state(data.get('booth_id', '?'), data.get('used_seq', 0),
+                                         data.get('roster_version', ''), data.get('setup_version', '')))
+
+    @bp.route('/admin/sync/status')
+    def sync_status():
+        if not session.get('admin_logged_in'):
+            return jsonify({'error': 'unauthorized'}), 401
+        return jsonify(coordinator.status())
+
+    return bp
+
+
+def _simulate(booth_count=3, base_port=5800):
+    # Local end-to-end check: one coordinator and N booth nodes as separate
+    # processes on this machine, a double vote across booths and a link drop
+    import tempfile
+    import subprocess
+
+    workdir = tempfile.mkdtemp(prefix='booths_')
+    roster = [{'VotingID': f'{i:04d}', 'Class': '8', 'Section': 'A', 'RollNo': str(i), 'Used': 'NO'}
+              for i in range(1, 21)]
+    with open(os.path.join(workdir, 'roster.json'), 'w') as f:
+        json.dump(roster, f)
+
+    procs = [subprocess.Popen([sys.executable, __file__, 'coordinator', workdir, str(base_port)])]
+    for n in range(1, booth_count + 1):
+        procs.append(subprocess.Popen([sys.executable, __file__, 'booth', workdir, str(base_port), str(n)]))
+    try:
+        time.sleep(12)
+        status = requests.get(f'http://127.0.0.1:{base_port}/debug/status', timeout=5).json()
+        print(json.dumps(status, indent=2))
+    finally:
+        for p in procs:
+            p.terminate()
+
+
+def _run_process(role, workdir, base_port, booth_number=None):
+    from flask import Flask
+
+    class RecordingDB:
+        # Backend stand-in for the simulation: collects flushed ballots
+        def __init__(self):
+            self.stored = []
+
+        def store_vote(self, voting_id, votes, v_code='000', timestamp=None):
+            self.stored.append(voting_id)
+            return True
+
+        def mark_voting_id_used(self, voting_id):
+            return True
+
+        def set_voters_used(self, voting_ids, used=True):
+            return {vid: 'updated' for vid in voting_ids}
+
+    app = Flask(__name__)
+    if role == 'coordinator':
+        with open(os.path.join(workdir, 'roster.json')) as f:
+            roster = json.load(f)
+        setup = {'POSTS': [{'PostName': 'Head', 'Active': 'YES'}],
+                 'CANDIDATES': [{'Post': 'Head', 'CandidateID': '1', 'Name': 'A', 'ImageURL': '', 'Motto': '', 'Active': '10'},
+                                {'Post': 'Head', 'CandidateID': '2', 'Name': 'B', 'ImageURL': '', 'Motto': '', 'Active': '9'}]}
+        backend = RecordingDB()
+        coordinator = SyncCoordinator(backend, os.path.join(workdir, 'coordinator.db'),
+                                      lambda: roster, lambda: setup, flush_interval=1)
+        coordinator.start()
+        app.register_blueprint(sync_blueprint(coordinator))
+        app.add_url_rule('/debug/status', 'debug_status',
+                         lambda: jsonify(dict(coordinator.status(), written=backend.stored)))
+        app.run(port=base_port)
+        return
+
+    booth_id = f'booth-{booth_number}'
+    booth_db = BoothDB(os.path.join(workdir, f'{booth_id}.db'))
+    coordinator_url = f'http://127.0.0.1:{base_port}'
+    node = BoothNode(booth_db, coordinator_url, booth_id, interval=1)
+    time.sleep(1)
+    node.sync_once()
+    if booth_number == 2:
+        # Booth 2 loses its link after the roster pull and votes offline
+        node.coordinator_url = 'http://127.0.0.1:1'
+    for i in range(booth_number, 21, 4):
+        vid = f'{i:04d}'
+        if booth_db.validate_voting_id(vid):
+            booth_db.store_vote(vid, {'Head': 'A | B'}, v_code=f'{booth_number}{i:02d}')
+            booth_db.mark_voting_id_used(vid)
+    # Same ID used at every booth: only the first to reach the coordinator counts
+    booth_db.store_vote('0020', {'Head': 'A | B'}, v_code=f'{booth_number}99')
+    node.sync_once()
+    if booth_number == 2:
+        time.sleep(3)
+        node.coordinator_url = coordinator_url
+    node.start()
+    time.sleep(30)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('coordinator', 'booth'):
+        _run_process(sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4]) if len(sys.argv) > 4 else None)
+    else:
+        _simulate(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
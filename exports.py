@@ -0,0 +1,178 @@
+import io
+import csv
+import json
+
+# Streaming exports for the post-election audit. Rows are read from the
+# backend a page at a time and written out as they arrive, so memory stays
+# flat however large the election. Every row carries its sheet row number
+# as `_row`; passing the last one + 1 as `cursor` resumes an interrupted
+# export where it stopped.
+
+DATASETS = {'votes': 'VOTES', 'voters': 'VOTERS', 'verifications': 'VERIFICATIONS', 'results': 'VOTES'}
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    # One JSON line per row group: {"columns": {header: [values...]}}
+    'columns': 'application/x-ndjson',
+}
+CHUNK_SIZE = 64 * 1024
+
+
+class ExportFilters:
+    def __init__(self, args):
+        self.classes = {c.strip().upper() for c in args.get('class', '').split(',') if c.strip()}
+        self.sections = {s.strip().upper() for s in args.get('section', '').split(',') if s.strip()}
+        self.since = args.get('since') or None
+        self.until = args.get('until') or None
+        self.cursor = int(args.get('cursor') or 2)
+        self.limit = int(args['limit']) if args.get('limit') else None
+        if self.cursor < 2 or (self.limit is not None and self.limit < 1):
+            raise ValueError('cursor must be >= 2 and limit >= 1')
+
+    @property
+    def by_voter(self):
+        return bool(self.classes or self.sections)
+
+    def describe(self):
+        return {'class': sorted(self.classes), 'section': sorted(self.sections),
+                'since': self.since, 'until': self.until, 'cursor': self.cursor, 'limit': self.limit}
+
+    def matches_voter(self, voter):
+        if not voter:
+            return False
+        if self.classes and str(voter.get('Class', '')).upper() not in self.classes:
+            return False
+        if self.sections and str(voter.get('Section', '')).upper() not in self.sections:
+            return False
+        return True
+
+    def matches_time(self, timestamp):
+        # ISO timestamps compare correctly as strings
+        if self.since and (not timestamp or timestamp < self.since):
+            return False
+        if self.until and (not timestamp or timestamp > self.until):
+            return False
+        return True
+
+
+def voter_lookup(voters):
+    # VotingID -> roster record, for filtering ballots by class/section
+    return {str(v.get('VotingID')): v for v in voters}
+
+
+def iter_records(db, dataset, filters, voters=None):
+    # (headers, generator of records) for one sheet, filtered lazily
+    pages = db.iter_rows(DATASETS[dataset], start_row=filters.cursor)
+    _, headers = next(pages, (1, []))
+    headers = list(headers)
+
+    def records():
+        emitted = 0
+        for row_number, values in pages:
+            values = list(values) + [''] * (len(headers) - len(values))
+            record = dict(zip(headers, values))
+            if filters.by_voter:
+                voter = record if dataset == 'voters' else voters.get(str(record.get('VotingID')))
+                if not filters.matches_voter(voter):
+                    continue
+            if 'Timestamp' in record and not filters.matches_time(record['Timestamp']):
+                continue
+            record['_row'] = row_number
+            yield record
+            emitted += 1
+            if filters.limit and emitted >= filters.limit:
+                return
+
+    return ['_row'] + headers, records()
+
+
+def iter_results(db, filters, voters, candidates_map):
+    # Computed totals over the (filtered) ballots, one row per candidate.
+    # Demo ballots from DUMMY IDs are left out, as on the results page.
+    dummy_ids = {vid for vid, v in voters.items() if str(v.get('Section', '')).upper() == 'DUMMY'}
+    _, ballots = iter_records(db, 'votes', filters, voters)
+    headers = ['Post', 'Candidate', 'Role', 'Votes', 'BallotsCounted']
+
+    def records():
+        totals = {}
+        counted = 0
+        for ballot in ballots:
+            if str(ballot.get('VotingID')) in dummy_ids:
+                continue
+            counted += 1
+            for candidates in candidates_map.values():
+                for c in candidates:
+                    try:
+                        totals[c['name']] = totals.get(c['name'], 0) + int(ballot.get(c['name']) or 0)
+                    except (ValueError, TypeError):
+                        pass
+        for post, candidates in candidates_map.items():
+            for c in candidates:
+                yield {'Post': post, 'Candidate': c['name'], 'Role': c.get('role', ''),
+                       'Votes': totals.get(c['name'], 0), 'BallotsCounted': counted}
+
+    return headers, records()
+
+
+def _chunked(pieces):
+    # Join small writes into ~64KB chunks for the WSGI server
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def write_csv(headers, records):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=headers, extrasaction='ignore')
+
+    def pieces():
+        writer.writeheader()
+        yield out.getvalue()
+        for record in records:
+            out.seek(0)
+            out.truncate()
+            writer.writerow(record)
+            yield out.getvalue()
+
+    return _chunked(pieces())
+
+
+def write_jsonl(headers, records):
+    return _chunked(json.dumps(record, default=str) + '\n' for record in records)
+
+
+def write_columns(headers, records, meta, group_size=1000):
+    def pieces():
+        yield json.dumps(dict(meta, schema=headers)) + '\n'
+        group = []
+        index = 0
+        for record in records:
+            group.append(record)
+            if len(group) >= group_size:
+                yield _row_group(headers, group, index)
+                group = []
+                index += 1
+        if group:
+            yield _row_group(headers, group, index)
+
+    return _chunked(pieces())
+
+
+def _row_group(headers, group, index):
+    columns = {h: [r.get(h, '') for r in group] for h in headers}
+    return json.dumps({'row_group': index, 'rows': len(group), 'columns': columns}, default=str) + '\n'
+
+
+def stream_export(fmt, headers, records, meta):
+    if fmt == 'csv':
+        return write_csv(headers, records)
+    if fmt == 'jsonl':
+        return write_jsonl(headers, records)
+    return write_columns(headers, records, meta)
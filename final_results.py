@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import threading
+
+from http_cache import CachedResponse
+
+# The election's final results, frozen when an admin closes it. Closing
+# reads every sheet once more, tallies it and writes one JSON file per
+# election: the counts and winners per post plus the exact records they
+# were counted from, so the results page, analytics and print pages can be
+# served from it without touching Sheets again. The file is created once
+# and never overwritten; a `.sha256` file beside it (sha256sum format) holds
+# its checksum, which is verified whenever it is loaded.
+
+FORMAT_VERSION = 1
+ROLES = ('MAIN MINISTER', 'DY MINISTER')
+
+
+def is_dummy(voter):
+    return str(voter.get('Section', '')).upper() == 'DUMMY'
+
+
+def tally_results(posts, candidates_map, ballots, voters):
+    # Votes per candidate over real ballots (DUMMY IDs left out), and the
+    # winner per role in each post; a tie lists every name sharing the top
+    dummy_ids = {str(v.get('VotingID')) for v in voters if is_dummy(v)}
+    counted = [b for b in ballots if str(b.get('VotingID')) not in dummy_ids]
+    results = {}
+    winners = {}
+    for post in posts:
+        counts = {}
+        for candidate in candidates_map.get(post, []):
+            name = candidate['name']
+            total = 0
+            for ballot in counted:
+                try:
+                    total += int(ballot.get(name, 0))
+                except (ValueError, TypeError):
+                    pass
+            counts[name] = total
+        results[post] = counts
+        by_role = {}
+        for candidate in candidates_map.get(post, []):
+            by_role.setdefault(candidate.get('role') or 'WINNER', []).append(candidate['name'])
+        # A list, so MAIN stays before DY once the keys are sorted on disk
+        winners[post] = []
+        for role in sorted(by_role, key=lambda r: ROLES.index(r) if r in ROLES else len(ROLES)):
+            top = max(counts[name] for name in by_role[role])
+            names = [name for name in by_role[role] if counts[name] == top] if top > 0 else []
+            winners[post].append({'role': role, 'names': names, 'votes': top, 'tie': len(names) > 1})
+    eligible = [v for v in voters if not is_dummy(v)]
+    return {
+        'results': results,
+        'winners': winners,
+        'total_voters': len(eligible),
+        'votes_cast': len(counted),
+        'votes_remaining': len(eligible) - len(counted),
+    }
+
+
+def canonical(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), default=str).encode()
+
+
+class FinalResults:
+    def __init__(self, path, data, checksum, verified=True):
+        self.path = path
+        self.data = data
+        self.checksum = checksum
+        self.verified = verified
+        self.responses = {}  # name -> CachedResponse, rendered once
+        self.lock = threading.Lock()
+
+    @property
+    def records(self):
+        return self.data['records']
+
+    @classmethod
+    def create(cls, path, data):
+        # Writes the artefact; fails with FileExistsError if one already exists
+        data = dict(data, format=FORMAT_VERSION)
+        body = canonical(data)
+        checksum = hashlib.sha256(body).hexdigest()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            # A hard link never replaces an existing file, unlike os.replace
+            os.link(tmp_path, path)
+        finally:
+            os.remove(tmp_path)
+        os.chmod(path, 0o444)
+        with open(f"{path}.sha256", 'w') as f:
+            f.write(f"{checksum}  {os.path.basename(path)}\n")
+        return cls(path, json.loads(body), checksum)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            body = f.read()
+        checksum = hashlib.sha256(body).hexdigest()
+        recorded = None
+        if os.path.exists(f"{path}.sha256"):
+            with open(f"{path}.sha256") as f:
+                recorded = (f.read().split() or [None])[0]
+        verified = recorded == checksum
+        if not verified:
+            print(f"Final results: checksum of {path} does not match {path}.sha256")
+        return cls(path, json.loads(body), checksum, verified)
+
+    def respond(self, name, render, mimetype='text/html', cache_control='no-cache'):
+        # The page for `name`, rendered on first use; the content never
+        # changes, so the checksum makes a stable ETag
+        with self.lock:
+            entry = self.responses.get(name)
+            if not entry:
+                entry = CachedResponse('final', f"final-{name}-{self.checksum[:16]}", render(), mimetype, 0)
+                self.responses[name] = entry
+        return entry.respond(cache_control)
+
+    def summary(self):
+        return {
+            'closed_at': self.data.get('closed_at'),
+            'election': self.data.get('election'),
+            'sha256': self.checksum,
+            'verified': self.verified,
+            'file': os.path.basename(self.path),
+            'votes_cast': self.data['votes_cast'],
+            'total_voters': self.data['total_voters'],
+            'winners': self.data['winners'],
+        }
@@ -4,12 +4,44 @@ import json
 import random
 import string
 import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from google.oauth2.service_account import Credentials
+from resilience import GuardedHTTPClient, BackendUnavailable, is_unavailable
+from voter_ids import random_id
+
+CANDIDATE_HEADERS = ['Post', 'CandidateID', 'Name', 'ImageURL', 'Motto', 'Active']
+
+class SheetReadError(Exception):
+    # A sheet could not be read (as opposed to being empty)
+    pass
+
+def selected_candidate_names(votes_dict):
+    # Ballot selections are stored per post as "Main | Deputy"
+    selected_candidates = set()
+    for post, selection in votes_dict.items():
+        if ' | ' in selection:
+            parts = selection.split(' | ')
+            for p in parts:
+                selected_candidates.add(p.strip())
+        else:
+            selected_candidates.add(selection.strip())
+    return selected_candidates
+
+# VOTERS row index lifetime, and rows per status batch_update call
+VOTER_INDEX_TTL = 300
+STATUS_BATCH_SIZE = 500
+
+# Authorized clients by service account, shared by every election that
+# uses the same credentials
+_clients = {}
+_clients_lock = threading.Lock()
 
 class GoogleSheetsDB:
-    def __init__(self):
-        self.sheet_id = os.environ.get('GOOGLE_SHEET_ID')
-        self.credentials_json = os.environ.get('GOOGLE_SHEETS_CREDENTIALS_JSON')
+    def __init__(self, sheet_id=None, credentials_json=None):
+        self.sheet_id = sheet_id or os.environ.get('GOOGLE_SHEET_ID')
+        self.credentials_json = credentials_json or os.environ.get('GOOGLE_SHEETS_CREDENTIALS_JSON')
         self.client = self._connect()
         if self.client:
             self._ensure_votes_sheet()
@@ -18,6 +50,15 @@ class GoogleSheetsDB:
         if not self.credentials_json or not self.sheet_id:
             print("Google Sheets: Configuration missing (Credentials or Sheet ID)")
             return None
+        with _clients_lock:
+            client = _clients.get(self.credentials_json)
+            if not client:
+                client = self._authorize()
+                if client:
+                    _clients[self.credentials_json] = client
+        return client
+
+    def _authorize(self):
         try:
             try:
                 creds_dict = json.loads(self.credentials_json)
@@ -27,7 +68,8 @@ class GoogleSheetsDB:
             
             scopes = ['https://www.googleapis.com/auth/spreadsheets']
             creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-            client = gspread.authorize(creds)
+            # Deadlines and a circuit breaker on every call (resilience.py)
+            client = gspread.authorize(creds, http_client=GuardedHTTPClient)
             print("Google Sheets: Initialized successfully ✅")
             return client
         except Exception as e:
@@ -69,7 +111,10 @@ class GoogleSheetsDB:
                 if name and name not in names:
                     names.append(name)
             return names
-        except:
+        except gspread.exceptions.WorksheetNotFound:
+            return []
+        except Exception as e:
+            print(f"Error reading candidate names: {e}")
             return []
 
     def _get_sheet(self, name, retry_count=3):
@@ -93,7 +138,7 @@ class GoogleSheetsDB:
         sheets_to_ensure = {
             'VOTERS': ['VotingID', 'Class', 'Section', 'RollNo', 'Used'],
             'VOTES': ['VotingID', 'Timestamp', 'VerificationCode'],
-            'CANDIDATES': ['Post', 'CandidateID', 'Name', 'ImageURL', 'Motto', 'Active'],
+            'CANDIDATES': CANDIDATE_HEADERS,
             'POSTS': ['PostName', 'Active'],
             'VERIFICATIONS': ['VotingID', 'VerificationCode', 'Timestamp']
         }
@@ -112,6 +157,8 @@ class GoogleSheetsDB:
                 sheet = spreadsheet.worksheet(name)
                 self._sheets_cache[name] = sheet
                 return sheet
+            except BackendUnavailable:
+                raise
             except Exception as e:
                 if "quota" in str(e).lower() or "limit" in str(e).lower():
                     import time
@@ -122,34 +169,141 @@ class GoogleSheetsDB:
                 return None
         return None
 
-    def get_all_records_safe(self, name):
+    def _get_spreadsheet(self):
+        if not self.client or not self.sheet_id: return None
+        # Cache the spreadsheet handle, open_by_key costs a metadata call
+        if getattr(self, '_spreadsheet', None) is None:
+            self._get_sheet('VOTERS')  # Makes sure all sheets exist
+            self._spreadsheet = self.client.open_by_key(self.sheet_id)
+        return self._spreadsheet
+
+    @staticmethod
+    def _records_from_values(values):
+        if not values or len(values) < 1: return []
+        
+        # Map headers to column indices, ignoring empty headers
+        header_row = values[0]
+        header_map = {}
+        for i, h in enumerate(header_row):
+            clean_h = h.strip()
+            if clean_h:
+                header_map[clean_h] = i
+        
+        records = []
+        for row in values[1:]:
+            record = {}
+            for h, idx in header_map.items():
+                record[h] = row[idx] if idx < len(row) else ''
+            # Only add if record has at least some data
+            if any(str(v).strip() for v in record.values()):
+                records.append(record)
+        return records
+
+    def read_records(self, name):
+        # Strict read: any failure raises, an empty list means an empty sheet
+        if not self.client or not self.sheet_id: return []
         sheet = self._get_sheet(name)
-        if not sheet: return []
+        if not sheet:
+            raise SheetReadError(f"{name} could not be opened")
+        return self._records_from_values(sheet.get_all_values())
+
+    def get_all_records_safe(self, name, swallow=False):
+        # Sheets being down or throttling raises BackendUnavailable so callers
+        # can serve stale data or a 503; other API errors (bad range, no
+        # access) are raised as they are. Only with `swallow` do they become []
         try:
-            values = sheet.get_all_values()
-            if not values or len(values) < 1: return []
-            
-            # Map headers to column indices, ignoring empty headers
-            header_row = values[0]
-            header_map = {}
-            for i, h in enumerate(header_row):
-                clean_h = h.strip()
-                if clean_h:
-                    header_map[clean_h] = i
-            
-            records = []
-            for row in values[1:]:
-                record = {}
-                for h, idx in header_map.items():
-                    record[h] = row[idx] if idx < len(row) else ''
-                # Only add if record has at least some data
-                if any(str(v).strip() for v in record.values()):
-                    records.append(record)
-            return records
+            sheet = self._get_sheet(name)
+            if not sheet: return []
+            return self._records_from_values(sheet.get_all_values())
+        except (BackendUnavailable, gspread.exceptions.APIError) as e:
+            if not swallow:
+                if not is_unavailable(e) or isinstance(e, BackendUnavailable):
+                    raise
+                raise BackendUnavailable(f"Reading {name} failed: {e}") from e
+            print(f"Error reading {name}: {e}")
+            return []
         except Exception as e:
             print(f"Error reading {name}: {e}")
             return []
 
+    def get_rows(self, name, start_row=1):
+        # Raw rows from start_row (1-based) to the end of the sheet, for
+        # readers that only need what was appended since their last read
+        sheet = self._get_sheet(name)
+        if not sheet: return []
+        try:
+            return sheet.get(f"A{start_row}:Z")
+        except Exception as e:
+            print(f"Error reading {name} from row {start_row}: {e}")
+            return None
+
+    def iter_rows(self, name, start_row=2, page_size=500):
+        # Yields (row_number, values) one page of rows at a time so a large
+        # sheet is never held in memory whole. The header row comes first.
+        sheet = self._get_sheet(name)
+        if not sheet: return
+        headers = self._read_page(sheet, 'A1:1')
+        headers = headers[0] if headers else []
+        yield 1, headers
+        if not headers: return
+        last_col = gspread.utils.rowcol_to_a1(1, len(headers)).rstrip('0123456789')
+        row_number = max(start_row, 2)
+        while True:
+            page = self._read_page(sheet, f"A{row_number}:{last_col}{row_number + page_size - 1}")
+            for offset, values in enumerate(page):
+                yield row_number + offset, values
+            if len(page) < page_size:
+                return
+            row_number += page_size
+
+    def _read_page(self, sheet, a1_range, retry_count=3):
+        for attempt in range(retry_count):
+            try:
+                return sheet.get(a1_range)
+            except Exception as e:
+                if attempt + 1 < retry_count and ("quota" in str(e).lower() or "limit" in str(e).lower()):
+                    time.sleep(2 ** attempt)
+                    continue
+                raise
+
+    def get_records_batch(self, names):
+        # Read several sheets in one values:batchGet round trip. A sheet that
+        # can't be read raises rather than reading as [], so callers never
+        # cache or count a failed read as an empty sheet; BackendUnavailable
+        # only when Sheets is down or throttling.
+        names = list(dict.fromkeys(names))
+        if not names: return {}
+        try:
+            spreadsheet = self._get_spreadsheet()
+            if not spreadsheet:
+                return {name: [] for name in names}
+            response = spreadsheet.values_batch_get([f"'{name}'" for name in names])
+            value_ranges = response.get('valueRanges', [])
+            if len(value_ranges) != len(names):
+                raise SheetReadError(f"batch read returned {len(value_ranges)} of {len(names)} sheets")
+            return {name: self._records_from_values(vr.get('values', []))
+                    for name, vr in zip(names, value_ranges)}
+        except BackendUnavailable:
+            # Sheets is down or slow; the parallel reads would fare no better
+            raise
+        except Exception as e:
+            print(f"Batch read failed, falling back to parallel reads: {e}")
+            self._spreadsheet = None
+
+        # Fallback: issue the single-sheet reads concurrently; one failure
+        # fails the whole read
+        try:
+            with ThreadPoolExecutor(max_workers=len(names)) as pool:
+                results = list(pool.map(self.read_records, names))
+        except BackendUnavailable:
+            raise
+        except Exception as e:
+            if not is_unavailable(e):
+                # A permanent error: stale data or a retry would not help
+                raise
+            raise BackendUnavailable(f"Reading {', '.join(names)} failed: {e}") from e
+        return dict(zip(names, results))
+
     def get_voter_by_details(self, class_val, section, roll_no):
         records = self.get_all_voters()
         for r in records:
@@ -163,20 +317,31 @@ class GoogleSheetsDB:
         return None
 
     def add_post(self, post_name):
+        return self.add_posts([post_name])
+
+    def add_posts(self, post_names):
         sheet = self._get_sheet('POSTS')
-        if not sheet: return
+        if not sheet: return False
         
-        # Avoid duplicates
+        # One read to find existing posts, one append for the missing ones
+        existing = {str(r.get('PostName', '')).strip() for r in self.get_all_records_safe('POSTS')}
+        missing = []
+        for name in post_names:
+            name = name.strip()
+            if name and name not in existing and name not in missing:
+                missing.append(name)
+        if not missing:
+            return True
         try:
-            if sheet.find(post_name):
-                return
-        except:
-            pass
-            
-        sheet.append_row([post_name, 'YES'])
+            sheet.append_rows([[name, 'YES'] for name in missing])
+            return True
+        except Exception as e:
+            print(f"Error adding posts: {e}")
+            return False
 
-    def get_all_posts(self):
-        records = self.get_all_records_safe('POSTS')
+    def get_all_posts(self, records=None):
+        if records is None:
+            records = self.get_all_records_safe('POSTS')
         # Filter for active posts and ensure they exist in CANDIDATES
         active_posts = [r['PostName'] for r in records if str(r.get('Active', '')).upper() in ['YES', '']]
         
@@ -197,6 +362,18 @@ class GoogleSheetsDB:
                 }
         return None
 
+    def find_voter(self, voting_id):
+        # Live lookup of one ID: a find() in column A and one row read,
+        # instead of reading all of VOTERS like get_voter_details()
+        sheet = self._get_sheet('VOTERS')
+        if not sheet: return None
+        cell = sheet.find(str(voting_id).strip(), in_column=1)
+        if not cell or cell.row < 2:
+            return None
+        values = sheet.row_values(cell.row) + [''] * 5
+        return {'class': values[1], 'section': values[2], 'roll_no': values[3],
+                'used': str(values[4]).upper() == 'YES'}
+
     def validate_voting_id(self, voting_id):
         sheet = self._get_sheet('VOTERS')
         if not sheet: return False
@@ -205,21 +382,86 @@ class GoogleSheetsDB:
             if cell:
                 row = sheet.row_values(cell.row)
                 return row[4].upper() == 'NO'
-        except:
-            pass
+        except Exception as e:
+            print(f"Error validating ID: {e}")
         return False
 
     def mark_voting_id_used(self, voting_id):
+        return self.set_voters_used([voting_id], True).get(str(voting_id)) in ('updated', 'unchanged')
+
+    def _voter_index(self, refresh=False):
+        # VotingID -> [sheet row, Used flag] for VOTERS, read in one call and
+        # reused for VOTER_INDEX_TTL seconds so status writes need no find().
+        # Rows may have moved since; _verified_rows checks them before a write.
+        index = getattr(self, '_voter_rows', None)
+        if index and not refresh and time.time() - index['read_at'] < VOTER_INDEX_TTL:
+            return index['rows']
         sheet = self._get_sheet('VOTERS')
-        if not sheet: return False
-        try:
-            cell = sheet.find(voting_id)
+        if not sheet: return None
+        rows = {}
+        for offset, values in enumerate(sheet.get('A2:E')):
+            if values and str(values[0]).strip():
+                used = len(values) > 4 and str(values[4]).upper() == 'YES'
+                rows[str(values[0]).strip()] = [offset + 2, used]
+        self._voter_rows = {'rows': rows, 'read_at': time.time()}
+        return rows
+
+    def _verified_rows(self, sheet, ids):
+        # {VotingID: (row, Used flag now)} for the rows the index points at,
+        # confirmed by reading columns A:E of all of them in one batch_get.
+        # IDs found elsewhere (rows inserted or sorted by hand) re-read the
+        # index once; a single ID still missing falls back to find().
+        verified = {}
+        pending = ids
+        for attempt in range(2):
+            index = self._voter_index(refresh=attempt > 0)
+            targets = [vid for vid in pending if vid in index]
+            if targets:
+                ranges = sheet.batch_get([f"A{index[vid][0]}:E{index[vid][0]}" for vid in targets])
+                for vid, values in zip(targets, ranges):
+                    row = values[0] if values else []
+                    if row and str(row[0]).strip() == vid:
+                        verified[vid] = (index[vid][0], len(row) > 4 and str(row[4]).upper() == 'YES')
+            pending = [vid for vid in pending if vid not in verified]
+            if not pending:
+                break
+        if len(ids) == 1 and pending:
+            cell = sheet.find(ids[0], in_column=1)
             if cell:
-                sheet.update_cell(cell.row, 5, 'YES')
-                return True
-        except Exception as e:
-            print(f"Error marking ID used: {e}")
-        return False
+                verified[ids[0]] = (cell.row, None)  # Used flag not read
+        return verified
+
+    def set_voters_used(self, voting_ids, used=True):
+        # Sets the Used flag of many voters with one batch_get (to check the
+        # rows) and one batch_update per STATUS_BATCH_SIZE IDs. Returns
+        # {VotingID: 'updated' | 'unchanged' | 'not_found' | 'failed'};
+        # 'unchanged' rows are rewritten anyway.
+        ids = list(dict.fromkeys(str(v).strip() for v in voting_ids if str(v).strip()))
+        report = {}
+        if not ids: return report
+        sheet = self._get_sheet('VOTERS')
+        if not sheet:
+            return {vid: 'failed' for vid in ids}
+        flag = 'YES' if used else 'NO'
+        for start in range(0, len(ids), STATUS_BATCH_SIZE):
+            chunk = ids[start:start + STATUS_BATCH_SIZE]
+            try:
+                rows = self._verified_rows(sheet, chunk)
+                report.update({vid: 'not_found' for vid in chunk if vid not in rows})
+                if rows:
+                    sheet.batch_update([{'range': f"E{row}", 'values': [[flag]]} for row, _ in rows.values()])
+            except BackendUnavailable:
+                report.update({vid: 'failed' for vid in ids[start:] if vid not in report})
+                break
+            except Exception as e:
+                print(f"Error updating voter status: {e}")
+                report.update({vid: 'failed' for vid in chunk if vid not in report})
+                continue
+            index = self._voter_rows['rows']
+            for vid, (row, current) in rows.items():
+                report[vid] = 'unchanged' if current == used else 'updated'
+                index[vid] = [row, used]
+        return report
 
     def get_all_candidate_names(self):
         candidates_map = self.get_candidates_by_post()
@@ -231,7 +473,7 @@ class GoogleSheetsDB:
                     all_names.append(name)
         return all_names
 
-    def store_vote(self, voting_id, votes_dict, v_code='000'):
+    def store_vote(self, voting_id, votes_dict, v_code='000', timestamp=None):
         spreadsheet = self.client.open_by_key(self.sheet_id)
         all_candidates = self.get_all_candidate_names()
         
@@ -254,17 +496,10 @@ class GoogleSheetsDB:
 
             v_sheet = self._get_sheet('VERIFICATIONS')
             
-            selected_candidates = set()
-            for post, selection in votes_dict.items():
-                if ' | ' in selection:
-                    parts = selection.split(' | ')
-                    for p in parts:
-                        selected_candidates.add(p.strip())
-                else:
-                    selected_candidates.add(selection.strip())
+            selected_candidates = selected_candidate_names(votes_dict)
             
             row = []
-            timestamp = datetime.datetime.now().isoformat()
+            timestamp = timestamp or datetime.datetime.now().isoformat()
             for col_header in sheet_headers:
                 if col_header == 'VotingID':
                     row.append(voting_id)
@@ -288,21 +523,42 @@ class GoogleSheetsDB:
     def generate_voting_id(self):
         sheet = self._get_sheet('VOTERS')
         while True:
-            new_id = ''.join(random.choices(string.digits, k=4))
+            new_id = random_id()
             try:
                 if not sheet or not sheet.find(new_id):
                     return new_id
-            except:
+            except BackendUnavailable:
+                raise
+            except Exception:
                 return new_id
 
     def get_all_voters(self):
         return self.get_all_records_safe('VOTERS')
 
+    def backend_status(self):
+        # Breaker state and call deadlines of the shared client
+        http_client = getattr(self.client, 'http_client', None)
+        return http_client.status() if isinstance(http_client, GuardedHTTPClient) else None
+
+    def freeze(self, frozen=True):
+        # Refuse every write to this spreadsheet from now on (election closed).
+        # The client may be shared with other elections, so only this sheet ID
+        # is frozen.
+        http_client = getattr(self.client, 'http_client', None)
+        if not isinstance(http_client, GuardedHTTPClient) or not self.sheet_id:
+            return False
+        if frozen:
+            http_client.frozen.add(self.sheet_id)
+        else:
+            http_client.frozen.discard(self.sheet_id)
+        return True
+
     def get_all_votes(self):
         return self.get_all_records_safe('VOTES')
 
-    def get_candidates_by_post(self):
-        records = self.get_all_records_safe('CANDIDATES')
+    def get_candidates_by_post(self, records=None):
+        if records is None:
+            records = self.get_all_records_safe('CANDIDATES')
         candidates = {}
         for r in records:
             post = r.get('Post')
@@ -356,50 +612,170 @@ class GoogleSheetsDB:
                 print(f"Batch Insert Error: {e}")
         return False
 
-    def add_candidates_batch(self, candidates_list):
+    def _candidate_snapshot(self):
+        # The CANDIDATES sheet as it is now. Sync diffs against a fresh read
+        # every time: a cached copy would hide changes other workers or hand
+        # edits made, and its row positions could point at the wrong rows.
         sheet = self._get_sheet('CANDIDATES')
-        if not sheet: return False
-        
-        # CLEAR EXISTING DATA FIRST (except header)
-        try:
-            records = sheet.get_all_values()
-            if len(records) > 1:
-                sheet.delete_rows(2, len(records))
-        except Exception as e:
-            print(f"Error clearing sheet: {e}")
+        if not sheet: return None
+        values = sheet.get_all_values()
+        headers = values[0] if values else CANDIDATE_HEADERS
+        return {
+            'headers': headers,
+            'rows': [list(row) + [''] * (len(headers) - len(row)) for row in values[1:]],
+        }
 
-        rows = []
-        for post, name, active in candidates_list:
+    def _ensure_vote_columns(self, names):
+        # store_vote only fills VOTES columns that exist, so a candidate
+        # without one would lose every vote cast for them
+        sheet = self._get_sheet('VOTES')
+        if not sheet: return
+        headers = sheet.row_values(1)
+        if not headers:
+            return  # store_vote writes the full header row on the first ballot
+        missing = [name for name in dict.fromkeys(names) if name and name not in headers]
+        if not missing: return
+        needed = len(headers) + len(missing)
+        if sheet.col_count < needed:
+            sheet.add_cols(needed - sheet.col_count)
+        start = gspread.utils.rowcol_to_a1(1, len(headers) + 1)
+        end = gspread.utils.rowcol_to_a1(1, needed)
+        sheet.batch_update([{'range': f"{start}:{end}", 'values': [missing]}])
+        print(f"VOTES sheet: Added columns for {', '.join(missing)} ✅")
+
+    def _new_candidate_id(self, taken):
+        while True:
             candidate_id = ''.join(random.choices(string.digits, k=4))
-            # Format: ['Post', 'CandidateID', 'Name', 'ImageURL', 'Motto', 'Active']
-            rows.append([post, candidate_id, name, '', '', active])
-            
-        if rows:
-            try:
-                sheet.append_rows(rows)
-                return True
-            except Exception as e:
-                print(f"Batch Candidate Insert Error: {e}")
-        return False
+            if candidate_id not in taken:
+                taken.add(candidate_id)
+                return candidate_id
 
-    def reset_voter_usage(self, voting_id):
-        sheet = self._get_sheet('VOTERS')
-        if not sheet: return False
+    def sync_candidates(self, desired, replace=True):
+        # Reconcile CANDIDATES with `desired` (dicts with Post, Name, Active
+        # and optional ImageURL/Motto) in a single batch_update. Rows match on
+        # (Post, Name) and keep their CandidateID; only inserts, changed cells
+        # and, with `replace`, deletions of rows not in `desired` are sent.
+        sheet = self._get_sheet('CANDIDATES')
+        spreadsheet = self._get_spreadsheet()
+        if not sheet or not spreadsheet: return None
         try:
-            cell = sheet.find(voting_id)
-            if cell:
-                sheet.update_cell(cell.row, 5, 'NO')
-                return True
+            snapshot = self._candidate_snapshot()
+            summary, requests = self._plan_candidate_sync(sheet, snapshot, desired, replace)
         except Exception as e:
-            print(f"Error resetting voter: {e}")
-        return False
+            print(f"Error reading candidates: {e}")
+            return None
+        try:
+            if requests:
+                spreadsheet.batch_update({'requests': requests})
+            # Also for a no-op sync: the candidates may have been added by
+            # hand or by a sync whose VOTES write failed
+            self._ensure_vote_columns([str(item['Name']).strip() for item in desired])
+        except Exception as e:
+            print(f"Candidate sync error: {e}")
+            return None
+        return summary
+
+    def _plan_candidate_sync(self, sheet, snapshot, desired, replace):
+        # (summary, batch_update requests) turning `snapshot` into `desired`
+        headers = snapshot['headers']
+        rows = snapshot['rows']
+        col = {h.strip(): i for i, h in enumerate(headers) if h.strip()}
+        
+        def cell(row, field):
+            return row[col[field]] if field in col else ''
+        
+        existing = {}
+        duplicates = []
+        for idx, row in enumerate(rows):
+            key = (cell(row, 'Post').strip(), cell(row, 'Name').strip())
+            if not any(key):
+                continue
+            if key in existing:
+                duplicates.append(idx)
+            else:
+                existing[key] = idx
+        taken = {cell(row, 'CandidateID') for row in rows}
+        
+        updates, inserts, wanted = [], [], set()
+        for item in desired:
+            key = (str(item['Post']).strip(), str(item['Name']).strip())
+            if key in wanted:
+                continue
+            wanted.add(key)
+            if key in existing:
+                idx = existing[key]
+                new_row = list(rows[idx])
+                for field in ['Active', 'ImageURL', 'Motto']:
+                    if item.get(field) is not None and field in col:
+                        new_row[col[field]] = str(item[field])
+                if new_row != rows[idx]:
+                    updates.append((idx, new_row))
+            else:
+                values = {
+                    'Post': key[0],
+                    'CandidateID': self._new_candidate_id(taken),
+                    'Name': key[1],
+                    'ImageURL': item.get('ImageURL') or '',
+                    'Motto': item.get('Motto') or '',
+                    'Active': str(item.get('Active', '')),
+                }
+                inserts.append([values.get(h.strip(), '') for h in headers])
+        
+        deletes = list(duplicates)
+        if replace:
+            deletes += [idx for key, idx in existing.items() if key not in wanted]
+        
+        def row_data(row):
+            return {'values': [{'userEnteredValue': {'stringValue': str(v)}} for v in row]}
+        
+        # Updates use the original row positions, so they go before deletes;
+        # deletes run bottom-up so earlier indices stay valid
+        requests = []
+        for idx, new_row in updates:
+            requests.append({'updateCells': {
+                'start': {'sheetId': sheet.id, 'rowIndex': idx + 1, 'columnIndex': 0},
+                'rows': [row_data(new_row)],
+                'fields': 'userEnteredValue',
+            }})
+        for idx in sorted(set(deletes), reverse=True):
+            requests.append({'deleteDimension': {'range': {
+                'sheetId': sheet.id, 'dimension': 'ROWS',
+                'startIndex': idx + 1, 'endIndex': idx + 2,
+            }}})
+        if inserts:
+            requests.append({'appendCells': {
+                'sheetId': sheet.id,
+                'rows': [row_data(row) for row in inserts],
+                'fields': 'userEnteredValue',
+            }})
+        
+        summary = {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(set(deletes))}
+        return summary, requests
+
+    def add_candidates_batch(self, candidates_list):
+        # Replace the candidate list, keeping IDs of candidates that stay
+        desired = [{'Post': post, 'Name': name, 'Active': active}
+                   for post, name, active in candidates_list]
+        return self.sync_candidates(desired, replace=True) is not None
+
+    def upsert_candidate(self, post, name, active, image_url=None, motto=None):
+        desired = [{'Post': post, 'Name': name, 'Active': active,
+                    'ImageURL': image_url or None, 'Motto': motto or None}]
+        return self.sync_candidates(desired, replace=False) is not None
+
+    def reset_voter_usage(self, voting_id):
+        return self.set_voters_used([voting_id], False).get(str(voting_id)) in ('updated', 'unchanged')
 
     def delete_candidate(self, candidate_id):
+        # Found fresh in the sheet, so the row deleted is the one holding
+        # this ID right now
         sheet = self._get_sheet('CANDIDATES')
         if not sheet: return
         try:
-            cell = sheet.find(candidate_id)
-            if cell:
+            headers = [h.strip() for h in sheet.row_values(1)]
+            id_col = headers.index('CandidateID') + 1 if 'CandidateID' in headers else 2
+            cell = sheet.find(str(candidate_id), in_column=id_col)
+            if cell and cell.row > 1:
                 sheet.delete_rows(cell.row)
         except Exception as e:
             print(f"Error deleting candidate: {e}")
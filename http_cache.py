@@ -0,0 +1,256 @@
+import os
+import gzip
+import json
+import hashlib
+import mimetypes
+import threading
+import datetime
+from flask import Response, request
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/javascript',
+    'application/javascript', 'application/json',
+}
+MIN_COMPRESS_SIZE = 512
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+class TallyGeneration:
+    # Bumped whenever votes, voters or candidates change so every derived
+    # response (results, analytics) knows its cached copy is stale
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def bump(self):
+        with self.lock:
+            self.value += 1
+            return self.value
+
+    @property
+    def version(self):
+        return self.value
+
+
+def data_digest(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class CachedResponse:
+    def __init__(self, version, etag, body, mimetype, ttl):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.mimetype = mimetype
+        self.expiry = datetime.datetime.now() + datetime.timedelta(seconds=ttl)
+        self.encoded = {}  # encoding -> compressed body, built on first use
+        self.lock = threading.Lock()
+
+    def _body(self, encoding):
+        if encoding == 'identity':
+            return self.body
+        with self.lock:
+            if encoding not in self.encoded:
+                self.encoded[encoding] = compress_body(self.body, encoding)
+            return self.encoded[encoding]
+
+    def respond(self, cache_control='no-cache'):
+        # Polls of an unchanged entry reuse its compressed bytes instead of
+        # compressing the page again in compress_response
+        data = self.body.encode() if isinstance(self.body, str) else self.body
+        encoding = 'identity'
+        if self.mimetype in COMPRESSIBLE_TYPES and len(data) >= MIN_COMPRESS_SIZE:
+            encoding = choose_encoding({'br', 'gzip'} if brotli else {'gzip'})
+        response = Response(self._body(encoding), mimetype=self.mimetype)
+        if self.mimetype in COMPRESSIBLE_TYPES:
+            response.vary.add('Accept-Encoding')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etag, weak=True)
+        response.headers['Cache-Control'] = cache_control
+        return response.make_conditional(request)
+
+
+class ResponseCache:
+    # Keeps the latest rendered body per name (results, analytics), keyed by
+    # tally version plus a digest of the data it was rendered from
+    def __init__(self):
+        self.entries = {}
+        self.ttl_config = {
+            'results': 15,
+            'analytics': 30,
+        }
+
+    def get(self, name, version):
+        entry = self.entries.get(name)
+        if entry and entry.version == version and datetime.datetime.now() < entry.expiry:
+            return entry
+        return None
+
+    def latest(self, name):
+        # Last rendered body whatever its version or age, for serving a
+        # snapshot when a fresh render can't be afforded
+        return self.entries.get(name)
+
+    def put(self, name, version, data, render, mimetype='text/html'):
+        # Only re-render when the underlying data actually changed
+        digest = data_digest(data)
+        etag = f"{name}-{version}-{digest}"
+        ttl = self.ttl_config.get(name, 30)
+        previous = self.entries.get(name)
+        if previous and previous.etag.endswith(digest):
+            body = previous.body
+        else:
+            body = render()
+        entry = CachedResponse(version, etag, body, mimetype, ttl)
+        self.entries[name] = entry
+        return entry
+
+    def invalidate(self, name=None):
+        if name is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(name, None)
+
+
+class StaticAssets:
+    # Fingerprinted, precompressed copies of everything under static/
+    def __init__(self, folder):
+        self.folder = folder
+        self.assets = {}
+        self.lock = threading.Lock()
+
+    def precompress_all(self):
+        if not self.folder or not os.path.isdir(self.folder):
+            return
+        for root, _, files in os.walk(self.folder):
+            for f in files:
+                rel = os.path.relpath(os.path.join(root, f), self.folder)
+                self.get(rel.replace(os.sep, '/'))
+
+    def get(self, filename):
+        path = safe_join(self.folder, filename)
+        if not path or not os.path.isfile(path):
+            return None
+        mtime = os.stat(path).st_mtime
+        asset = self.assets.get(filename)
+        if asset and asset['mtime'] == mtime:
+            return asset
+
+        with open(path, 'rb') as f:
+            raw = f.read()
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        asset = {
+            'mtime': mtime,
+            'mimetype': mimetype,
+            'digest': hashlib.sha1(raw).hexdigest()[:12],
+            'identity': raw,
+        }
+        if mimetype in COMPRESSIBLE_TYPES and len(raw) >= MIN_COMPRESS_SIZE:
+            asset['gzip'] = gzip.compress(raw, compresslevel=9)
+            if brotli:
+                asset['br'] = brotli.compress(raw)
+        with self.lock:
+            self.assets[filename] = asset
+        return asset
+
+    def fingerprint(self, filename):
+        asset = self.get(filename)
+        return asset['digest'] if asset else None
+
+
+def choose_encoding(available):
+    accepted = request.accept_encodings
+    if 'br' in available and accepted['br']:
+        return 'br'
+    if 'gzip' in available and accepted['gzip']:
+        return 'gzip'
+    return 'identity'
+
+
+def compress_body(body, encoding):
+    if isinstance(body, str):
+        body = body.encode()
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def compress_response(response):
+    if (request.method != 'GET' or response.status_code != 200
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    encoding = choose_encoding({'br', 'gzip'} if brotli else {'gzip'})
+    if encoding == 'identity':
+        return response
+    response.set_data(compress_body(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # A compressed body is no longer byte-identical, demote strong ETags
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def add_json_etag(response):
+    # Lets admin polling endpoints answer unchanged data with 304
+    if (request.method == 'GET' and response.status_code == 200
+            and response.mimetype == 'application/json'
+            and not response.is_streamed and not response.get_etag()[0]):
+        response.add_etag(weak=True)
+        response.headers.setdefault('Cache-Control', 'private, no-cache')
+        response.make_conditional(request)
+    return response
+
+
+def init_app(app):
+    assets = StaticAssets(app.static_folder)
+    assets.precompress_all()
+
+    def static_view(filename):
+        asset = assets.get(filename)
+        if not asset:
+            raise NotFound()
+        available = {k for k in ('gzip', 'br') if k in asset}
+        encoding = choose_encoding(available) if available else 'identity'
+        response = Response(asset[encoding], mimetype=asset['mimetype'])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if available:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(f"{asset['digest']}-{encoding}")
+        if request.args.get('v') == asset['digest']:
+            # Fingerprinted URL, the content behind it can never change
+            response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'public, no-cache'
+        return response.make_conditional(request)
+
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            digest = assets.fingerprint(values['filename'])
+            if digest:
+                values['v'] = digest
+
+    if 'static' in app.view_functions:
+        app.view_functions['static'] = static_view
+    app.url_defaults(fingerprint_static_urls)
+    # after_request hooks run in reverse order: ETag first, then compression
+    app.after_request(compress_response)
+    app.after_request(add_json_etag)
+    return assets
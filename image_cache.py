@@ -0,0 +1,196 @@
+import io
+import os
+import json
+import time
+import hashlib
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow originals are served un-resized
+    Image = None
+
+try:
+    import fcntl
+except ImportError:  # Without flock concurrent index writes may drop an entry
+    fcntl = None
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+THUMB_SIZES = {'thumb': 160}  # every page shows photos at 64px or less
+FETCH_BACKOFF = 60  # seconds before retrying a failed URL, doubled per failure
+FETCH_BACKOFF_MAX = 3600
+MEDIA_PREFIX = '/media/'
+
+
+def sniff_extension(data):
+    if data.startswith(b'\x89PNG'):
+        return 'png'
+    if data.startswith(b'\xff\xd8'):
+        return 'jpg'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class ImageStore:
+    # Content-addressed store for candidate photos. Each source (a remote
+    # ImageURL or an admin upload) is fetched once, stored under the SHA-256
+    # of its bytes, and resized into THUMB_SIZES by a small worker pool.
+    # index.json maps source -> digest so lookups never touch the network;
+    # it is shared by every worker, so each write merges what is on disk.
+    def __init__(self, root='image_store', max_workers=2, on_ready=None):
+        self.root = root
+        self.on_ready = on_ready
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, 'index.json')
+        self.index = {}
+        self.pending = set()
+        self.failed = {}  # url -> (failures, retry_at) for URLs that could not be fetched
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='images')
+        self.index = self._read_index()
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Image store: could not read index: {e}")
+            return {}
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        # Held (with self.lock) while index.json is read, changed and written
+        if not fcntl:
+            yield
+            return
+        with open(f"{self.index_path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _merge_index(self):
+        # Pick up entries other workers wrote; call with both locks held
+        index = dict(self.index)
+        index.update(self._read_index())
+        self.index = index
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def path_for(self, filename):
+        return os.path.join(self.root, os.path.basename(filename))
+
+    def display_url(self, source, size='thumb'):
+        # Local thumbnail URL once it exists; until then the original source
+        # is returned and a background fetch is queued
+        if not source:
+            return source
+        entry = self.index.get(source)
+        if entry:
+            name = entry.get('sizes', {}).get(size) or entry['original']
+            return MEDIA_PREFIX + name
+        if source.startswith(('http://', 'https://')):
+            self.prefetch(source)
+        return source
+
+    def prefetch(self, url):
+        with self.lock:
+            if url in self.index or url in self.pending:
+                return
+            failed = self.failed.get(url)
+            if failed and time.time() < failed[1]:
+                return
+            self.pending.add(url)
+        self.pool.submit(self._fetch, url)
+
+    def _fetch(self, url):
+        try:
+            with self.lock, self._index_lock():
+                self._merge_index()
+                fetched = url in self.index
+            if fetched:
+                # Another worker already stored it
+                if self.on_ready:
+                    self.on_ready()
+                return
+            response = requests.get(url, timeout=10, stream=True)
+            response.raise_for_status()
+            data = response.raw.read(MAX_IMAGE_BYTES + 1, decode_content=True)
+            if len(data) > MAX_IMAGE_BYTES:
+                raise ValueError('image too large')
+            self.ingest(data, source=url, resize_async=False)
+            with self.lock:
+                self.failed.pop(url, None)
+        except Exception as e:
+            with self.lock:
+                failures = self.failed.get(url, (0, 0))[0] + 1
+                delay = min(FETCH_BACKOFF_MAX, FETCH_BACKOFF * 2 ** (failures - 1))
+                self.failed[url] = (failures, time.time() + delay)
+            print(f"Image store: could not fetch {url} (retry in {delay}s): {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(url)
+
+    def ingest(self, data, source=None, resize_async=True):
+        ext = sniff_extension(data)
+        if not ext:
+            raise ValueError('unsupported image format')
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        original = f"{digest}.{ext}"
+        path = self.path_for(original)
+        if not os.path.exists(path):
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+
+        source = source or MEDIA_PREFIX + original
+        with self.lock, self._index_lock():
+            self._merge_index()
+            self.index.setdefault(source, {'digest': digest, 'original': original, 'sizes': {}})
+            self._save_index()
+        if resize_async:
+            self.pool.submit(self._resize, source, data, digest)
+        else:
+            self._resize(source, data, digest)
+        return source
+
+    def _resize(self, source, data, digest):
+        sizes = {}
+        if Image:
+            try:
+                for size_name, px in THUMB_SIZES.items():
+                    name = f"{digest}-{size_name}.jpg"
+                    path = self.path_for(name)
+                    if not os.path.exists(path):
+                        img = Image.open(io.BytesIO(data))
+                        img = img.convert('RGB')
+                        img.thumbnail((px, px))
+                        img.save(path + '.tmp', 'JPEG', quality=80, optimize=True, progressive=True)
+                        os.replace(path + '.tmp', path)
+                    sizes[size_name] = name
+            except Exception as e:
+                print(f"Image store: could not resize {source}: {e}")
+        with self.lock, self._index_lock():
+            self._merge_index()
+            if source in self.index:
+                self.index[source] = dict(self.index[source], sizes=sizes)
+                self._save_index()
+        if self.on_ready:
+            self.on_ready()
+
+    def stats(self):
+        return {'images': len(self.index), 'pending': len(self.pending), 'failed': len(self.failed),
+                'resizing': Image is not None}
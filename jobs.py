@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import uuid
+import threading
+import datetime
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Without flock each process only sees its own jobs
+    fcntl = None
+
+ACTIVE_STATES = ('queued', 'running')
+
+
+class JobContext:
+    # Handed to job functions so they can report progress
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+
+    def progress(self, done, total=None, message=None):
+        self.runner._update(self.job_id, done=done, total=total, message=message)
+
+
+class JobRunner:
+    # Bounded worker pool for long admin operations. Job state is persisted
+    # to a JSON file, jobs are looked up by kind + params so a repeated click
+    # returns the running job, and failures are retried with backoff. Job
+    # functions must be safe to run again from the start.
+    #
+    # Every worker process shares the state file: writes merge this
+    # process's jobs into what is on disk under a flock, and each job is
+    # owned by the process holding the flock on its own lock file. The lock
+    # dies with its process, so a job is only resumed once its owner is gone,
+    # and only by the one process that manages to take the lock over.
+    def __init__(self, state_file='jobs_state.json', max_workers=2, max_attempts=3, keep=50):
+        self.state_file = state_file
+        self.max_attempts = max_attempts
+        self.keep = keep
+        self.handlers = {}
+        self.attempts = {}  # kind -> max attempts, when not the default
+        self.jobs = {}
+        self.lock = threading.RLock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.last_saved = 0
+        self.loaded_mtime = None
+        self.claims = {}  # job id -> open lock file held while this process owns the job
+        self._load()
+
+    def register(self, kind, fn, max_attempts=None):
+        # `max_attempts` overrides the runner's default for this kind; 1 for
+        # jobs that must not be repeated automatically
+        self.handlers[kind] = fn
+        if max_attempts:
+            self.attempts[kind] = max_attempts
+
+    @contextlib.contextmanager
+    def _state_lock(self):
+        if not self.state_file or not fcntl:
+            yield
+            return
+        with open(f"{self.state_file}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            self.loaded_mtime = os.stat(self.state_file).st_mtime_ns
+            with open(self.state_file) as f:
+                return {j['id']: j for j in json.load(f)}
+        except Exception as e:
+            print(f"Jobs: could not load state file: {e}")
+            return {}
+
+    def _load(self):
+        with self.lock:
+            self.jobs = self._read_state()
+
+    def _refresh(self):
+        # Other workers' jobs, when the file changed since it was last read
+        if not self.state_file or not fcntl:
+            return
+        try:
+            mtime = os.stat(self.state_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self.loaded_mtime:
+            return
+        with self.lock:
+            disk = self._read_state()
+            self.jobs = dict(disk, **{k: j for k, j in self.jobs.items() if k in self.claims})
+
+    def _claim(self, job_id):
+        # True if this process now owns the job (nobody else holds its lock)
+        if not self.state_file or not fcntl:
+            self.claims[job_id] = None
+            return True
+        lock_file = open(f"{self.state_file}.{job_id}.lock", 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self.claims[job_id] = lock_file
+        return True
+
+    def _release(self, job_id):
+        lock_file = self.claims.pop(job_id, None)
+        if lock_file:
+            lock_file.close()
+
+    def resume_interrupted(self):
+        # Unfinished jobs whose owning process has died, from a previous run
+        # or from a worker that exited, are taken over by one process
+        resumed = []
+        with self._state_lock():
+            with self.lock:
+                self.jobs = self._read_state()
+                for job in self.jobs.values():
+                    if (job['status'] in ACTIVE_STATES + ('interrupted',) and job['kind'] in self.handlers
+                            and job['id'] not in self.claims and self._claim(job['id'])):
+                        job['status'] = 'queued'
+                        resumed.append(job['id'])
+            self._write()
+        for job_id in resumed:
+            self.pool.submit(self._run, job_id)
+        return len(resumed)
+
+    def _save(self, force=True):
+        if not self.state_file:
+            return
+        now = time.monotonic()
+        # Progress ticks are saved at most once a second
+        if not force and now - self.last_saved < 1:
+            return
+        self.last_saved = now
+        with self._state_lock():
+            with self.lock:
+                # The file has the latest copy of other workers' jobs; ours win
+                if fcntl:
+                    disk = self._read_state()
+                    self.jobs = dict(disk, **{k: j for k, j in self.jobs.items() if k in self.claims})
+            self._write()
+
+    def _write(self):
+        # Caller holds _state_lock
+        with self.lock:
+            # Finished jobs are trimmed to the most recent `keep`
+            jobs = sorted(self.jobs.values(), key=lambda j: j['created'])
+            finished = [j for j in jobs if j['status'] not in ACTIVE_STATES]
+            stale = {j['id'] for j in finished[:-self.keep]} if len(finished) > self.keep else set()
+            jobs = [j for j in jobs if j['id'] not in stale]
+            self.jobs = {j['id']: j for j in jobs}
+            payload = json.dumps(jobs)
+        tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(payload)
+            os.replace(tmp_path, self.state_file)
+            self.loaded_mtime = os.stat(self.state_file).st_mtime_ns
+        except Exception as e:
+            print(f"Jobs: could not save state file: {e}")
+        for job_id in stale:
+            try:
+                os.remove(f"{self.state_file}.{job_id}.lock")
+            except OSError:
+                pass
+
+    def submit(self, kind, params=None):
+        params = params or {}
+        key = f"{kind}:{json.dumps(params, sort_keys=True)}"
+        # A job another worker is running counts too
+        self._refresh()
+        with self.lock:
+            for job in self.jobs.values():
+                if job['key'] == key and job['status'] in ACTIVE_STATES:
+                    return dict(job)
+            now = datetime.datetime.now().isoformat()
+            job = {
+                'id': uuid.uuid4().hex[:12],
+                'kind': kind,
+                'key': key,
+                'params': params,
+                'status': 'queued',
+                'attempts': 0,
+                'done': 0,
+                'total': None,
+                'message': '',
+                'result': None,
+                'error': None,
+                'created': now,
+                'updated': now,
+            }
+            self.jobs[job['id']] = job
+            self._claim(job['id'])
+        self._save()
+        self.pool.submit(self._run, job['id'])
+        return dict(job)
+
+    def _update(self, job_id, force=False, **fields):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            for k, v in fields.items():
+                if v is not None:
+                    job[k] = v
+            job['updated'] = datetime.datetime.now().isoformat()
+        self._save(force=force)
+
+    def _run(self, job_id):
+        job = self.jobs.get(job_id)
+        handler = self.handlers.get(job['kind']) if job else None
+        if not handler:
+            self._update(job_id, force=True, status='failed', error='unknown job kind')
+            return
+        try:
+            while True:
+                self._update(job_id, force=True, status='running', attempts=job['attempts'] + 1)
+                try:
+                    result = handler(JobContext(self, job_id), **job['params'])
+                    self._update(job_id, force=True, status='done', result=result, error='')
+                    return
+                except Exception as e:
+                    print(f"Job {job['kind']} ({job_id}) attempt {job['attempts']} failed: {e}")
+                    if job['attempts'] >= self.attempts.get(job['kind'], self.max_attempts):
+                        self._update(job_id, force=True, status='failed', error=str(e))
+                        return
+                    self._update(job_id, force=True, status='queued', error=str(e))
+                    time.sleep(2 ** job['attempts'])
+        finally:
+            self._release(job_id)
+
+    def get(self, job_id):
+        self._refresh()
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    def recent(self, limit=20, **params):
+        # Optionally only jobs whose params include all of `params`
+        self._refresh()
+        jobs = [j for j in self.jobs.values() if all(j['params'].get(k) == v for k, v in params.items())]
+        jobs = sorted(jobs, key=lambda j: j['created'], reverse=True)
+        return [dict(j) for j in jobs[:limit]]
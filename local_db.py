@@ -0,0 +1,248 @@
+import re
+import time
+import threading
+from collections import Counter
+import gspread
+from google_sheets import GoogleSheetsDB
+
+# In-process stand-in for the Google Sheets backend. It implements the
+# handful of gspread Spreadsheet/Worksheet calls GoogleSheetsDB makes, so the
+# real data-access code runs unchanged, and counts every API call per route
+# (with an optional fake latency) for load testing and replays.
+
+_route = threading.local()
+
+
+def set_route(name):
+    _route.name = name
+
+
+def current_route():
+    return getattr(_route, 'name', None) or '-'
+
+
+class LocalCell:
+    def __init__(self, row, col, value):
+        self.row = row
+        self.col = col
+        self.value = value
+
+
+def _col_number(letters):
+    n = 0
+    for ch in letters.upper():
+        n = n * 26 + (ord(ch) - 64)
+    return n
+
+
+def parse_a1(a1_range):
+    # 'A2:E10', 'E5', "'VOTERS'!A1:C" -> (col1, row1, col2, row2), 1-based
+    if '!' in a1_range:
+        a1_range = a1_range.split('!', 1)[1]
+    a1_range = a1_range.strip("'")
+    match = re.match(r'^([A-Za-z]+)?(\d+)?(?::([A-Za-z]+)?(\d+)?)?$', a1_range)
+    if not match:
+        return 1, 1, 10 ** 6, 10 ** 9
+    c1, r1, c2, r2 = match.groups()
+    single = ':' not in a1_range
+    col1 = _col_number(c1) if c1 else 1
+    row1 = int(r1) if r1 else 1
+    col2 = col1 if single and c1 else (_col_number(c2) if c2 else 10 ** 6)
+    row2 = row1 if single and r1 else (int(r2) if r2 else 10 ** 9)
+    return col1, row1, col2, row2
+
+
+class LocalWorksheet:
+    def __init__(self, spreadsheet, title, sheet_id, cols=26):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = []
+        self.col_count = cols  # grid width, only grown by add_cols like in Sheets
+
+    def _call(self, op):
+        self.spreadsheet.record(op)
+
+    def get_all_values(self):
+        self._call('get_all_values')
+        with self.spreadsheet.lock:
+            return [[str(v) for v in row] for row in self.rows]
+
+    def get(self, a1_range=None):
+        self._call('get')
+        col1, row1, col2, row2 = parse_a1(a1_range or 'A1:ZZ')
+        with self.spreadsheet.lock:
+            return [[str(v) for v in row[col1 - 1:col2]] for row in self.rows[row1 - 1:row2]]
+
+    def batch_get(self, ranges, **kwargs):
+        self._call('batch_get')
+        results = []
+        with self.spreadsheet.lock:
+            for a1_range in ranges:
+                col1, row1, col2, row2 = parse_a1(a1_range)
+                results.append([[str(v) for v in row[col1 - 1:col2]] for row in self.rows[row1 - 1:row2]])
+        return results
+
+    def row_values(self, row):
+        self._call('row_values')
+        with self.spreadsheet.lock:
+            return [str(v) for v in self.rows[row - 1]] if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        self._call('col_values')
+        with self.spreadsheet.lock:
+            values = [str(row[col - 1]) if len(row) >= col else '' for row in self.rows]
+        while values and values[-1] == '':
+            values.pop()
+        return values
+
+    def find(self, query, in_row=None, in_column=None):
+        self._call('find')
+        with self.spreadsheet.lock:
+            for r, row in enumerate(self.rows):
+                if in_row and r + 1 != in_row:
+                    continue
+                for c, value in enumerate(row):
+                    if in_column and c + 1 != in_column:
+                        continue
+                    if str(value) == str(query):
+                        return LocalCell(r + 1, c + 1, str(value))
+        return None
+
+    def append_row(self, row, **kwargs):
+        self._call('append_row')
+        with self.spreadsheet.lock:
+            self.rows.append(list(row))
+
+    def append_rows(self, rows, **kwargs):
+        self._call('append_rows')
+        with self.spreadsheet.lock:
+            self.rows.extend(list(row) for row in rows)
+
+    def update_cell(self, row, col, value):
+        self._call('update_cell')
+        with self.spreadsheet.lock:
+            self._set(row, col, value)
+
+    def _set(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append('')
+        cells[col - 1] = value
+
+    def batch_update(self, data, **kwargs):
+        self._call('batch_update')
+        with self.spreadsheet.lock:
+            for item in data:
+                col1, row1, _, _ = parse_a1(item['range'])
+                for dr, values in enumerate(item['values']):
+                    for dc, value in enumerate(values):
+                        self._set(row1 + dr, col1 + dc, value)
+
+    def add_cols(self, cols):
+        self._call('add_cols')
+        with self.spreadsheet.lock:
+            self.col_count += cols
+
+    def delete_rows(self, start_index, end_index=None):
+        self._call('delete_rows')
+        with self.spreadsheet.lock:
+            del self.rows[start_index - 1:(end_index or start_index)]
+
+
+class LocalSpreadsheet:
+    def __init__(self, latency=0.0):
+        self.id = 'local'
+        self.latency = latency
+        self.sheets = {}
+        self.lock = threading.RLock()
+        self.calls = Counter()
+
+    def record(self, op):
+        self.calls[(current_route(), op)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def worksheet(self, title):
+        self.record('worksheet')
+        if title not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def add_worksheet(self, title, rows=0, cols=0):
+        self.record('add_worksheet')
+        with self.lock:
+            sheet = LocalWorksheet(self, title, len(self.sheets) + 1, cols or 26)
+            self.sheets[title] = sheet
+            return sheet
+
+    def values_batch_get(self, ranges, params=None):
+        self.record('values_batch_get')
+        value_ranges = []
+        with self.lock:
+            for a1_range in ranges:
+                title = a1_range.split('!')[0].strip("'")
+                sheet = self.sheets.get(title)
+                if not sheet:
+                    value_ranges.append({'range': a1_range, 'values': []})
+                    continue
+                col1, row1, col2, row2 = parse_a1(a1_range) if '!' in a1_range else (1, 1, 10 ** 6, 10 ** 9)
+                values = [[str(v) for v in row[col1 - 1:col2]] for row in sheet.rows[row1 - 1:row2]]
+                value_ranges.append({'range': a1_range, 'values': values})
+        return {'valueRanges': value_ranges}
+
+    def batch_update(self, body):
+        self.record('batch_update')
+        with self.lock:
+            by_id = {sheet.id: sheet for sheet in self.sheets.values()}
+            for req in body.get('requests', []):
+                if 'deleteDimension' in req:
+                    rng = req['deleteDimension']['range']
+                    del by_id[rng['sheetId']].rows[rng['startIndex']:rng['endIndex']]
+                elif 'appendCells' in req:
+                    sheet = by_id[req['appendCells']['sheetId']]
+                    for row in req['appendCells']['rows']:
+                        sheet.rows.append([self._cell_value(c) for c in row['values']])
+                elif 'updateCells' in req:
+                    update = req['updateCells']
+                    sheet = by_id[update['start']['sheetId']]
+                    start = update['start']['rowIndex']
+                    for offset, row in enumerate(update['rows']):
+                        sheet.rows[start + offset] = [self._cell_value(c) for c in row['values']]
+        return {}
+
+    @staticmethod
+    def _cell_value(cell):
+        value = cell.get('userEnteredValue', {})
+        return next(iter(value.values()), '')
+
+
+class LocalClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        self.spreadsheet.record('open_by_key')
+        return self.spreadsheet
+
+
+class LocalSheetsDB(GoogleSheetsDB):
+    def __init__(self, latency=0.0):
+        self.sheet_id = 'local'
+        self.credentials_json = None
+        self.spreadsheet = LocalSpreadsheet(latency)
+        self.client = LocalClient(self.spreadsheet)
+        self._ensure_votes_sheet()
+        self._get_sheet('VOTERS')
+
+    def call_counts(self):
+        # {route: {operation: count}}
+        by_route = {}
+        for (route, op), count in self.spreadsheet.calls.items():
+            by_route.setdefault(route, {})[op] = count
+        return by_route
+
+    def reset_counts(self):
+        self.spreadsheet.calls.clear()
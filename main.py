@@ -1,29 +1,212 @@
 import json
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, g,
+                   stream_with_context)
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
+import re
 import random
 import string
 import datetime
+import contextlib
+from collections import OrderedDict
 from google_sheets import GoogleSheetsDB
+from resilience import BackendUnavailable
+from http_cache import TallyGeneration, ResponseCache, data_digest, init_app as init_http_cache
+from profiler import SamplingProfiler, init_app as init_profiler
+from admission import AdmissionController, init_app as init_admission
+from jobs import JobRunner
+from booth import BoothDB, BoothNode, SyncCoordinator, sync_blueprint
+from session_store import create_session_interface, TENANT_KEY
+from image_cache import ImageStore
+from templating import FragmentCache, init_templates
+from traffic import TrafficRecorder, init_app as init_traffic
+from receipts import ReceiptIndex, format_code
+from roster import SharedRoster
+from turnout import TurnoutTracker
+from recordings import RecordingProcessor, INDEX_NAME as RECORDINGS_INDEX
+from final_results import FinalResults, tally_results, is_dummy
+from voter_ids import ID_LENGTH, TEACHER_PREFIX, DUMMY_PREFIX, make_id, normalise_id, is_valid_id
+from exports import DATASETS, FORMATS, ExportFilters, voter_lookup, iter_records, iter_results, stream_export
+from tenancy import (TenantRegistry, TenantMiddleware, UnknownTenant, DEFAULT_TENANT, load_tenant_config,
+                     current_tenant, set_current)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SESSION_SECRET', 'school-election-secret-key')
 
-# Initialize Google Sheets DB
-db = GoogleSheetsDB()
+# Reverse proxies in front of the app (1 on Render). Only with this set is
+# the client address read from X-Forwarded-For, and only the hops they added
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+# Server-side sessions: the cookie only carries an opaque ID. 'memory' for a
+# single process, 'sqlite' to share sessions between workers, 'cookie' for
+# Flask's default signed-cookie sessions.
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'memory')
+if SESSION_BACKEND != 'cookie':
+    app.session_interface = create_session_interface(
+        SESSION_BACKEND, os.environ.get('SESSION_DB_PATH', 'sessions.db'),
+        ballot_ttl=int(os.environ.get('BALLOT_TTL', 15 * 60)))
+
+# Request stream recorder for replay.py; registered first so it also sees
+# requests turned away by the pause check
+traffic = TrafficRecorder()
+init_traffic(app, traffic)
+if os.environ.get('TRAFFIC_RECORD'):
+    traffic.start(os.environ['TRAFFIC_RECORD'])
+
+# Deployment mode: 'single' (default), 'coordinator' for the central app in
+# multi-booth mode, or 'booth' for a booth node with its own local store
+ELECTION_MODE = os.environ.get('ELECTION_MODE', 'single')
+BOOTH_SYNC_TOKEN = os.environ.get('BOOTH_SYNC_TOKEN', '')
+
+# Elections served by this process, selected by '/t/<slug>/' prefix or host
+# (see tenancy.py). Without a tenants file there is one 'default' election
+# configured from GOOGLE_SHEET_ID; booths and coordinators always serve one.
+TENANTS = load_tenant_config(os.environ.get('TENANTS_FILE', 'tenants.json'), os.environ.get('TENANTS_JSON'))
+if ELECTION_MODE != 'single' or not TENANTS:
+    TENANTS = {DEFAULT_TENANT: TENANTS.get(DEFAULT_TENANT, {})}
+TENANT_CACHE_BYTES = int(float(os.environ.get('TENANT_CACHE_MB', 16)) * 1024 * 1024)
+RECEIPTS_DIR = os.environ.get('RECEIPTS_DIR', 'receipts')
+os.makedirs(RECEIPTS_DIR, exist_ok=True)
+# Compiled voter rosters, memory-mapped by every worker (see roster.py)
+ROSTER_DIR = os.environ.get('ROSTER_DIR', 'rosters')
+os.makedirs(ROSTER_DIR, exist_ok=True)
+SESSIONS_DIR = os.environ.get('SESSIONS_DIR', 'secure_sessions')
+# Frozen results of closed elections (see final_results.py)
+FINAL_RESULTS_DIR = os.environ.get('FINAL_RESULTS_DIR', 'final_results')
+os.makedirs(FINAL_RESULTS_DIR, exist_ok=True)
+
+def setup_tenant(tenant):
+    config = tenant.config
+    # Initialize Google Sheets DB
+    if ELECTION_MODE == 'booth':
+        tenant.db = BoothDB(os.environ.get('BOOTH_DB_PATH', 'booth.db'))
+    else:
+        credentials = os.environ.get(config['credentials_env']) if config.get('credentials_env') else None
+        tenant.db = GoogleSheetsDB(config.get('sheet_id'), credentials)
+    tenant.cache = SheetCache(max_bytes=TENANT_CACHE_BYTES)
+    # Versioned, rendered responses for results and analytics polling
+    tenant.tally = TallyGeneration()
+    tenant.response_cache = ResponseCache()
+    # Rendered candidate cards keyed by a digest of the candidates they show
+    tenant.fragments = FragmentCache(max_entries=64)
+    # Receipt code -> VERIFICATIONS row, caught up from the sheet in the background
+    tenant.receipts = ReceiptIndex(lambda start_row: tenant.db.get_rows('VERIFICATIONS', start_row),
+                                   os.path.join(RECEIPTS_DIR, f"{tenant.slug}.json"))
+    tenant.receipts.maybe_sync()
+    # Ballots per minute, turnout per class/section and ballot durations,
+    # updated on every commit
+    tenant.turnout = TurnoutTracker()
+    # Booths already look voters up in their local SQLite store
+    tenant.roster = None
+    if ELECTION_MODE != 'booth':
+        tenant.roster = SharedRoster(os.path.join(ROSTER_DIR, f"{tenant.slug}.roster"),
+                                     loader=lambda: tenant.db.read_records('VOTERS'),
+                                     max_age=int(os.environ.get('ROSTER_MAX_AGE', 120)))
+    # A closed election stays closed across restarts: serve its frozen
+    # results and keep refusing writes to its sheet
+    tenant.final_checked = 0
+    load_final_results(tenant)
+
+def teardown_tenant(tenant):
+    # An evicted election gives back its roster mapping and journal handle
+    if getattr(tenant, 'roster', None):
+        tenant.roster.close()
+
+def final_results_path(tenant):
+    return os.path.join(FINAL_RESULTS_DIR, f"{tenant.slug}.json")
+
+def load_final_results(tenant):
+    # Picks up a close started or finished by another worker process (at
+    # most once a second); the .closing file exists while one is under way
+    now = datetime.datetime.now().timestamp()
+    if tenant.final or now - tenant.final_checked < 1:
+        return tenant.final
+    tenant.final_checked = now
+    path = final_results_path(tenant)
+    tenant.closing = os.path.exists(f"{path}.closing")
+    if tenant.closing:
+        return None
+    tenant.final = FinalResults.load(path)
+    if tenant.final:
+        getattr(tenant.db, 'freeze', lambda: False)()
+        tenant.response_cache.invalidate()
+    return tenant.final
+
+tenants = TenantRegistry(TENANTS, setup_tenant, teardown_tenant,
+                         idle_ttl=int(os.environ.get('TENANT_IDLE_SECONDS', 1800)),
+                         max_live=int(os.environ.get('TENANT_MAX_LIVE', 50)))
+app.wsgi_app = TenantMiddleware(app.wsgi_app, tenants)
+
+# Handles of the election the current request (or background job) belongs to
+db = LocalProxy(lambda: current_tenant().db)
+cache = LocalProxy(lambda: current_tenant().cache)
+tally = LocalProxy(lambda: current_tenant().tally)
+response_cache = LocalProxy(lambda: current_tenant().response_cache)
+fragments = LocalProxy(lambda: current_tenant().fragments)
+receipts = LocalProxy(lambda: current_tenant().receipts)
+roster = LocalProxy(lambda: current_tenant().roster)
+turnout = LocalProxy(lambda: current_tenant().turnout)
+
+@app.before_request
+def select_tenant():
+    try:
+        tenant = tenants.get(request.environ.get('election.tenant', DEFAULT_TENANT))
+    except UnknownTenant:
+        return 'Unknown election.', 404
+    tenant.touch()
+    g._tenant_token = set_current(tenant)
+    # A session belongs to one election; visiting another starts afresh
+    owner = session.get(TENANT_KEY)
+    if owner and owner != tenant.slug:
+        session.clear()
+
+@app.after_request
+def stamp_session_tenant(response):
+    if '_tenant_token' in g and session and session.get(TENANT_KEY) != current_tenant().slug:
+        session[TENANT_KEY] = current_tenant().slug
+    return response
+
+@app.teardown_request
+def release_tenant(exc):
+    token = g.pop('_tenant_token', None)
+    if token:
+        token.var.reset(token)
 
 ADMIN_PASSWORDS = ['MANOJ@123']
 
-# Global state for election pause
-ELECTION_PAUSED = False
-ELECTION_PAUSED_AT = None  # Track when election was paused
+def tenant_admin_passwords(tenant):
+    # Only the default election falls back to ADMIN_PASSWORDS; any other
+    # election without its own 'admin_passwords' has no admin login
+    passwords = tenant.config.get('admin_passwords')
+    if passwords is None and tenant.slug == DEFAULT_TENANT:
+        passwords = ADMIN_PASSWORDS
+    return passwords or []
+
+# Requests that may still be POSTed once the election is closed; none of
+# them change election data
+CLOSED_ALLOWED = {'admin_login', 'verify_receipt', 'profiling_settings', 'traffic_settings', 'close_election'}
+# GET routes that change election data; refused once it is closed, as not
+# every backend can freeze the sheet (see GoogleSheetsDB.freeze)
+CLOSED_WRITES = {'generate_teachers', 'auto_populate_candidates', 'generate_dummy_ids', 'delete_candidate'}
 
 @app.before_request
 def check_election_status():
-    global ELECTION_PAUSED
+    tenant = current_tenant()
+    closed = load_final_results(tenant) or tenant.closing
+    writes = request.endpoint in CLOSED_WRITES or (request.method != 'GET' and request.endpoint not in CLOSED_ALLOWED)
+    if closed and writes:
+        # Nothing may change after closing (the sheet itself is frozen too)
+        if request.path.startswith('/sync') or request.is_json or request.accept_mimetypes.best == 'application/json':
+            return jsonify({'error': 'the election is closed'}), 409
+        if session.get('admin_logged_in'):
+            flash('The election is closed; nothing can be changed any more.', 'error')
+            return redirect(url_for('admin_dashboard'))
     # Allow admin routes and home/results even if paused
-    if ELECTION_PAUSED:
-        allowed_paths = ['/admin', '/static', '/results', '/favicon.ico', '/admin/pause-status', '/status']
+    if tenant.paused or closed:
+        allowed_paths = ['/admin', '/static', '/media', '/results', '/favicon.ico', '/admin/pause-status', '/status', '/sync', '/verify-receipt']
         if not any(request.path.startswith(p) for p in allowed_paths) and request.path != '/':
             if not session.get('admin_logged_in'):
                 # Clear any active voting session when paused
@@ -31,20 +214,28 @@ def check_election_status():
                 session.pop('pending_voter_id', None)
                 session.pop('current_votes', None)
                 session.pop('voter_details', None)
-                flash('The election is currently paused by the administrator.', 'info')
+                if closed:
+                    flash('The election has closed. Thank you for voting!', 'info')
+                else:
+                    flash('The election is currently paused by the administrator.', 'info')
                 return redirect(url_for('home'))
 
 @app.route('/admin/toggle-pause')
 def toggle_pause():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
-    global ELECTION_PAUSED, ELECTION_PAUSED_AT
-    ELECTION_PAUSED = not ELECTION_PAUSED
-    if ELECTION_PAUSED:
-        ELECTION_PAUSED_AT = datetime.datetime.now()
+    tenant = current_tenant()
+    tenant.paused = not tenant.paused
+    if tenant.paused:
+        tenant.paused_at = datetime.datetime.now()
         status = "PAUSED"
+        # Drop every in-progress ballot of this election at once instead of one per request
+        if hasattr(app.session_interface, 'invalidate_ballots'):
+            dropped = app.session_interface.invalidate_ballots(tenant.slug)
+            if dropped:
+                status += f" ({dropped} active ballots cleared)"
     else:
-        ELECTION_PAUSED_AT = None
+        tenant.paused_at = None
         status = "RESUMED"
     flash(f'Election has been {status}.', 'success')
     return redirect(url_for('admin_dashboard'))
@@ -53,16 +244,121 @@ def toggle_pause():
 def pause_status():
     if not session.get('admin_logged_in'):
         return jsonify({'error': 'unauthorized'}), 401
-    if ELECTION_PAUSED and ELECTION_PAUSED_AT:
-        elapsed = (datetime.datetime.now() - ELECTION_PAUSED_AT).total_seconds()
+    tenant = current_tenant()
+    if tenant.paused and tenant.paused_at:
+        elapsed = (datetime.datetime.now() - tenant.paused_at).total_seconds()
         return jsonify({'paused': True, 'elapsed_seconds': int(elapsed)})
     return jsonify({'paused': False, 'elapsed_seconds': 0})
 
-# Cache for Sheet data to improve performance
+# Seconds given to ballots already being committed when closing starts
+CLOSE_GRACE_SECONDS = float(os.environ.get('CLOSE_GRACE_SECONDS', 3))
+
+@app.route('/admin/close-election', methods=['POST'])
+def close_election():
+    # Stops voting at once; freezing, the final tally and the results file
+    # are written by a background job whose progress the dashboard shows
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+    tenant = current_tenant()
+    if ELECTION_MODE == 'booth':
+        flash('Close the election on the coordinator, not on a booth.', 'error')
+        return redirect(url_for('admin_dashboard'))
+    # The .closing file makes sure only one worker process closes the
+    # election, and tells the others to stop taking ballots meanwhile
+    marker = f"{final_results_path(tenant)}.closing"
+    try:
+        if tenant.final or os.path.exists(final_results_path(tenant)):
+            raise FileExistsError(marker)
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        flash('The election is already closed or being closed.', 'info')
+        return redirect(url_for('admin_dashboard'))
+    tenant.closing = True
+    try:
+        if hasattr(app.session_interface, 'invalidate_ballots'):
+            app.session_interface.invalidate_ballots(tenant.slug)
+        return start_job('close_election', 'Closing the election')
+    except Exception:
+        tenant.closing = False
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(marker)
+        raise
+
+def job_close_election(job):
+    tenant = current_tenant()
+    path = final_results_path(tenant)
+    marker = f"{path}.closing"
+    try:
+        if tenant.final or os.path.exists(path):
+            # Resumed after the results file was already written
+            tenant.final = tenant.final or FinalResults.load(path)
+            return {'closed': True, 'message': 'Election closed.'}
+        # Let ballots that were already being committed finish
+        job.progress(0, 4, 'Waiting for ballots being committed')
+        time.sleep(CLOSE_GRACE_SECONDS)
+        if coordinator:
+            # Booth ballots merged but not yet written must be in the count
+            job.progress(1, 4, 'Writing booth ballots')
+            while coordinator.flush_backend(limit=200):
+                pass
+            if coordinator.status()['unwritten']:
+                raise BackendUnavailable('booth ballots could not be written to the sheet')
+        job.progress(2, 4, 'Reading the final data')
+        frozen = getattr(db, 'freeze', lambda: False)()
+        try:
+            # Strict read: a sheet that fails raises, it never counts as empty
+            records = db.get_records_batch(['VOTERS', 'VOTES', 'POSTS', 'CANDIDATES'])
+            posts_candidates = build_posts_candidates(records['POSTS'], records['CANDIDATES'])
+            data = tally_results(posts_candidates['posts'], posts_candidates['candidates'],
+                                 records['VOTES'], records['VOTERS'])
+            # Each voter marked used has a ballot in VOTES; fewer ballots
+            # than that means the read came back short
+            voters = [v for v in records['VOTERS'] if not is_dummy(v)]
+            used = sum(1 for v in voters if str(v.get('Used', '')).upper() == 'YES')
+            if not voters:
+                raise ValueError('VOTERS read back empty, not closing')
+            if data['votes_cast'] < used:
+                raise ValueError(f"only {data['votes_cast']} ballots read for {used} voters marked used, not closing")
+            job.progress(3, 4, 'Writing the results file')
+            data.update(election=tenant.slug, name=tenant.name,
+                        closed_at=datetime.datetime.now().isoformat(timespec='seconds'),
+                        records={'voters': records['VOTERS'], 'votes': records['VOTES'],
+                                 'posts_candidates': posts_candidates, 'candidates_raw': records['CANDIDATES'],
+                                 'posts_raw': records['POSTS']})
+            tenant.final = FinalResults.create(path, data)
+        except Exception:
+            if frozen:
+                db.freeze(False)
+            raise
+        tenant.response_cache.invalidate()
+        tenant.tally.bump()
+        job.progress(4, 4)
+        return {'closed': True, 'message': f'Election closed. {data["votes_cast"]} ballots counted; '
+                                           f'results file SHA-256 {tenant.final.checksum[:16]}…'}
+    finally:
+        tenant.closing = False
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(marker)
+
+@app.route('/admin/final-results')
+def final_results_status():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    final = current_tenant().final
+    if not final:
+        return jsonify({'closed': False})
+    return jsonify(dict(final.summary(), closed=True, results=final.data['results']))
+
+# Cache for Sheet data to improve performance. Every election has its own,
+# bounded by max_bytes (estimated from the JSON size of each entry), with
+# the least recently used keys dropped first.
 class SheetCache:
-    def __init__(self):
-        self.data = {}
+    def __init__(self, max_bytes=None):
+        self.data = OrderedDict()
         self.expiry = {}
+        self.sizes = {}
+        self.size = 0
+        self.max_bytes = max_bytes
         self.ttl_config = {
             'posts_candidates': 300,  # 5 minutes
             'voters': 120,           # 2 minutes
@@ -71,58 +367,240 @@ class SheetCache:
 
     def get(self, key):
         if key in self.data and datetime.datetime.now() < self.expiry[key]:
+            self.data.move_to_end(key)
             return self.data[key]
         return None
 
+    def get_stale(self, key):
+        # Last value stored under key, even expired or invalidated; served
+        # when the backend cannot be reached
+        return self.data.get(key)
+
     def set(self, key, value):
+        self._drop(key)
+        size = len(json.dumps(value, default=str))
+        if self.max_bytes and size > self.max_bytes:
+            return
         self.data[key] = value
+        self.sizes[key] = size
+        self.size += size
         ttl = self.ttl_config.get(key, 30)  # Default 30 seconds
         self.expiry[key] = datetime.datetime.now() + datetime.timedelta(seconds=ttl)
+        while self.max_bytes and self.size > self.max_bytes:
+            self._drop(next(iter(self.data)))
     
     def invalidate(self, key):
+        # Expire now but keep the value as a fallback until it is replaced
+        if key in self.expiry:
+            self.expiry[key] = datetime.datetime.min
+
+    def _drop(self, key):
         self.data.pop(key, None)
         self.expiry.pop(key, None)
+        self.size -= self.sizes.pop(key, 0)
+
+init_http_cache(app)
+
+# Compiled templates on disk
+init_templates(app, os.environ.get('JINJA_CACHE_DIR', '.jinja_cache'))
 
-cache = SheetCache()
+# Opt-in request profiling, controlled from /admin/profiling
+profiler = SamplingProfiler(keep=int(os.environ.get('PROFILE_KEEP', 20)))
+init_profiler(app, profiler)
+
+# Token buckets and concurrency slots in front of the expensive public
+# routes; the voting routes keep a reserved share. Registered after
+# select_tenant so fallbacks can read the current election's caches.
+admission = AdmissionController(global_rate=float(os.environ.get('ADMISSION_RATE', 40)),
+                                global_burst=int(os.environ.get('ADMISSION_BURST', 200)),
+                                enabled=os.environ.get('ADMISSION', 'on') != 'off')
+init_admission(app, admission)
+
+@app.errorhandler(BackendUnavailable)
+def backend_unavailable(e):
+    # Sheets is down and no cached copy could stand in for it
+    print(f"Backend unavailable: {e}")
+    if request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'error': 'backend unavailable'})
+    else:
+        response = app.response_class('The election server cannot reach its data right now. Please try again shortly.',
+                                      mimetype='text/plain')
+    response.status_code = 503
+    response.headers['Retry-After'] = '30'
+    return response
+
+def results_snapshot():
+    entry = response_cache.latest('results')
+    return entry.respond() if entry else None
+
+admission.fallbacks['public_results'] = results_snapshot
+
+def invalidate_data(*keys, tenant=None):
+    # Drop cached sheet data and bump the tally generation so derived
+    # responses (results, analytics) get rebuilt
+    tenant = tenant or current_tenant()
+    for key in keys:
+        tenant.cache.invalidate(key)
+    tenant.tally.bump()
+
+def refresh_candidate_images():
+    # A photo finished downloading: rebuild candidate data in every election
+    for tenant in tenants.each():
+        invalidate_data('posts_candidates', tenant=tenant)
+
+# Local copies and thumbnails of candidate photos, shared by all elections
+image_store = ImageStore(os.environ.get('IMAGE_STORE_DIR', 'image_store'),
+                         on_ready=refresh_candidate_images)
+
+@app.route('/media/<path:filename>')
+def candidate_image(filename):
+    # Names are content hashes, so the bytes behind a URL never change
+    response = send_from_directory(image_store.root, filename, max_age=365 * 24 * 3600)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+# Sheets backing each cache key
+CACHE_SHEETS = {
+    'voters': ['VOTERS'],
+    'votes': ['VOTES'],
+    'posts_candidates': ['POSTS', 'CANDIDATES'],
+    'candidates_raw': ['CANDIDATES'],
+    'posts_raw': ['POSTS'],
+}
+
+def build_posts_candidates(post_records, candidate_records):
+    all_posts = db.get_all_posts(post_records)
+    candidates_map = db.get_candidates_by_post(candidate_records)
+    
+    # Serve candidate photos from the local image store once fetched
+    for cands in candidates_map.values():
+        for c in cands:
+            c['image_source'] = c['image']
+            c['image'] = image_store.display_url(c['image'])
+    
+    # Filter out posts that have no candidates assigned
+    valid_posts = [post for post in all_posts if post in candidates_map and candidates_map[post]]
+    return {'posts': valid_posts, 'candidates': candidates_map}
+
+def load_sheets(*keys, refresh=()):
+    # Fill every missing (or refreshed) cache key with one batched Sheets read
+    final = current_tenant().final
+    if final:
+        # Closed: everything comes from the frozen records
+        return {key: final.records[key] for key in keys}
+    loaded = {}
+    missing = []
+    for key in keys:
+        cached = None if key in refresh else cache.get(key)
+        if cached is not None:
+            loaded[key] = cached
+        else:
+            missing.append(key)
+    
+    if missing:
+        sheet_names = [name for key in missing for name in CACHE_SHEETS[key]]
+        # Used flags journalled before this read are already in the sheet
+        journal_offset = roster.journal_position() if 'voters' in missing and roster else None
+        turnout_mark = turnout.mark()
+        try:
+            records = db.get_records_batch(sheet_names)
+        except BackendUnavailable as e:
+            # Sheets is failing or too slow: serve the last copy, however old
+            stale = {key: cache.get_stale(key) for key in missing}
+            if any(value is None for value in stale.values()):
+                raise
+            print(f"Serving stale {', '.join(missing)}: {e}")
+            loaded.update(stale)
+            return loaded
+        for key in missing:
+            if key == 'posts_candidates':
+                value = build_posts_candidates(records['POSTS'], records['CANDIDATES'])
+            else:
+                value = records[CACHE_SHEETS[key][0]]
+                if key == 'voters':
+                    turnout.load_roster(value, turnout_mark)
+                if key == 'voters' and roster and value:
+                    # Swap the fresh roster in for every worker on this machine
+                    try:
+                        roster.publish(value, journal_offset)
+                    except OSError as e:
+                        print(f"Roster: could not publish: {e}")
+            # Only successful reads get here; a failed one raised above
+            cache.set(key, value)
+            loaded[key] = value
+    return loaded
 
 # Cached data access functions
 def get_cached_voters():
-    cached = cache.get('voters')
-    if cached:
-        return cached
-    voters = db.get_all_voters()
-    cache.set('voters', voters)
-    return voters
+    return load_sheets('voters')['voters']
+
+def lookup_voter(voter_id):
+    if not roster:
+        return db.get_voter_details(voter_id)
+    details = roster.lookup(voter_id)
+    if details is None:
+        # Not in the mapped roster (none built yet, or a newly added ID):
+        # read through the cache, which publishes a fresh roster
+        for r in get_cached_voters():
+            if str(r.get('VotingID')) == str(voter_id):
+                details = {'class': r.get('Class'), 'section': r.get('Section'), 'roll_no': r.get('RollNo'),
+                           'used': str(r.get('Used', 'NO')).upper() == 'YES'}
+                break
+        else:
+            # The cached copy may predate an ID issued moments ago: ask the
+            # sheet itself before turning the voter away
+            details = db.find_voter(voter_id)
+            if details:
+                invalidate_data('voters')
+    if details and not details['used'] and coordinator and coordinator.has_ballot(voter_id):
+        # Voted at a booth; the ballot may not be in VOTERS yet
+        details = dict(details, used=True)
+    return details
 
 def get_cached_votes():
-    cached = cache.get('votes')
-    if cached:
-        return cached
-    votes = db.get_all_votes()
-    cache.set('votes', votes)
-    return votes
+    return load_sheets('votes')['votes']
 
 def get_posts_and_candidates():
     # Use cache for performance
-    cached_data = cache.get('posts_candidates')
-    if cached_data:
-        return cached_data['posts'], cached_data['candidates']
-        
-    all_posts = db.get_all_posts()
-    candidates_map = db.get_candidates_by_post()
-    
-    # Filter out posts that have no candidates assigned
-    valid_posts = [post for post in all_posts if post in candidates_map and candidates_map[post]]
-    
-    # Store in cache
-    cache.set('posts_candidates', {'posts': valid_posts, 'candidates': candidates_map})
-    return valid_posts, candidates_map
+    data = load_sheets('posts_candidates')['posts_candidates']
+    return data['posts'], data['candidates']
+
+# --- MULTI-BOOTH MODE ---
+booth_node = None
+coordinator = None
+if ELECTION_MODE == 'booth':
+    # Sync threads have no request, so they use the one election directly
+    election = tenants.get(DEFAULT_TENANT)
+    booth_node = BoothNode(election.db, os.environ.get('COORDINATOR_URL', 'http://127.0.0.1:5000'),
+                           os.environ.get('BOOTH_ID', 'booth-1'), token=BOOTH_SYNC_TOKEN,
+                           interval=int(os.environ.get('BOOTH_SYNC_INTERVAL', 5)),
+                           on_change=lambda: invalidate_data('voters', 'votes', 'posts_candidates', tenant=election))
+    booth_node.start()
+elif ELECTION_MODE == 'coordinator':
+    election = tenants.get(DEFAULT_TENANT)
+    def coordinator_setup():
+        data = load_sheets('posts_raw', 'candidates_raw')
+        return {'POSTS': data['posts_raw'], 'CANDIDATES': data['candidates_raw']}
+    coordinator = SyncCoordinator(election.db, os.environ.get('COORDINATOR_DB_PATH', 'coordinator.db'),
+                                  get_cached_voters, coordinator_setup,
+                                  on_change=lambda: invalidate_data('votes', 'voters', tenant=election),
+                                  roster=election.roster)
+    coordinator.start()
+    app.register_blueprint(sync_blueprint(coordinator, BOOTH_SYNC_TOKEN))
+
+@app.route('/admin/booth/status')
+def booth_status():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    if not booth_node:
+        return jsonify({'mode': ELECTION_MODE})
+    return jsonify(dict(booth_node.status(), mode=ELECTION_MODE))
 
 @app.route('/admin/print/students')
 def print_students():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
-    voters = db.get_all_voters()
+    voters = get_cached_voters()
     students = [v for v in voters if str(v.get('Class')) != 'TEACHER']
     return render_template('admin/print_voters.html', title="Students", voters=students)
 
@@ -130,7 +608,7 @@ def print_students():
 def print_teachers():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
-    voters = db.get_all_voters()
+    voters = get_cached_voters()
     teachers = [v for v in voters if str(v.get('Class')) == 'TEACHER']
     return render_template('admin/print_voters.html', title="Teachers", voters=teachers)
 
@@ -148,7 +626,7 @@ def add_post():
     post_name = request.form.get('post_name')
     if post_name:
         db.add_post(post_name)
-        cache.data.pop('posts_candidates', None) # Invalidate cache
+        invalidate_data('posts_candidates')
         flash(f'Post "{post_name}" created successfully.', 'success')
     else:
         flash('Post name is required.', 'error')
@@ -177,6 +655,8 @@ def voter_gen():
             'Section': section,
             'RollNo': roll_no
         }]):
+            # The new ID must be found at /vote straight away
+            invalidate_data('voters')
             flash('Voter Identity provisioned successfully.', 'success')
             return render_template('voter_gen/success.html', voter_id=voter_id)
         else:
@@ -192,10 +672,11 @@ def verify_voter():
 @app.route('/vote', methods=['GET', 'POST'])
 def vote():
     if request.method == 'POST':
-        voter_id = request.form.get('voter_id')
-        # Support 4-character alphanumeric IDs (like T001) or numeric IDs
-        if voter_id and len(voter_id) == 4:
-            details = db.get_voter_details(voter_id)
+        voter_id = normalise_id(request.form.get('voter_id'))
+        # Shape and check digit are verified here, so a mistyped ID never
+        # reaches the roster (legacy 4-character IDs pass during migration)
+        if is_valid_id(voter_id):
+            details = lookup_voter(voter_id)
             if details:
                 if not details['used']:
                     session['pending_voter_id'] = voter_id
@@ -204,17 +685,17 @@ def vote():
                 else:
                     flash('Security Violation: ID already utilized.', 'error')
             else:
-                flash('Identification Error: 4-character ID not found.', 'error')
+                flash('Identification Error: Voter ID not found.', 'error')
         else:
-            flash('Input Error: Voter ID must be exactly 4 characters.', 'error')
+            flash('Input Error: Voter ID is not valid. Please check it for typos.', 'error')
         return redirect(url_for('vote'))
-    return render_template('voting_system/index.html')
+    return render_template('voting_system/index.html', id_length=ID_LENGTH)
 
 @app.route('/start-ballot', methods=['POST'])
 def start_ballot():
     if 'pending_voter_id' in session:
         voter_id = session.pop('pending_voter_id')
-        details = db.get_voter_details(voter_id)
+        details = lookup_voter(voter_id)
         session['voter_id'] = voter_id
         session['voter_details'] = details
         session['session_timestamp'] = datetime.datetime.now().strftime('%Y%m%d_%HH%MM%SS')
@@ -258,9 +739,15 @@ def voting_flow(step):
         session['current_votes'] = votes
         return redirect(url_for('voting_flow', step=step+1))
         
+    # Candidate cards only change with this post's candidates; a reload that
+    # leaves them as they were keeps the rendered cards
+    candidate_cards = fragments.get_or_render(
+        ('candidate_cards', current_post, data_digest(candidates_map[current_post])),
+        lambda: render_template('voting_system/_candidate_cards.html',
+                                candidates=candidates_map[current_post]))
     return render_template('voting_system/step.html', 
                           post=current_post, 
-                          candidates=candidates_map[current_post], 
+                          candidate_cards=candidate_cards, 
                           step=step, 
                           total=len(posts))
 
@@ -277,33 +764,44 @@ def confirm_votes():
             flash('Session timeout. Please try again.', 'error')
             return redirect(url_for('vote'))
 
+        # The ID may have been used since /vote checked it: at a booth, or
+        # in another browser
+        current = lookup_voter(voter_id)
+        if current and current['used']:
+            session.pop('voter_id', None)
+            session.pop('current_votes', None)
+            flash('Security Violation: ID already utilized.', 'error')
+            return redirect(url_for('vote'))
+
         # Save votes and mark used in Sheets
         try:
             voter_details = session.get('voter_details', {})
             is_dummy = str(voter_details.get('Section', '')).upper() == 'DUMMY'
             
-            # Generate 3-digit verification code
-            v_code = ''.join(random.choices(string.digits, k=3))
+            # Receipt code, unique among every receipt indexed so far
+            v_code = receipts.new_code()
+            timestamp = datetime.datetime.now().isoformat()
             
             # Store vote for all IDs (including dummy)
-            stored = db.store_vote(voter_id, votes, v_code)
+            stored = db.store_vote(voter_id, votes, v_code, timestamp)
             marked = db.mark_voting_id_used(voter_id)
+            if marked and roster:
+                roster.mark_used(voter_id)
             
+            if stored:
+                receipts.add(v_code, voter_id, timestamp)
+                turnout.record(voter_id, voter_details, session.get('session_timestamp'))
             if stored or marked:
                 # Invalidate cache after vote is stored
-                cache.invalidate('votes')
-                cache.invalidate('voters')
-                cache.invalidate('posts_candidates')
-                cache.invalidate('analytics') # Force analytics to refresh
-                
+                invalidate_data('votes', 'voters', 'posts_candidates')
                 
                 session.pop('voter_id', None)
                 session.pop('current_votes', None)
                 if is_dummy:
-                    flash(f'Demo Vote recorded. Verification Code: {v_code}', 'success')
+                    flash(f'Demo Vote recorded. Verification Code: {format_code(v_code)}', 'success')
                 else:
                     flash('Vote recorded successfully.', 'success')
-                return render_template('voting_system/thanks.html', v_code=v_code)
+                return render_template('voting_system/thanks.html', v_code=format_code(v_code))
             else:
                 flash('Transmission failure. Please contact supervisor.', 'error')
         except Exception as e:
@@ -313,6 +811,17 @@ def confirm_votes():
         
     return render_template('voting_system/confirm.html', votes=session['current_votes'])
 
+@app.route('/verify-receipt', methods=['GET', 'POST'])
+def verify_receipt():
+    # Public receipt check, answered from the in-memory index
+    code = request.values.get('code', '').strip()
+    result = receipts.lookup(code) if code else None
+    if request.accept_mimetypes.best == 'application/json':
+        if not code:
+            return jsonify({'error': 'code required'}), 400
+        return jsonify(result)
+    return render_template('voting_system/verify_receipt.html', code=format_code(code), result=result)
+
 # --- ADMIN PANEL ---
 import smtplib
 from email.mime.text import MIMEText
@@ -326,8 +835,6 @@ def recover_id():
         section = request.form.get('section', '').upper()
         roll_no = request.form.get('roll_no')
         
-        from google_sheets import GoogleSheetsDB
-        db = GoogleSheetsDB()
         voter = db.get_voter_by_details(class_val, section, roll_no)
         
         if voter:
@@ -340,13 +847,22 @@ def recover_id():
 
 import time
 
+# Session recordings are re-encoded, checksummed and indexed in worker
+# processes after upload (recordings.py); RECORDING_WORKERS caps how many run
+recordings = RecordingProcessor(SESSIONS_DIR, max_workers=int(os.environ.get('RECORDING_WORKERS', 1)),
+                                ffmpeg=os.environ.get('FFMPEG'),
+                                height=int(os.environ.get('RECORDING_HEIGHT', 360)))
+recordings.resume()
+
 def cleanup_old_videos():
-    secure_dir = 'secure_sessions'
+    secure_dir = SESSIONS_DIR
     if not os.path.exists(secure_dir):
         return
     now = time.time()
     for f in os.listdir(secure_dir):
         file_path = os.path.join(secure_dir, f)
+        if f == RECORDINGS_INDEX:
+            continue
         if os.stat(file_path).st_mtime < now - 24 * 3600:
             try:
                 os.remove(file_path)
@@ -367,8 +883,11 @@ def upload_session_video():
     try:
         meta = json.loads(metadata)
         filename = f"VOTESESSION_{meta['class']}{meta['section']}_{meta['roll']}_{meta['timestamp']}.webm"
-        save_path = os.path.join('secure_sessions', filename)
+        save_path = os.path.join(SESSIONS_DIR, os.path.basename(filename))
         video.save(save_path)
+        recordings.submit(save_path, {'voter_id': meta.get('voter_id'), 'class': meta.get('class'),
+                                      'section': meta.get('section'), 'roll': meta.get('roll'),
+                                      'timestamp': meta.get('timestamp'), 'tenant': current_tenant().slug})
         
         # Lightweight logging
         with open('session_log.txt', 'a') as f:
@@ -378,6 +897,17 @@ def upload_session_video():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/admin/recordings')
+def recordings_status():
+    # Post-processing backlog and totals; ?voter_id= lists that voter's files
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    status = recordings.status()
+    if request.args.get('voter_id'):
+        status['files'] = [e for e in recordings.lookup(normalise_id(request.args['voter_id']))
+                           if e.get('tenant') in (None, current_tenant().slug)]
+    return jsonify(status)
+
 @app.route('/admin/voters/search')
 def search_voters():
     if not session.get('admin_logged_in'):
@@ -395,20 +925,70 @@ def reset_voter():
         return jsonify({'error': 'unauthorized'}), 401
     voter_id = request.json.get('voter_id') if request.is_json else request.form.get('voter_id')
     if db.reset_voter_usage(voter_id):
-        cache.invalidate('voters')
+        if roster:
+            roster.mark_used(voter_id, False)
+        invalidate_data('voters')
         return jsonify({'success': True})
     return jsonify({'success': False}), 500
 
+@app.route('/admin/voters/status', methods=['POST'])
+def bulk_voter_status():
+    # Set or clear the Used flag of many voters at once: {"used": false,
+    # "ids": [...] or "ids": "pasted booth log"} or {"used": false,
+    # "filter": {"class": "9", "section": "A,B"}}. "dry_run" only resolves.
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    if not hasattr(db, 'set_voters_used'):
+        return jsonify({'error': 'voter status can only be changed on the central app'}), 400
+    data = request.get_json(silent=True) or {}
+    used = data.get('used')
+    if not isinstance(used, bool):
+        return jsonify({'error': 'used must be true or false'}), 400
+    ids, voter_filter = data.get('ids'), data.get('filter')
+    if bool(ids) == bool(voter_filter):
+        return jsonify({'error': 'give either ids or filter'}), 400
+    if ids:
+        if isinstance(ids, str):
+            ids = re.split(r'[\s,;]+', ids)
+        ids = [vid for vid in (normalise_id(v) for v in ids) if vid]
+    else:
+        filters = ExportFilters({key: ','.join(value) if isinstance(value, list) else str(value or '')
+                                 for key, value in voter_filter.items() if key in ('class', 'section')})
+        if not filters.by_voter:
+            return jsonify({'error': 'filter needs a class or section'}), 400
+        ids = [str(v.get('VotingID')) for v in get_cached_voters() if filters.matches_voter(v)]
+    if data.get('dry_run'):
+        return jsonify({'used': used, 'requested': len(ids), 'dry_run': True, 'ids': ids})
+    
+    report = db.set_voters_used(ids, used)
+    for vid, status in report.items():
+        if status in ('updated', 'unchanged') and roster:
+            roster.mark_used(vid, used)
+    if any(status == 'updated' for status in report.values()):
+        invalidate_data('voters')
+    summary = {}
+    for status in report.values():
+        summary[status] = summary.get(status, 0) + 1
+    return jsonify({'used': used, 'requested': len(ids), 'summary': summary, 'results': report})
+
 @app.route('/admin/analytics')
 def get_analytics():
     if not session.get('admin_logged_in'):
         return jsonify({'error': 'unauthorized'}), 401
     
-    # Try to get from cache first
-    cached_analytics = cache.get('analytics')
-    if cached_analytics:
-        return jsonify(cached_analytics)
+    final = current_tenant().final
+    if final:
+        analytics_data = {'turnout': len(final.records['votes']), 'total_eligible': len(final.records['voters']),
+                          'results': final.data['results'], 'winners': final.data['winners'], 'closed': True}
+        return final.respond('analytics', lambda: json.dumps(analytics_data), mimetype='application/json',
+                             cache_control='private, no-cache')
+    
+    # Unchanged tally generation: serve the cached JSON (or a 304)
+    cached = response_cache.get('analytics', tally.version)
+    if cached:
+        return cached.respond('private, no-cache')
     
+    version = tally.version
     votes = get_cached_votes()
     voters = get_cached_voters()
     
@@ -440,10 +1020,97 @@ def get_analytics():
         'results': results
     }
     
-    # Cache analytics for 30 seconds to prevent hammering, but allow manual invalidate
-    cache.set('analytics', analytics_data)
-    
-    return jsonify(analytics_data)
+    entry = response_cache.put('analytics', version, analytics_data,
+                               lambda: json.dumps(analytics_data), mimetype='application/json')
+    return entry.respond('private, no-cache')
+
+@app.route('/admin/analytics/turnout')
+def turnout_feed():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    try:
+        minutes = min(max(int(request.args.get('minutes', 60)), 1), turnout.per_minute.size)
+    except ValueError:
+        return jsonify({'error': 'minutes must be a number'}), 400
+    # Makes sure eligible/voted counts have been loaded from VOTERS once
+    get_cached_voters()
+    response = jsonify(turnout.feed(minutes))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        enabled = data.get('enabled')
+        if isinstance(enabled, str):
+            enabled = enabled.lower() in ['1', 'true', 'yes', 'on']
+        try:
+            profiler.configure(enabled=enabled,
+                               sample_rate=data.get('sample_rate'),
+                               slow_ms=data.get('slow_ms'),
+                               keep=data.get('keep'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'invalid profiling settings'}), 400
+    return jsonify(profiler.status())
+
+@app.route('/admin/profiling/<int:profile_id>.folded')
+def download_profile(profile_id):
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    record = profiler.get(profile_id)
+    if not record:
+        return jsonify({'error': 'profile not found'}), 404
+    filename = f"profile_{profile_id}_{record['reason']}.folded"
+    return app.response_class(profiler.folded(record), mimetype='text/plain',
+                              headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/admin/traffic', methods=['GET', 'POST'])
+def traffic_settings():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        enabled = data.get('enabled')
+        if isinstance(enabled, str):
+            enabled = enabled.lower() in ['1', 'true', 'yes', 'on']
+        if enabled:
+            path = data.get('path') or f"traffic_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+            try:
+                traffic.start(os.path.basename(path))
+            except OSError as e:
+                return jsonify({'error': f'could not open recording: {e}'}), 400
+        elif enabled is not None:
+            traffic.stop()
+    return jsonify(traffic.status())
+
+@app.route('/admin/tenants')
+def tenants_status():
+    # Operator view of every loaded election, for the default election's admins
+    if not session.get('admin_logged_in') or current_tenant().slug != DEFAULT_TENANT:
+        return jsonify({'error': 'unauthorized'}), 401
+    return jsonify(tenants.status())
+
+@app.route('/admin/backend')
+def backend_status():
+    # Circuit breaker state, calls refused while it was open and the
+    # current per-operation deadlines of this election's Sheets client
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    status = getattr(db, 'backend_status', lambda: None)()
+    if status is None:
+        return jsonify({'state': 'unguarded', 'backend': type(db._get_current_object()).__name__})
+    return jsonify(status)
+
+@app.route('/admin/admission')
+def admission_status():
+    # Requests admitted and shed per cost class, global tokens left and
+    # busy concurrency slots
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    return jsonify(admission.status())
 
 @app.route('/status')
 def app_status():
@@ -504,7 +1171,10 @@ def admin_login():
             return render_template('admin/login.html', otp_sent=True)
             
         if password:
-            if password in ADMIN_PASSWORDS:
+            passwords = tenant_admin_passwords(current_tenant())
+            if not passwords:
+                flash('Access Denied: No administrative password is configured for this election.', 'error')
+            elif password in passwords:
                 generated_otp = ''.join(random.choices(string.digits, k=6))
                 print(f"ADMIN OTP: {generated_otp}")
                 session['admin_otp'] = generated_otp
@@ -523,10 +1193,14 @@ def admin_dashboard():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
     
-    posts, candidates_map = get_posts_and_candidates()
-    all_candidates_raw = db.get_all_records_safe('CANDIDATES')
+    # Fetch every sheet the dashboard needs in a single round trip
+    data = load_sheets('posts_candidates', 'candidates_raw', 'voters', 'votes',
+                       refresh=('candidates_raw', 'voters', 'votes'))
+    posts = data['posts_candidates']['posts']
+    candidates_map = data['posts_candidates']['candidates']
+    all_candidates_raw = data['candidates_raw']
     
-    voters = db.get_all_voters()
+    voters = data['voters']
     teachers = [v for v in voters if str(v.get('Class')) == 'TEACHER']
     students = [v for v in voters if str(v.get('Class')) != 'TEACHER']
     
@@ -534,48 +1208,52 @@ def admin_dashboard():
                           voters=voters, 
                           students=students,
                           teachers=teachers,
-                          votes=db.get_all_votes(),
+                          votes=data['votes'],
                           candidates=candidates_map,
                           all_candidates_raw=all_candidates_raw,
                           posts=posts,
-                          election_paused=ELECTION_PAUSED)
+                          election_paused=current_tenant().paused,
+                          final=current_tenant().final.summary() if current_tenant().final else None)
 
-@app.route('/admin/teachers/generate')
-def generate_teachers():
-    if not session.get('admin_logged_in'):
-        return redirect(url_for('admin_login'))
-    
-    voters = db.get_all_voters()
-    teacher_ids = {v.get('VotingID') for v in voters if str(v.get('Class')) == 'TEACHER'}
+# --- BACKGROUND JOBS ---
+# Long admin operations run on the job runner instead of inside the request.
+# Every job re-reads the sheet first, so a retry or resume never duplicates rows.
+def job_generate_teachers(job):
+    # Strict read: a failed read must fail the job, not look like no teachers
+    voters = db.read_records('VOTERS')
+    # Matched on roll number so teachers holding legacy T001-style IDs are kept
+    teacher_rolls = {str(v.get('RollNo')) for v in voters if str(v.get('Class')) == 'TEACHER'}
     
     new_teachers = []
     for i in range(1, 101):
-        # Format: T001, T002, etc. (exactly 4 characters)
-        t_id = f"T{str(i).zfill(3)}"
-        if t_id not in teacher_ids:
+        # T + sequence number + check digit, e.g. T000013
+        if str(i) not in teacher_rolls:
             new_teachers.append({
-                'VotingID': t_id,
+                'VotingID': make_id(i, TEACHER_PREFIX),
                 'Class': 'TEACHER',
                 'Section': 'STAFF',
                 'RollNo': str(i)
             })
     
-    if new_teachers:
-        # Process in chunks of 20 to be safe
-        chunk_size = 20
+    if not new_teachers:
+        return {'created': 0, 'message': 'Teachers already exist.'}
+    
+    # Process in chunks of 20 to be safe
+    chunk_size = 20
+    job.progress(0, len(new_teachers))
+    try:
         for i in range(0, len(new_teachers), chunk_size):
             chunk = new_teachers[i:i + chunk_size]
-            db.add_voters_batch(chunk)
-        flash(f'{len(new_teachers)} Teachers generated successfully (4-digit IDs).', 'success')
-    else:
-        flash('Teachers already exist.', 'info')
-    return redirect(url_for('admin_dashboard'))
+            if not db.add_voters_batch(chunk):
+                raise RuntimeError('Teacher batch insert failed')
+            job.progress(i + len(chunk), len(new_teachers))
+    finally:
+        # Chunks written before a failure are real IDs too
+        invalidate_data('voters')
+    return {'created': len(new_teachers),
+            'message': f'{len(new_teachers)} Teachers generated successfully ({ID_LENGTH}-character IDs).'}
 
-@app.route('/admin/auto-populate-candidates')
-def auto_populate_candidates():
-    if not session.get('admin_logged_in'):
-        return redirect(url_for('admin_login'))
-    
+def job_auto_populate_candidates(job):
     candidates_list = [
         # PRIME MINISTER
         ('PRIME MINISTER', 'Aayush Patil', '10'),
@@ -623,37 +1301,180 @@ def auto_populate_candidates():
     
     # Reset/Ensure posts
     posts_to_ensure = ['PRIME MINISTER', 'CULTURAL MINISTER', 'SPORTS MINISTER', 'FINANCE MINISTER', 'INFORMATION MINISTER', 'DISCIPLINE MINISTER']
+    job.progress(0, 2, 'Ensuring posts')
+    if not db.add_posts(posts_to_ensure):
+        raise RuntimeError('Post insert failed')
+    job.progress(1)
     
-    # In a real scenario we might want to clear existing data, but for now we just append
-    for p in posts_to_ensure:
-        db.add_post(p)
-            
-    # Batch append candidates
-    db.add_candidates_batch(candidates_list)
-            
-    cache.data.pop('posts_candidates', None)
-    flash(f'New candidate list synchronized to Google Sheets.', 'success')
-        
+    # Diff the list against the sheet and apply only the changes
+    if not db.add_candidates_batch(candidates_list):
+        raise RuntimeError('Candidate sync failed')
+    job.progress(2, message='Candidates synchronized')
+    invalidate_data('posts_candidates')
+    return {'created': len(candidates_list),
+            'message': 'New candidate list synchronized to Google Sheets.'}
+
+def job_generate_dummy_ids(job):
+    existing = {str(v.get('RollNo')) for v in db.read_records('VOTERS') if str(v.get('Section')).upper() == 'DUMMY'}
+    new_dummies = []
+    for i in range(1, 11):
+        # Demo IDs: D + sequence number + check digit, e.g. D000013
+        if str(i) in existing:
+            continue
+        new_dummies.append({
+            'VotingID': make_id(i, DUMMY_PREFIX),
+            'Class': 'TEST',
+            'Section': 'DUMMY',
+            'RollNo': str(i)
+        })
+    
+    try:
+        if new_dummies and not db.add_voters_batch(new_dummies):
+            raise RuntimeError('Dummy ID insert failed')
+    finally:
+        invalidate_data('voters')
+    return {'created': len(new_dummies),
+            'message': f'{len(new_dummies)} Dummy IDs generated for testing.'}
+
+jobs = JobRunner(state_file=os.environ.get('JOBS_STATE_FILE', 'jobs_state.json'))
+JOB_EVENTS_IDLE = int(os.environ.get('JOB_EVENTS_IDLE', 60))
+def while_open(fn):
+    # Jobs queued before the election closed must not write after it
+    def run(job, **params):
+        tenant = current_tenant()
+        if load_final_results(tenant) or tenant.closing:
+            raise ValueError('the election is closed')
+        return fn(job, **params)
+    run.__name__ = fn.__name__
+    return run
+
+jobs.register('generate_teachers', tenants.bind(while_open(job_generate_teachers)))
+jobs.register('auto_populate_candidates', tenants.bind(while_open(job_auto_populate_candidates)))
+jobs.register('generate_dummy_ids', tenants.bind(while_open(job_generate_dummy_ids)))
+# A failed close is looked at by an admin and started again by hand
+jobs.register('close_election', tenants.bind(job_close_election), max_attempts=1)
+jobs.resume_interrupted()
+
+def start_job(kind, label):
+    # Jobs run against the election that started them
+    job = jobs.submit(kind, {'tenant': current_tenant().slug})
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job), 202
+    flash(f'{label} started in the background. Progress is shown below.', 'info')
     return redirect(url_for('admin_dashboard'))
 
+@app.route('/admin/jobs')
+def list_jobs():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    return jsonify(jobs.recent(tenant=current_tenant().slug))
+
+def tenant_job(job_id):
+    job = jobs.get(job_id)
+    if job and job['params'].get('tenant', DEFAULT_TENANT) == current_tenant().slug:
+        return job
+    return None
+
+@app.route('/admin/jobs/<job_id>')
+def job_status(job_id):
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    job = tenant_job(job_id)
+    if not job:
+        return jsonify({'error': 'job not found'}), 404
+    return jsonify(job)
+
+@app.route('/admin/jobs/<job_id>/events')
+def job_events(job_id):
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    if not tenant_job(job_id):
+        return jsonify({'error': 'job not found'}), 404
+    
+    def stream():
+        # Server-sent events: push the job every time it changes. Ends when
+        # the job finishes, is interrupted, or has not changed for
+        # JOB_EVENTS_IDLE seconds (still queued behind other jobs, or its
+        # worker died); the client can reconnect for more.
+        last_update = None
+        idle_since = time.monotonic()
+        while True:
+            job = jobs.get(job_id)
+            if not job:
+                return
+            if job['updated'] != last_update:
+                last_update = job['updated']
+                idle_since = time.monotonic()
+                yield f"data: {json.dumps(job)}\n\n"
+            if job['status'] in ['done', 'failed', 'interrupted']:
+                return
+            if time.monotonic() - idle_since > JOB_EVENTS_IDLE:
+                return
+            time.sleep(0.5)
+    return app.response_class(stream(), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache'})
+
+@app.route('/admin/teachers/generate')
+def generate_teachers():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+    return start_job('generate_teachers', 'Teacher ID generation')
+
+@app.route('/admin/auto-populate-candidates')
+def auto_populate_candidates():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+    return start_job('auto_populate_candidates', 'Candidate synchronization')
+
 @app.route('/admin/print/all')
 def print_all():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
     
-    voters = get_cached_voters()
+    data = load_sheets('voters', 'posts_candidates', 'votes')
+    voters = data['voters']
     students = [v for v in voters if str(v.get('Class')) != 'TEACHER' and str(v.get('Section')).upper() != 'DUMMY']
     teachers = [v for v in voters if str(v.get('Class')) == 'TEACHER']
     
-    posts, candidates_map = get_posts_and_candidates()
-    votes = get_cached_votes()
+    posts = data['posts_candidates']['posts']
+    candidates_map = data['posts_candidates']['candidates']
+    votes = data['votes']
     
     return render_template('admin/print_all.html', 
                           students=students,
                           teachers=teachers,
                           posts=posts,
                           candidates_map=candidates_map,
-                          votes=votes)
+                          votes=votes,
+                          final=current_tenant().final)
+
+@app.route('/admin/export/<dataset>.<fmt>')
+def export_data(dataset, fmt):
+    # Streams a whole sheet (or computed results) page by page; see exports.py
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'unauthorized'}), 401
+    if dataset not in DATASETS or fmt not in FORMATS:
+        return jsonify({'error': 'unknown export', 'datasets': sorted(DATASETS), 'formats': sorted(FORMATS)}), 404
+    try:
+        filters = ExportFilters(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'invalid export parameters: {e}'}), 400
+    
+    tenant = current_tenant()
+    voters = voter_lookup(get_cached_voters()) if filters.by_voter or dataset == 'results' else {}
+    if dataset == 'results':
+        filters.cursor, filters.limit = 2, None
+        headers, records = iter_results(tenant.db, filters, voters, get_posts_and_candidates()[1])
+    else:
+        headers, records = iter_records(tenant.db, dataset, filters, voters)
+    
+    meta = {'dataset': dataset, 'election': tenant.slug, 'filters': filters.describe(),
+            'exported_at': datetime.datetime.now().isoformat()}
+    filename = f"{tenant.slug}_{dataset}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return app.response_class(stream_with_context(stream_export(fmt, headers, records, meta)),
+                              mimetype=FORMATS[fmt],
+                              headers={'Content-Disposition': f'attachment; filename={filename}',
+                                       'Cache-Control': 'no-store'})
 
 @app.route('/admin/print/dummies')
 def print_dummies():
@@ -667,21 +1488,7 @@ def print_dummies():
 def generate_dummy_ids():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
-    
-    new_dummies = []
-    for i in range(1, 11):
-        # 4-digit Demo IDs (e.g., 0001, 0002)
-        d_id = str(i).zfill(4)
-        new_dummies.append({
-            'VotingID': d_id,
-            'Class': 'TEST',
-            'Section': 'DUMMY',
-            'RollNo': str(i)
-        })
-    
-    db.add_voters_batch(new_dummies)
-    flash(f'{len(new_dummies)} 4-digit Dummy IDs generated for testing.', 'success')
-    return redirect(url_for('admin_dashboard'))
+    return start_job('generate_dummy_ids', 'Dummy ID generation')
 
 @app.route('/admin/candidates/add', methods=['POST'])
 def add_candidate():
@@ -693,10 +1500,18 @@ def add_candidate():
     motto = request.form.get('motto', '')
     active = request.form.get('active', '10') # Default to 10 (Main)
     
+    upload = request.files.get('image_file')
+    if upload and upload.filename:
+        try:
+            image_url = image_store.ingest(upload.read())
+        except ValueError:
+            flash('Unsupported image file. Use PNG, JPEG, GIF or WebP.', 'error')
+            return redirect(url_for('admin_dashboard'))
+    
     if post and name:
-        result = db.add_candidates_batch([(post, name, active)])
+        result = db.upsert_candidate(post, name, active, image_url, motto)
         if result:
-            cache.data.pop('posts_candidates', None) # Invalidate cache
+            invalidate_data('posts_candidates')
             flash(f'Candidate "{name}" added successfully.', 'success')
         else:
             flash(f'Failed to add candidate "{name}" to Google Sheets.', 'error')
@@ -709,59 +1524,44 @@ def delete_candidate(candidate_id):
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
     db.delete_candidate(candidate_id)
-    cache.data.pop('posts_candidates', None) # Invalidate cache
+    invalidate_data('posts_candidates')
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/results')
 def public_results():
-    posts, candidates_map = get_posts_and_candidates()
-    
-    # Bypass cache for results page to show real-time data
-    all_votes = db.get_all_votes()
-    all_voters = db.get_all_voters()
-    
-    # Update cache in background
-    cache.set('votes', all_votes)
-    cache.set('voters', all_voters)
-    
-    # Get list of dummy voter IDs to exclude from counting
-    dummy_voter_ids = set(
-        v.get('VotingID') for v in all_voters 
-        if str(v.get('Section', '')).upper() == 'DUMMY'
-    )
+    final = current_tenant().final
+    if final:
+        return final.respond('results', lambda: render_final_results(final), cache_control='public, max-age=300')
+    # Polls within the same tally generation share one computed page
+    cached = response_cache.get('results', tally.version)
+    if cached:
+        return cached.respond()
     
-    # Filter out dummy votes for counting
-    real_votes = [v for v in all_votes if v.get('VotingID') not in dummy_voter_ids]
-    real_voters = [v for v in all_voters if str(v.get('Section', '')).upper() != 'DUMMY']
+    version = tally.version
+    # Bypass cache for votes and voters to show real-time data; the refreshed
+    # values land back in the cache for the other pages
+    data = load_sheets('posts_candidates', 'votes', 'voters', refresh=('votes', 'voters'))
+    posts = data['posts_candidates']['posts']
+    candidates_map = data['posts_candidates']['candidates']
+    # Demo ballots from DUMMY IDs are left out of every count
+    context = dict(tally_results(posts, candidates_map, data['votes'], data['voters']),
+                   candidates_map=candidates_map)
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    total_voters = len(real_voters)
-    votes_cast = len(real_votes)
-    votes_remaining = total_voters - votes_cast
+    def render_results():
+        # response_cache already renders this once per tally version
+        results_tables = render_template('_results_tables.html', **context)
+        return render_template('results.html', now=now, results_tables=results_tables, **context)
     
-    results = {}
-    for post in posts:
-        post_results = {}
-        
-        for candidate in candidates_map.get(post, []):
-            name = candidate['name']
-            vote_count = 0
-            for vote_record in real_votes:
-                try:
-                    val = int(vote_record.get(name, 0))
-                    vote_count += val
-                except (ValueError, TypeError):
-                    pass
-            post_results[name] = vote_count
-        
-        results[post] = post_results
+    entry = response_cache.put('results', version, context, render_results)
+    return entry.respond()
 
-    return render_template('results.html', 
-                          results=results, 
-                          total_voters=total_voters,
-                          votes_cast=votes_cast,
-                          votes_remaining=votes_remaining,
-                          candidates_map=candidates_map,
-                          now=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+def render_final_results(final):
+    context = {key: final.data[key] for key in ('results', 'winners', 'total_voters', 'votes_cast', 'votes_remaining')}
+    context['candidates_map'] = final.records['posts_candidates']['candidates']
+    results_tables = render_template('_results_tables.html', **context)
+    return render_template('results.html', now=final.data['closed_at'], results_tables=results_tables,
+                           final=final.summary(), **context)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,155 @@
+import sys
+import time
+import random
+import threading
+import datetime
+from collections import Counter, deque
+from flask import g, request
+
+
+class RequestProfile:
+    def __init__(self, ident, sampled):
+        self.ident = ident
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+
+
+class SamplingProfiler:
+    # Statistical profiler: while enabled, a background thread snapshots the
+    # stack of every in-flight request thread every `interval` seconds. A
+    # request's samples are kept if it was picked by `sample_rate` or ran
+    # longer than `slow_ms`. Disabled, the only cost is one flag check.
+    def __init__(self, interval=0.005, keep=20):
+        self.enabled = False
+        self.interval = interval
+        self.sample_rate = 0.05
+        self.slow_ms = 1000
+        self.active = {}
+        self.profiles = deque(maxlen=keep)
+        self.lock = threading.Lock()
+        # Held by the sampler for each tick; a profile taken out of `active`
+        # under it gets no more samples, so its stacks can be read safely
+        self.sample_lock = threading.Lock()
+        self.thread = None
+        self.next_id = 1
+
+    def configure(self, enabled=None, sample_rate=None, slow_ms=None, keep=None):
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if slow_ms is not None:
+            self.slow_ms = max(int(slow_ms), 0)
+        if keep is not None and int(keep) != self.profiles.maxlen:
+            self.profiles = deque(self.profiles, maxlen=max(int(keep), 1))
+        if enabled is not None:
+            self.enabled = bool(enabled)
+            if self.enabled:
+                self._ensure_sampler()
+            else:
+                with self.sample_lock:
+                    self.active.clear()
+
+    def _ensure_sampler(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.enabled:
+            if self.active:
+                frames = sys._current_frames()
+                with self.sample_lock:
+                    for ident, profile in self.active.items():
+                        frame = frames.get(ident)
+                        if frame is not None:
+                            profile.stacks[self._fold(frame)] += 1
+                del frames
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _fold(frame):
+        # Root-first "file:function:line;..." as used by flamegraph.pl/speedscope
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            filename = code.co_filename.rsplit('/', 1)[-1]
+            parts.append(f"{filename}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ';'.join(reversed(parts))
+
+    def start_request(self):
+        if not self.enabled:
+            return None
+        ident = threading.get_ident()
+        profile = RequestProfile(ident, random.random() < self.sample_rate)
+        with self.sample_lock:
+            self.active[ident] = profile
+        return profile
+
+    def finish_request(self, profile, method, path, status):
+        with self.sample_lock:
+            self.active.pop(profile.ident, None)
+        duration_ms = (time.perf_counter() - profile.started) * 1000
+        slow = duration_ms >= self.slow_ms
+        if not (profile.sampled or slow) or not profile.stacks:
+            return None
+        with self.lock:
+            record = {
+                'id': self.next_id,
+                'method': method,
+                'path': path,
+                'status': status,
+                'duration_ms': round(duration_ms, 1),
+                'reason': 'slow' if slow else 'sampled',
+                'samples': sum(profile.stacks.values()),
+                'captured_at': datetime.datetime.now().isoformat(),
+                'stacks': profile.stacks,
+            }
+            self.next_id += 1
+            self.profiles.append(record)
+        return record
+
+    def discard(self, profile):
+        with self.sample_lock:
+            self.active.pop(profile.ident, None)
+
+    def get(self, profile_id):
+        for record in self.profiles:
+            if record['id'] == profile_id:
+                return record
+        return None
+
+    def folded(self, record):
+        return ''.join(f"{stack} {count}\n" for stack, count in record['stacks'].most_common())
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'slow_ms': self.slow_ms,
+            'keep': self.profiles.maxlen,
+            'profiles': [{k: v for k, v in r.items() if k != 'stacks'} for r in reversed(self.profiles)],
+        }
+
+
+def init_app(app, profiler):
+    def begin_profile():
+        profile = profiler.start_request()
+        if profile:
+            g._profile = profile
+
+    def end_profile(response):
+        profile = g.pop('_profile', None)
+        if profile:
+            profiler.finish_request(profile, request.method, request.path, response.status_code)
+        return response
+
+    def drop_profile(exc):
+        profile = g.pop('_profile', None)
+        if profile:
+            profiler.discard(profile)
+
+    app.before_request(begin_profile)
+    app.after_request(end_profile)
+    app.teardown_request(drop_profile)
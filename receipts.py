@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Crockford base32: no I, L, O or U, so a code survives being copied by hand
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CODE_LENGTH = 10
+_CONFUSABLE = str.maketrans({'O': '0', 'I': '1', 'L': '1'})
+
+_sync_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='receipts')
+
+
+def normalise_code(code):
+    return str(code or '').upper().replace('-', '').replace(' ', '').translate(_CONFUSABLE)
+
+
+def format_code(code):
+    code = normalise_code(code)
+    if len(code) == CODE_LENGTH:
+        return f"{code[:5]}-{code[5:]}"
+    return code
+
+
+class ReceiptIndex:
+    # In-memory index from receipt code to its VERIFICATIONS row, so a
+    # lookup never reads Sheets. Rows written by other workers or booths are
+    # picked up by reading the sheet from the last indexed row onwards (at
+    # most every `sync_interval` seconds, in the background), and the index
+    # is checkpointed to disk so a restart only reads the rows added since.
+    def __init__(self, load_rows, path=None, sync_interval=30):
+        self.load_rows = load_rows
+        self.path = path
+        self.sync_interval = sync_interval
+        self.entries = {}  # code -> [{'voting_id', 'timestamp', 'row'}]
+        self.rows = 0  # sheet rows indexed so far, header included
+        self.last_code = None  # code column of row `rows`, to notice a rebuilt sheet
+        self.lock = threading.Lock()
+        self.syncing = False
+        self.last_sync = 0
+        self.collisions = 0
+        self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.rows = data['rows']
+            self.last_code = data['last_code']
+            self.entries = {code: [{'voting_id': v, 'timestamp': t, 'row': r} for v, t, r in records]
+                            for code, records in data['entries'].items()}
+        except Exception as e:
+            print(f"Receipts: could not read checkpoint, rebuilding: {e}")
+            self.entries, self.rows, self.last_code = {}, 0, None
+
+    def _save_checkpoint(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = {'rows': self.rows, 'last_code': self.last_code,
+                    'entries': {code: [[r['voting_id'], r['timestamp'], r['row']] for r in records if r['row']]
+                                for code, records in self.entries.items()}}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _row_code(row):
+        return normalise_code(row[1]) if len(row) > 1 else ''
+
+    def sync(self):
+        # Read from the last indexed row: if it no longer holds the code we
+        # indexed there, the sheet was cleared or edited and is re-read whole
+        start = self.rows
+        rows = self.load_rows(max(start, 1))
+        if rows is None:
+            return False
+        if start and (not rows or self._row_code(rows[0]) != self.last_code):
+            print("Receipts: VERIFICATIONS changed underneath the index, rebuilding")
+            with self.lock:
+                local = {code: [r for r in records if not r['row']] for code, records in self.entries.items()}
+                self.entries = {code: records for code, records in local.items() if records}
+                self.rows, self.last_code = 0, None
+            return self.sync()
+        new_rows = rows[1:] if start else rows
+        with self.lock:
+            for offset, row in enumerate(new_rows):
+                row_number = max(start, 1) + offset + (1 if start else 0)
+                if row_number == 1:
+                    continue  # header
+                code = self._row_code(row)
+                if code:
+                    self._index(code, row[0] if row else '', row[2] if len(row) > 2 else '', row_number)
+            if new_rows:
+                self.rows = max(start, 1) + len(rows) - 1
+                self.last_code = self._row_code(rows[-1])
+            self.last_sync = time.time()
+        if new_rows:
+            self._save_checkpoint()
+        return True
+
+    def _index(self, code, voting_id, timestamp, row=None):
+        records = self.entries.setdefault(code, [])
+        for record in records:
+            # A receipt this process indexed before the sheet row was read
+            if record['voting_id'] == str(voting_id) and not record['row']:
+                record['row'] = row
+                return
+        records.append({'voting_id': str(voting_id), 'timestamp': timestamp, 'row': row})
+
+    def maybe_sync(self):
+        with self.lock:
+            if self.syncing or time.time() - self.last_sync < self.sync_interval:
+                return
+            self.syncing = True
+            self.last_sync = time.time()
+        _sync_pool.submit(self._background_sync)
+
+    def _background_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"Receipts: sync failed: {e}")
+        finally:
+            with self.lock:
+                self.syncing = False
+
+    def new_code(self):
+        # 50 random bits; still checked against every code indexed so far
+        while True:
+            code = ''.join(secrets.choice(ALPHABET) for _ in range(CODE_LENGTH))
+            with self.lock:
+                if code not in self.entries:
+                    return code
+                self.collisions += 1
+
+    def add(self, code, voting_id, timestamp):
+        with self.lock:
+            self._index(normalise_code(code), voting_id, timestamp)
+
+    def lookup(self, code):
+        # Public answer: whether the receipt was recorded and when. Voting
+        # IDs stay out of it. Legacy 3-digit codes can match several ballots.
+        self.maybe_sync()
+        code = normalise_code(code)
+        with self.lock:
+            records = list(self.entries.get(code, ()))
+        return {
+            'code': format_code(code),
+            'found': bool(records),
+            'recorded_at': records[0]['timestamp'] if len(records) == 1 else None,
+            'matches': len(records),
+            'legacy': bool(records) and len(code) != CODE_LENGTH,
+        }
+
+    def stats(self):
+        with self.lock:
+            return {'codes': len(self.entries), 'rows_indexed': self.rows,
+                    'collisions': self.collisions, 'last_sync': self.last_sync}
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import datetime
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Post-processing for voting session recordings. Uploads are saved raw by
+# the request and queued here. Each file is handled by its own worker
+# process (`python recordings.py <file>`, at low CPU priority) with at most
+# `max_workers` running, so hashing and encoding never compete with request
+# threads for the GIL. A worker re-encodes the file smaller with ffmpeg when
+# it is installed, grabs a preview frame and checksums the result. Workers
+# are plain subprocesses rather than a multiprocessing pool, which would
+# re-import main.py (and start a second copy of the app) in every child.
+# index.jsonl records every file against the voter it belongs to: a
+# 'received' line on upload and a 'processed' line when done, so files
+# still pending after a restart are picked up again. Every app process
+# resumes the same index, so a file is only processed by the one that
+# creates its '.lock' file.
+
+INDEX_NAME = 'index.jsonl'
+ENCODE_TIMEOUT = 300
+WORKER_TIMEOUT = 2 * ENCODE_TIMEOUT
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _lower_priority():
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+
+def process_recording(path, ffmpeg=None, height=360):
+    # Runs in a worker process; returns the fields for the 'processed' line
+    started = time.time()
+    result = {'original_bytes': os.path.getsize(path), 'sha256_original': _sha256(path),
+              'encoded': False, 'preview': None}
+    base = os.path.splitext(path)[0]
+    if ffmpeg:
+        encoded_path = f"{base}.enc.webm"
+        try:
+            subprocess.run([ffmpeg, '-nostdin', '-loglevel', 'error', '-y', '-i', path,
+                            '-vf', f"scale=-2:'min({height},ih)'", '-c:v', 'libvpx-vp9', '-b:v', '0', '-crf', '40',
+                            '-deadline', 'realtime', '-cpu-used', '8', '-c:a', 'libopus', '-b:a', '32k',
+                            encoded_path], check=True, timeout=ENCODE_TIMEOUT, capture_output=True)
+            # Keep whichever is smaller; the original checksum stays on record
+            if os.path.getsize(encoded_path) < result['original_bytes']:
+                os.replace(encoded_path, path)
+                result['encoded'] = True
+            else:
+                os.remove(encoded_path)
+        except (subprocess.SubprocessError, OSError) as e:
+            result['encode_error'] = str(e)[:200]
+            if os.path.exists(encoded_path):
+                os.remove(encoded_path)
+        preview_path = f"{base}.jpg"
+        try:
+            subprocess.run([ffmpeg, '-nostdin', '-loglevel', 'error', '-y', '-ss', '1', '-i', path,
+                            '-frames:v', '1', '-vf', 'scale=160:-2', preview_path],
+                           check=True, timeout=60, capture_output=True)
+            result['preview'] = os.path.basename(preview_path) if os.path.exists(preview_path) else None
+        except (subprocess.SubprocessError, OSError):
+            pass
+    result['bytes'] = os.path.getsize(path)
+    result['sha256'] = _sha256(path) if result['encoded'] else result['sha256_original']
+    result['process_ms'] = int((time.time() - started) * 1000)
+    return result
+
+
+class RecordingProcessor:
+    # At most `max_workers` files are handed to the pool at a time; the rest
+    # wait in `queue`, whose length is the backlog gauge
+    def __init__(self, root='secure_sessions', max_workers=1, ffmpeg=None, height=360):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.max_workers = max_workers
+        self.ffmpeg = shutil.which(ffmpeg or 'ffmpeg')
+        self.height = height
+        self.queue = deque()  # (path, meta)
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.bytes_saved = 0
+        self.peak_backlog = 0
+        self.lock = threading.Lock()
+        # Threads that only wait on the worker processes
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recordings')
+
+    def _run_worker(self, path):
+        command = [sys.executable, os.path.abspath(__file__), path, '--height', str(self.height)]
+        if self.ffmpeg:
+            command += ['--ffmpeg', self.ffmpeg]
+        done = subprocess.run(command, capture_output=True, text=True, timeout=WORKER_TIMEOUT)
+        if done.returncode != 0:
+            raise RuntimeError(done.stderr.strip().splitlines()[-1] if done.stderr.strip() else f'exit {done.returncode}')
+        return json.loads(done.stdout)
+
+    def _append_index(self, record):
+        with self.lock:
+            with open(self.index_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def submit(self, path, meta):
+        record = dict(meta, file=os.path.basename(path), status='received',
+                      at=datetime.datetime.now().isoformat(timespec='seconds'))
+        self._append_index(record)
+        self._enqueue(path, record)
+
+    def _enqueue(self, path, record):
+        with self.lock:
+            self.queue.append((path, record))
+            self.peak_backlog = max(self.peak_backlog, len(self.queue))
+        self._pump()
+
+    def _claim(self, path, record):
+        lock_path = path + '.lock'
+        for attempt in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if attempt or not self._claim_is_stale(lock_path):
+                    return False
+                # Its owner died mid-file: take it over
+                try:
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            break
+        # Another process may have finished it after our index was read
+        if self.read_index().get(record['file'], {}).get('status') != 'received':
+            self._release(path)
+            return False
+        return True
+
+    @staticmethod
+    def _claim_is_stale(lock_path):
+        try:
+            with open(lock_path) as f:
+                pid = int(f.read().strip())
+        except FileNotFoundError:
+            return True
+        except (OSError, ValueError):
+            # Owner died before writing its pid, or is writing it now
+            try:
+                return time.time() - os.path.getmtime(lock_path) > WORKER_TIMEOUT
+            except FileNotFoundError:
+                return True
+        if pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    @staticmethod
+    def _release(path):
+        try:
+            os.remove(path + '.lock')
+        except FileNotFoundError:
+            pass
+
+    def _pump(self):
+        while True:
+            with self.lock:
+                if self.in_flight >= self.max_workers or not self.queue:
+                    return
+                path, record = self.queue.popleft()
+                self.in_flight += 1
+            if not self._claim(path, record):
+                with self.lock:
+                    self.in_flight -= 1
+                continue
+            future = self.pool.submit(self._run_worker, path)
+            future.add_done_callback(lambda f, path=path, record=record: self._done(f, path, record))
+
+    def _done(self, future, path, record):
+        entry = {k: record.get(k) for k in ('file', 'voter_id', 'class', 'section', 'roll', 'timestamp', 'tenant')}
+        entry['at'] = datetime.datetime.now().isoformat(timespec='seconds')
+        try:
+            entry.update(future.result(), status='processed')
+        except Exception as e:
+            entry.update(status='failed', error=str(e)[:200])
+        with self.lock:
+            self.in_flight -= 1
+            if entry['status'] == 'processed':
+                self.processed += 1
+                self.bytes_saved += entry['original_bytes'] - entry['bytes']
+            else:
+                self.failed += 1
+        self._append_index(entry)
+        self._release(path)
+        self._pump()
+
+    def read_index(self):
+        # Latest line per file
+        entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries[entry.get('file')] = entry
+        return entries
+
+    def resume(self):
+        # Re-queue uploads that were received but never processed
+        pending = [e for e in self.read_index().values() if e.get('status') == 'received']
+        for entry in pending:
+            path = os.path.join(self.root, entry['file'])
+            if os.path.exists(path):
+                self._enqueue(path, entry)
+        return len(pending)
+
+    def lookup(self, voter_id):
+        return [e for e in self.read_index().values() if str(e.get('voter_id')) == str(voter_id)]
+
+    def status(self):
+        with self.lock:
+            return {'encoder': self.ffmpeg, 'workers': self.max_workers, 'backlog': len(self.queue),
+                    'in_flight': self.in_flight, 'peak_backlog': self.peak_backlog, 'processed': self.processed,
+                    'failed': self.failed, 'bytes_saved': self.bytes_saved}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Post-process one session recording')
+    parser.add_argument('path')
+    parser.add_argument('--ffmpeg')
+    parser.add_argument('--height', type=int, default=360)
+    args = parser.parse_args()
+    _lower_priority()
+    print(json.dumps(process_recording(args.path, args.ffmpeg, args.height)))
@@ -0,0 +1,357 @@
+import os
+import sys
+import io
+import json
+import time
+import heapq
+import random
+import argparse
+import tempfile
+import threading
+from collections import defaultdict, deque
+
+from voter_ids import make_id
+
+# Replays a recorded (traffic.py) or synthetic election day against the app
+# in-process, with local_db.LocalSheetsDB standing in for Google Sheets.
+#
+#   python replay.py --synthetic --voters 800 --hours 6 --speed 100
+#   python replay.py --recording traffic_20250110_080000.jsonl --speed 10
+#
+# Arrivals keep their recorded offsets divided by --speed; each client's
+# requests still run one after another, as a browser would send them.
+# Backend calls keep their real --backend-latency, so a high speed compresses
+# a whole day of arrivals onto the app's true service times.
+
+
+def synthetic_day(voters=600, hours=6.0, posts=4, seed=1, results_every=15.0, analytics_every=30.0):
+    # Voters arrive as a steady trickle plus two class-by-class surges,
+    # walk through the ballot with human think times, while a projector
+    # polls /results and the admin dashboard polls analytics all day
+    rng = random.Random(seed)
+    day = hours * 3600
+    entries = []
+
+    def add(t, client, method, path, route, form=None, admin=False):
+        entries.append({'t': t, 'client': client, 'method': method, 'path': path, 'route': route,
+                        'args': {}, 'form': form or {}, 'files': {}, 'admin': admin})
+
+    for n in range(voters):
+        surge = rng.random()
+        if surge < 0.35:
+            t = rng.gauss(day * 0.15, day * 0.05)
+        elif surge < 0.6:
+            t = rng.gauss(day * 0.6, day * 0.06)
+        else:
+            t = rng.uniform(0, day)
+        t = min(max(t, 0), day)
+        client = f"voter-{n}"
+        voter = f"anon:synthetic{n:05d}"
+        add(t, client, 'GET', '/vote', '/vote')
+        t += rng.uniform(4, 15)
+        add(t, client, 'POST', '/vote', '/vote', {'voter_id': voter})
+        t += rng.uniform(3, 10)
+        add(t, client, 'POST', '/start-ballot', '/start-ballot')
+        for step in range(1, posts + 1):
+            add(t + 0.2, client, 'GET', f'/voting-flow/{step}', '/voting-flow/<int:step>')
+            t += rng.uniform(5, 25)
+            choice = rng.randrange(2)
+            add(t, client, 'POST', f'/voting-flow/{step}', '/voting-flow/<int:step>',
+                {'main_selection': f'Post {step} Main {choice + 1}',
+                 'dy_selection': f'Post {step} Deputy {rng.randrange(2) + 1}'})
+        add(t + 0.2, client, 'GET', f'/voting-flow/{posts + 1}', '/voting-flow/<int:step>')
+        add(t + 0.4, client, 'GET', '/confirm-votes', '/confirm-votes')
+        t += rng.uniform(3, 12)
+        add(t, client, 'POST', '/confirm-votes', '/confirm-votes')
+
+    t = 0.0
+    while t < day:
+        add(t, 'projector', 'GET', '/results', '/results')
+        t += results_every
+    t = 0.0
+    while t < day:
+        add(t, 'admin', 'GET', '/admin/analytics', '/admin/analytics', admin=True)
+        add(t + 0.1, 'admin', 'GET', '/admin/jobs', '/admin/jobs', admin=True)
+        t += analytics_every
+
+    entries.sort(key=lambda e: e['t'])
+    return entries
+
+
+def load_recording(path):
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    entries.sort(key=lambda e: e['t'])
+    return entries
+
+
+def seed_backend(local_db, entries):
+    # Every anonymised voter ID in the stream becomes a fresh roster entry
+    # and every selection seen on a ballot step becomes a candidate, so the
+    # replayed requests take the same code paths as the recorded ones
+    voter_ids = {}
+    for entry in entries:
+        for fields in (entry.get('form') or {}, entry.get('args') or {}):
+            value = fields.get('voter_id')
+            if value and value not in voter_ids:
+                voter_ids[value] = make_id(len(voter_ids) + 1)
+    local_db.add_voters_batch([{'VotingID': vid, 'Class': str(n % 12 + 1), 'Section': 'ABCD'[n % 4],
+                                'RollNo': str(n + 1)} for n, vid in enumerate(voter_ids.values())])
+
+    candidates = {}
+    for entry in entries:
+        route = entry.get('route') or ''
+        form = entry.get('form') or {}
+        if route.startswith('/voting-flow') and entry['method'] == 'POST':
+            post = f"Post {entry['path'].rsplit('/', 1)[-1]}"
+            if form.get('main_selection'):
+                candidates.setdefault((post, form['main_selection']), '10')
+            if form.get('dy_selection'):
+                candidates.setdefault((post, form['dy_selection']), '9')
+    posts = sorted({post for post, _ in candidates}, key=lambda p: int(p.split()[-1]))
+    if posts:
+        local_db.add_posts(posts)
+        local_db.add_candidates_batch([(post, name, active) for (post, name), active in candidates.items()])
+        # VOTES headers are derived from the candidate list, so write them now
+        local_db.spreadsheet.sheets['VOTES'].rows.clear()
+        local_db._ensure_votes_sheet()
+    return voter_ids
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Replayer:
+    def __init__(self, app, entries, voter_ids, speed=1.0, workers=8, skip_static=True):
+        self.app = app
+        self.speed = speed
+        self.workers = workers
+        self.voter_ids = voter_ids
+        self.clients = defaultdict(deque)
+        for entry in entries:
+            if skip_static and entry['path'].startswith(('/static', '/media')):
+                continue
+            if entry['path'] == '/admin-login' and entry['method'] == 'POST':
+                continue
+            self.clients[entry['client']].append(entry)
+        self.lock = threading.Condition()
+        self.schedule = []  # (due, seq, client) for each client's next request
+        self.ready = deque()  # (due, client, entry) waiting for a worker
+        self.seq = 0
+        self.remaining = sum(len(q) for q in self.clients.values())
+        self.samples = defaultdict(list)  # route -> [(latency, wait, status)]
+        self.depth = []  # (elapsed, queued)
+        self.test_clients = {}
+
+    def _push(self, client, not_before):
+        queue = self.clients[client]
+        if queue:
+            due = max(queue[0]['t'] / self.speed, not_before)
+            heapq.heappush(self.schedule, (due, self.seq, client))
+            self.seq += 1
+
+    def _client(self, name, admin):
+        test_client = self.test_clients.get(name)
+        if not test_client:
+            test_client = self.app.test_client()
+            # One address per client, as each phone or booth has its own
+            n = len(self.test_clients)
+            test_client.environ_base['REMOTE_ADDR'] = f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+            if admin:
+                with test_client.session_transaction() as s:
+                    s['admin_logged_in'] = True
+            self.test_clients[name] = test_client
+        return test_client
+
+    def _send(self, entry):
+        form = dict(entry.get('form') or {})
+        args = dict(entry.get('args') or {})
+        for fields in (form, args):
+            if fields.get('voter_id') in self.voter_ids:
+                fields['voter_id'] = self.voter_ids[fields['voter_id']]
+        data = form or None
+        if entry.get('files'):
+            data = dict(form)
+            for name, size in entry['files'].items():
+                data[name] = (io.BytesIO(b'\0' * size), f'{name}.bin')
+        test_client = self._client(entry['client'], entry.get('admin'))
+        response = test_client.open(entry['path'], method=entry['method'], data=data, query_string=args)
+        response.close()
+        return response.status_code
+
+    def _worker(self, local_db):
+        while True:
+            with self.lock:
+                while not self.ready and self.remaining:
+                    self.lock.wait(0.05)
+                if not self.ready:
+                    return
+                due, client, entry = self.ready.popleft()
+            started = time.perf_counter() - self.t0
+            local_db.set_route(entry.get('route') or entry['path'])
+            try:
+                status = self._send(entry)
+            except Exception as e:
+                print(f"Replay: {entry['method']} {entry['path']} failed: {e}")
+                status = 599
+            finished = time.perf_counter() - self.t0
+            self.samples[entry.get('route') or entry['path']].append((finished - started, started - due, status))
+            with self.lock:
+                self.clients[client].popleft()
+                self.remaining -= 1
+                self._push(client, finished)
+                self.lock.notify_all()
+
+    def run(self, local_db, progress=True):
+        for client in self.clients:
+            self._push(client, 0)
+        self.t0 = time.perf_counter()
+        threads = [threading.Thread(target=self._worker, args=(local_db,), daemon=True)
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        last_report = 0
+        while True:
+            with self.lock:
+                now = time.perf_counter() - self.t0
+                while self.schedule and self.schedule[0][0] <= now:
+                    due, _, client = heapq.heappop(self.schedule)
+                    self.ready.append((due, client, self.clients[client][0]))
+                self.depth.append((now, len(self.ready)))
+                self.lock.notify_all()
+                if not self.remaining:
+                    break
+                wait = self.schedule[0][0] - now if self.schedule else 0.05
+            if progress and now - last_report >= 5:
+                last_report = now
+                print(f"  {now * self.speed / 60:7.1f} simulated min  queued={len(self.ready):4d}  "
+                      f"left={self.remaining}", file=sys.stderr)
+            time.sleep(min(max(wait, 0.001), 0.05))
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - self.t0
+
+    def report(self, local_db):
+        calls = local_db.spreadsheet.calls
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            latencies = [s[0] * 1000 for s in samples]
+            waits = [s[1] * 1000 for s in samples]
+            statuses = defaultdict(int)
+            for s in samples:
+                statuses[f"{s[2] // 100}xx"] += 1
+            backend = {op: count for (r, op), count in calls.items() if r == route}
+            routes[route] = {
+                'requests': len(samples),
+                'status': dict(statuses),
+                'latency_ms': {'p50': percentile(latencies, 50), 'p90': percentile(latencies, 90),
+                               'p99': percentile(latencies, 99), 'max': max(latencies)},
+                'queue_wait_ms': {'mean': sum(waits) / len(waits), 'p99': percentile(waits, 99),
+                                  'max': max(waits)},
+                'backend_calls': backend,
+                'backend_calls_per_request': round(sum(backend.values()) / len(samples), 2),
+            }
+        peak_at, peak = max(self.depth, key=lambda d: d[1]) if self.depth else (0, 0)
+        # Queue depth per simulated minute, to see where the backlog builds up
+        per_minute = defaultdict(int)
+        for elapsed, queued in self.depth:
+            minute = int(elapsed * self.speed // 60)
+            per_minute[minute] = max(per_minute[minute], queued)
+        return {
+            'speed': self.speed,
+            'workers': self.workers,
+            'wall_seconds': round(self.elapsed, 2),
+            'requests': sum(r['requests'] for r in routes.values()),
+            'peak_queue': {'depth': peak, 'simulated_minute': round(peak_at * self.speed / 60, 1)},
+            'queue_by_minute': {m: d for m, d in sorted(per_minute.items()) if d},
+            'backend_calls_total': sum(calls.values()),
+            'routes': routes,
+        }
+
+
+def print_report(report):
+    print(f"\nReplayed {report['requests']} requests at {report['speed']}x with {report['workers']} workers "
+          f"in {report['wall_seconds']}s")
+    print(f"Peak queue: {report['peak_queue']['depth']} requests "
+          f"(simulated minute {report['peak_queue']['simulated_minute']})")
+    print(f"Backend calls: {report['backend_calls_total']}\n")
+    print(f"{'route':32} {'reqs':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'wait':>8} {'calls/req':>10}")
+    for route, r in report['routes'].items():
+        lat = r['latency_ms']
+        print(f"{route[:32]:32} {r['requests']:6d} {lat['p50']:8.1f} {lat['p90']:8.1f} {lat['p99']:8.1f} "
+              f"{lat['max']:8.1f} {r['queue_wait_ms']['mean']:8.1f} {r['backend_calls_per_request']:10.2f}")
+    busy = [(m, d) for m, d in report['queue_by_minute'].items()]
+    if busy:
+        worst = sorted(busy, key=lambda x: -x[1])[:5]
+        print("\nBusiest minutes (simulated minute: queued requests): " +
+              ', '.join(f"{m}: {d}" for m, d in sorted(worst)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay an election day against the app with a local backend.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--recording', help='JSONL file written by the traffic recorder')
+    source.add_argument('--synthetic', action='store_true', help='generate a synthetic election day')
+    parser.add_argument('--voters', type=int, default=600)
+    parser.add_argument('--hours', type=float, default=6.0)
+    parser.add_argument('--posts', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--speed', type=float, default=10.0, help='1, 10 or 100 times real time')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent request handlers')
+    parser.add_argument('--backend-latency', type=float, default=0.2, help='seconds per Sheets API call')
+    parser.add_argument('--include-static', action='store_true')
+    parser.add_argument('--admission', action='store_true',
+                        help='keep admission control on (its rates are real time, so use --speed 1)')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args(argv)
+
+    if args.recording:
+        entries = load_recording(os.path.abspath(args.recording))
+    else:
+        entries = synthetic_day(args.voters, args.hours, args.posts, args.seed)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    # Run the app from a scratch directory so logs, job state and caches of
+    # the replay never mix with the real ones
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix='replay_')
+    os.chdir(workdir)
+    os.environ['SESSION_BACKEND'] = 'memory'
+    os.environ['ELECTION_MODE'] = 'single'
+    os.environ.pop('TRAFFIC_RECORD', None)
+    os.environ['ADMISSION'] = 'on' if args.admission else 'off'
+
+    import main as election
+    import local_db
+    from local_db import LocalSheetsDB
+
+    backend = LocalSheetsDB()
+    voter_ids = seed_backend(backend, entries)
+    backend.spreadsheet.latency = args.backend_latency
+    backend.reset_counts()
+    tenant = election.tenants.get(election.DEFAULT_TENANT)
+    tenant.db = backend
+    election.invalidate_data(*election.CACHE_SHEETS, tenant=tenant)
+
+    replayer = Replayer(election.app, entries, voter_ids, speed=args.speed, workers=args.workers,
+                        skip_static=not args.include_static)
+    print(f"Replaying {replayer.remaining} requests from {len(replayer.clients)} clients "
+          f"at {args.speed}x (scratch dir {workdir})", file=sys.stderr)
+    replayer.run(local_db)
+    report = replayer.report(backend)
+    print_report(report)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import time
+import threading
+from collections import deque, Counter
+
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+# Guard for every Sheets HTTP call. Each call gets a deadline derived from
+# recent latency for its kind (read, write, metadata), and a circuit breaker
+# shared by everything using the same credentials stops sending calls once
+# Sheets is failing or crawling, so request threads fail fast instead of
+# piling up behind it. After a cool-down one probe call is let through; if
+# it succeeds the breaker closes again.
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+CONNECT_TIMEOUT = 3.05
+
+
+class BackendUnavailable(Exception):
+    # The breaker is open, or the call timed out or could not connect
+    pass
+
+
+def is_unavailable(error):
+    # True when `error` means Sheets is down or throttling us (which the
+    # breaker also counts), not a permanent error such as a bad range, a
+    # missing sheet or a permission problem
+    if isinstance(error, BackendUnavailable):
+        return True
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return isinstance(error, APIError) and status is not None and (status == 429 or status >= 500)
+
+
+class WritesFrozen(Exception):
+    # A write to a spreadsheet whose election has been closed
+    pass
+
+
+class AdaptiveTimeout:
+    # Deadline for one kind of call: `multiplier` times the recent p95
+    # latency, kept between `floor` and `ceiling` seconds. Calls that time
+    # out count as taking the whole deadline, so a slowdown raises it.
+    def __init__(self, floor, ceiling, multiplier=3.0, samples=200):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.multiplier = multiplier
+        self.latencies = deque(maxlen=samples)
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def p95(self):
+        with self.lock:
+            data = sorted(self.latencies)
+        if not data:
+            return None
+        return data[min(len(data) - 1, int(len(data) * 0.95))]
+
+    @property
+    def seconds(self):
+        p95 = self.p95()
+        if p95 is None:
+            return self.ceiling
+        return max(self.floor, min(self.ceiling, p95 * self.multiplier))
+
+
+class CircuitBreaker:
+    # Trips when, over the last `window` seconds and at least `min_calls`
+    # calls, the share of failures reaches `failure_ratio` or the share of
+    # calls slower than `slow_call` seconds reaches `slow_ratio`. It stays
+    # open for `reset_timeout` seconds, doubled after each failed probe up
+    # to `max_reset_timeout`.
+    def __init__(self, name, window=30, min_calls=5, failure_ratio=0.5, slow_call=5.0, slow_ratio=0.8,
+                 reset_timeout=15, max_reset_timeout=120):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call = slow_call
+        self.slow_ratio = slow_ratio
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = CLOSED
+        self.changed_at = time.time()
+        self.opened_at = None
+        self.probing = False
+        self.outcomes = deque()  # (time, failed, slow)
+        self.rejected = Counter()  # op -> calls refused while open
+        self.trips = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        self.changed_at = time.time()
+        print(f"Circuit breaker '{self.name}': {state}")
+
+    def before_call(self, op):
+        # Raises BackendUnavailable when the call must not be sent
+        with self.lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+            self.rejected[op] += 1
+            retry_in = max(0, int(self.opened_at + self.reset_timeout - time.time()))
+        raise BackendUnavailable(f"Sheets circuit {self.state}, retry in {retry_in}s")
+
+    def record(self, failed, duration, error=None):
+        now = time.time()
+        with self.lock:
+            if failed:
+                self.last_error = f"{type(error).__name__}: {error}" if error else 'failed'
+            if self.state == HALF_OPEN:
+                self.probing = False
+                if failed:
+                    self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+                    self._trip(now)
+                else:
+                    self.reset_timeout = self.base_reset_timeout
+                    self.outcomes.clear()
+                    self._set_state(CLOSED)
+                return
+            self.outcomes.append((now, failed, duration >= self.slow_call))
+            while self.outcomes and self.outcomes[0][0] < now - self.window:
+                self.outcomes.popleft()
+            if self.state == CLOSED and len(self.outcomes) >= self.min_calls:
+                failures = sum(1 for _, f, _ in self.outcomes if f)
+                slow = sum(1 for _, _, s in self.outcomes if s)
+                if failures >= self.failure_ratio * len(self.outcomes) or slow >= self.slow_ratio * len(self.outcomes):
+                    self._trip(now)
+
+    def _trip(self, now):
+        self.opened_at = now
+        self.trips += 1
+        self.outcomes.clear()
+        self._set_state(OPEN)
+
+    def status(self):
+        with self.lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0, round(self.opened_at + self.reset_timeout - time.time(), 1))
+            return {
+                'state': self.state,
+                'since': self.changed_at,
+                'retry_in': retry_in,
+                'trips': self.trips,
+                'rejected': dict(self.rejected),
+                'recent_calls': len(self.outcomes),
+                'recent_failures': sum(1 for _, f, _ in self.outcomes if f),
+                'last_error': self.last_error,
+            }
+
+
+def operation(method, endpoint):
+    if method.lower() != 'get':
+        return 'write'
+    return 'read' if '/values' in endpoint else 'metadata'
+
+
+class GuardedHTTPClient(HTTPClient):
+    # Drop-in gspread HTTP client: gspread.authorize(creds, http_client=GuardedHTTPClient)
+    def __init__(self, auth, session=None):
+        super().__init__(auth, session)
+        self.breaker = CircuitBreaker('sheets')
+        # Spreadsheet IDs of closed elections; writes to them are refused
+        self.frozen = set()
+        self.deadlines = {
+            'read': AdaptiveTimeout(2, 15),
+            'metadata': AdaptiveTimeout(2, 10),
+            'write': AdaptiveTimeout(3, 20),
+        }
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        op = operation(method, endpoint)
+        if op == 'write' and any(sheet_id in endpoint for sheet_id in self.frozen):
+            raise WritesFrozen(f"{method.upper()} {endpoint}: election is closed")
+        deadline = self.deadlines[op]
+        self.breaker.before_call(op)
+        timeout = deadline.seconds
+        start = time.monotonic()
+        try:
+            response = self.session.request(method=method, url=endpoint, json=json, params=params, data=data,
+                                            files=files, headers=headers,
+                                            timeout=(min(CONNECT_TIMEOUT, timeout), timeout))
+        except (requests.Timeout, requests.ConnectionError) as e:
+            elapsed = time.monotonic() - start
+            deadline.observe(elapsed)
+            self.breaker.record(True, elapsed, e)
+            raise BackendUnavailable(f"Sheets {op} call gave up after {elapsed:.1f}s: {e}") from e
+        except Exception as e:
+            self.breaker.record(True, time.monotonic() - start, e)
+            raise
+        elapsed = time.monotonic() - start
+        deadline.observe(elapsed)
+        if response.ok:
+            self.breaker.record(False, elapsed)
+            return response
+        # Rate limiting and server errors count against the breaker; other
+        # errors (bad range, missing sheet) mean Sheets itself is answering
+        error = APIError(response)
+        self.breaker.record(is_unavailable(error), elapsed, error)
+        raise error
+
+    def status(self):
+        return dict(self.breaker.status(), frozen=len(self.frozen),
+                    timeouts={op: round(d.seconds, 2) for op, d in self.deadlines.items()},
+                    p95={op: round(d.p95(), 3) if d.p95() is not None else None for op, d in self.deadlines.items()})
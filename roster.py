@@ -0,0 +1,234 @@
+import os
+import mmap
+import time
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Without flock every process may rebuild the file itself
+    fcntl = None
+
+# Compiled voter roster shared by every worker on the machine. The file is
+# a header followed by fixed-width records sorted by VotingID; workers map
+# it read-only, so the pages are held once by the OS page cache whatever the
+# worker count. New versions are written beside it and swapped in with
+# os.replace(). Used flags changed since a version was built are appended to
+# a small journal that each worker replays into its overlay.
+MAGIC = b'RSTR'
+FORMAT_VERSION = 1
+# magic, format version, record size, record count, time the VOTERS data was
+# read, journal offset already reflected in the records
+HEADER = struct.Struct('<4sHHIdQ')
+# VotingID, Class, Section, RollNo, Used
+RECORD = struct.Struct('<16s12s12s8sB3x')
+ID_WIDTH = 16
+
+
+def _field(value, width):
+    data = str(value if value is not None else '').strip().encode('utf-8')[:width]
+    # Never cut a multi-byte character in half
+    return data.decode('utf-8', 'ignore').encode('utf-8')
+
+
+def _text(data):
+    return data.rstrip(b'\0').decode('utf-8', 'ignore')
+
+
+class SharedRoster:
+    def __init__(self, path, loader=None, max_age=120, check_every=1.0):
+        self.path = path
+        self.loader = loader
+        self.max_age = max_age
+        self.check_every = check_every
+        self.lock = threading.RLock()
+        self.mm = None
+        self.count = 0
+        self.read_at = 0
+        self.identity = None
+        self.last_check = 0
+        self.overlay = {}
+        self.journal_pos = 0
+        self.refreshing = False
+        self.journal_fd = os.open(path + '.journal', os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._remap()
+
+    def _remap(self):
+        if self.journal_fd is None:
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else None
+        except FileNotFoundError:
+            return False
+        if not mm or len(mm) < HEADER.size:
+            return False
+        magic, version, record_size, count, read_at, journal_offset = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.size:
+            print(f"Roster: {self.path} has an unknown format, ignoring it")
+            return False
+        # The old mapping is released once no lookup holds it any more
+        self.mm = mm
+        self.count = count
+        self.read_at = read_at
+        self.identity = (stat.st_ino, stat.st_mtime_ns)
+        self.overlay = {}
+        self.journal_pos = journal_offset
+        self._read_journal()
+        return True
+
+    def _read_journal(self):
+        if self.journal_fd is None:
+            return
+        size = os.fstat(self.journal_fd).st_size
+        if size <= self.journal_pos:
+            return
+        data = os.pread(self.journal_fd, size - self.journal_pos, self.journal_pos)
+        end = data.rfind(b'\n') + 1  # ignore a line still being written
+        for line in data[:end].splitlines():
+            voting_id, _, used = line.decode('utf-8', 'ignore').partition('\t')
+            self.overlay[voting_id] = used == '1'
+        self.journal_pos += end
+
+    def _check(self):
+        now = time.time()
+        if now - self.last_check >= self.check_every:
+            self.last_check = now
+            try:
+                stat = os.stat(self.path)
+                if (stat.st_ino, stat.st_mtime_ns) != self.identity:
+                    self._remap()
+            except FileNotFoundError:
+                pass
+            # Without any version the caller reads VOTERS itself and publishes
+            if self.mm is not None and now - self.read_at > self.max_age:
+                self.refresh_async()
+        self._read_journal()
+
+    def _find(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * RECORD.size
+            if self.mm[offset:offset + ID_WIDTH] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        offset = HEADER.size + lo * RECORD.size
+        if lo < self.count and self.mm[offset:offset + ID_WIDTH] == key:
+            return offset
+        return None
+
+    def lookup(self, voting_id):
+        # Same shape as GoogleSheetsDB.get_voter_details(); None when the ID
+        # is not in the mapped version (or there is none yet)
+        voting_id = str(voting_id or '').strip()
+        key = _field(voting_id, ID_WIDTH).ljust(ID_WIDTH, b'\0')
+        with self.lock:
+            self._check()
+            if not self.mm or len(voting_id.encode('utf-8')) > ID_WIDTH:
+                return None
+            offset = self._find(key)
+            if offset is None:
+                return None
+            _, cls, section, roll, used = RECORD.unpack_from(self.mm, offset)
+            used = self.overlay.get(voting_id, bool(used))
+        return {'class': _text(cls), 'section': _text(section), 'roll_no': _text(roll), 'used': used}
+
+    def mark_used(self, voting_id, used=True):
+        line = f"{str(voting_id).strip()}\t{1 if used else 0}\n".encode('utf-8')
+        with self.lock:
+            if self.journal_fd is None:
+                # Closed under a request still running: the other workers
+                # must hear about the vote all the same
+                fd = os.open(self.path + '.journal', os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+                return
+            os.write(self.journal_fd, line)
+            self._read_journal()
+
+    def journal_position(self):
+        # Take this before reading VOTERS and pass it to publish(): every
+        # journal entry before it was written to the sheet before the read
+        if self.journal_fd is None:
+            return os.stat(self.path + '.journal').st_size
+        return os.fstat(self.journal_fd).st_size
+
+    def publish(self, records, journal_offset):
+        rows = []
+        for r in records:
+            voting_id = str(r.get('VotingID', '')).strip()
+            if not voting_id or len(voting_id.encode('utf-8')) > ID_WIDTH:
+                continue
+            rows.append(RECORD.pack(_field(voting_id, ID_WIDTH), _field(r.get('Class'), 12),
+                                    _field(r.get('Section'), 12), _field(r.get('RollNo'), 8),
+                                    1 if str(r.get('Used', 'NO')).upper() == 'YES' else 0))
+        rows.sort()
+        body = b''.join(rows)
+        now = time.time()
+        with self.lock:
+            if self.mm is not None and self.mm[HEADER.size:] == body:
+                self.read_at = now  # Unchanged: keep the current version
+                return False
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size, len(rows), now, journal_offset))
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        with self.lock:
+            self._remap()
+        return True
+
+    def refresh_async(self):
+        with self.lock:
+            if not self.loader or self.refreshing or self.journal_fd is None:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._refresh, name='roster-refresh', daemon=True).start()
+
+    def _refresh(self):
+        lock_file = None
+        try:
+            if fcntl:
+                # One rebuild per machine; the other workers just remap
+                lock_file = open(self.path + '.lock', 'w')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return
+            offset = self.journal_position()
+            records = self.loader()
+            if not records and self.count:
+                # A failed or empty read must not replace a roster with voters
+                print(f"Roster: refresh read no voters, keeping the {self.count} mapped")
+                return
+            self.publish(records, offset)
+        except Exception as e:
+            print(f"Roster: refresh failed: {e}")
+        finally:
+            if lock_file:
+                lock_file.close()
+            with self.lock:
+                self.refreshing = False
+                self.read_at = max(self.read_at, time.time() - self.max_age / 2)
+
+    def close(self):
+        # Lookups afterwards find nothing, so callers fall back to VOTERS
+        with self.lock:
+            if self.mm is not None:
+                self.mm.close()
+            self.mm = None
+            self.count = 0
+            if self.journal_fd is not None:
+                os.close(self.journal_fd)
+            self.journal_fd = None
+
+    def stats(self):
+        return {'voters': self.count, 'age_seconds': int(time.time() - self.read_at) if self.read_at else None,
+                'overlay': len(self.overlay), 'bytes': len(self.mm) if self.mm else 0}
@@ -0,0 +1,208 @@
+import json
+import time
+import sqlite3
+import secrets
+import threading
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# Keys that make up an in-progress ballot. They are stored apart from the
+# rest of the session so abandoned ballots can expire on their own and the
+# admin pause can drop every active ballot in one operation.
+BALLOT_KEYS = ('voter_id', 'pending_voter_id', 'voter_details', 'current_votes', 'session_timestamp')
+# Set on every session to the election it belongs to
+TENANT_KEY = '_tenant'
+
+
+def _pack(data):
+    return json.dumps(data, separators=(',', ':')) if data else None
+
+
+def _unpack(blob):
+    return json.loads(blob) if blob else {}
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        # Ballot keys as loaded, so an unchanged ballot is never written back
+        self.loaded_ballot = {}
+
+
+class MemorySessionBackend:
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def load(self, sid):
+        return self.sessions.get(sid)
+
+    def save(self, sid, data, ballot, expires, ballot_expires):
+        with self.lock:
+            self.sessions[sid] = (data, ballot, expires, ballot_expires)
+
+    def touch(self, sid, data, expires, ballot_expires):
+        # Like save() but leaves the stored ballot as it is (possibly
+        # cleared by invalidate_ballots meanwhile)
+        with self.lock:
+            entry = self.sessions.get(sid)
+            ballot = entry[1] if entry else None
+            self.sessions[sid] = (data, ballot, expires, ballot_expires if ballot else 0)
+
+    def delete(self, sid):
+        with self.lock:
+            self.sessions.pop(sid, None)
+
+    def purge(self, now):
+        with self.lock:
+            for sid, (data, ballot, expires, ballot_expires) in list(self.sessions.items()):
+                if expires < now:
+                    del self.sessions[sid]
+                elif ballot and ballot_expires < now:
+                    self.sessions[sid] = (data, None, expires, 0)
+
+    def invalidate_ballots(self, tenant=None):
+        with self.lock:
+            active = [sid for sid, entry in self.sessions.items()
+                      if entry[1] and (tenant is None or _unpack(entry[0]).get(TENANT_KEY) == tenant)]
+            for sid in active:
+                data, _, expires, _ = self.sessions[sid]
+                self.sessions[sid] = (data, None, expires, 0)
+            return len(active)
+
+    def count(self):
+        return {'sessions': len(self.sessions),
+                'ballots': sum(1 for entry in self.sessions.values() if entry[1])}
+
+
+class SQLiteSessionBackend:
+    # Shared by every worker process on the machine through one SQLite file
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT, ballot TEXT, '
+                          'expires REAL, ballot_expires REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS sessions_ballot ON sessions (ballot_expires)')
+        self.lock = threading.Lock()
+
+    def load(self, sid):
+        with self.lock:
+            row = self.conn.execute('SELECT data, ballot, expires, ballot_expires FROM sessions WHERE sid = ?',
+                                    (sid,)).fetchone()
+        return tuple(row) if row else None
+
+    def save(self, sid, data, ballot, expires, ballot_expires):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)',
+                              (sid, data, ballot, expires, ballot_expires))
+
+    def touch(self, sid, data, expires, ballot_expires):
+        with self.lock:
+            self.conn.execute('INSERT INTO sessions VALUES (?, ?, NULL, ?, 0) ON CONFLICT(sid) DO UPDATE SET '
+                              'data = excluded.data, expires = excluded.expires, '
+                              'ballot_expires = CASE WHEN ballot IS NULL THEN 0 ELSE ? END',
+                              (sid, data, expires, ballot_expires))
+
+    def delete(self, sid):
+        with self.lock:
+            self.conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def purge(self, now):
+        with self.lock:
+            self.conn.execute('DELETE FROM sessions WHERE expires < ?', (now,))
+            self.conn.execute('UPDATE sessions SET ballot = NULL, ballot_expires = 0 '
+                              'WHERE ballot IS NOT NULL AND ballot_expires < ?', (now,))
+
+    def invalidate_ballots(self, tenant=None):
+        with self.lock:
+            return self.conn.execute('UPDATE sessions SET ballot = NULL, ballot_expires = 0 '
+                                     'WHERE ballot IS NOT NULL AND (? IS NULL OR json_extract(data, ?) = ?)',
+                                     (tenant, f'$.{TENANT_KEY}', tenant)).rowcount
+
+    def count(self):
+        with self.lock:
+            total, ballots = self.conn.execute('SELECT COUNT(*), COUNT(ballot) FROM sessions').fetchone()
+        return {'sessions': total, 'ballots': ballots}
+
+
+class ServerSessionInterface(SessionInterface):
+    # Only an opaque random session ID travels in the cookie; the data lives
+    # in the backend. Ballot keys expire after `ballot_ttl` seconds without
+    # a request, the rest of the session after `session_ttl`.
+    def __init__(self, backend, session_ttl=12 * 3600, ballot_ttl=15 * 60, purge_every=200):
+        self.backend = backend
+        self.session_ttl = session_ttl
+        self.ballot_ttl = ballot_ttl
+        self.purge_every = purge_every
+        self.saves = 0
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        entry = self.backend.load(sid) if sid else None
+        now = time.time()
+        if not entry or entry[2] < now:
+            return ServerSession(sid=secrets.token_urlsafe(24), new=True)
+        data, ballot, _, ballot_expires = entry
+        values = _unpack(data)
+        live = ballot if ballot and ballot_expires >= now else None
+        values.update(_unpack(live))
+        session = ServerSession(values, sid=sid)
+        # A separate copy: the session's own values may be changed in place
+        session.loaded_ballot = _unpack(live)
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if not session.new:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        # Sliding expiry: an active ballot is touched on every request
+        if not session.modified and not session.new and not session.loaded_ballot:
+            return
+
+        now = time.time()
+        ballot = {k: session[k] for k in BALLOT_KEYS if k in session}
+        data = {k: v for k, v in session.items() if k not in BALLOT_KEYS}
+        ballot_expires = now + self.ballot_ttl if ballot else 0
+        if ballot == session.loaded_ballot and not session.new:
+            # Unchanged ballot: only refresh the expiry, so a ballot an admin
+            # pause cleared while this request ran stays cleared
+            self.backend.touch(session.sid, _pack(data), now + self.session_ttl, ballot_expires)
+        else:
+            self.backend.save(session.sid, _pack(data), _pack(ballot), now + self.session_ttl, ballot_expires)
+
+        self.saves += 1
+        if self.saves % self.purge_every == 0:
+            self.backend.purge(now)
+
+        if session.new:
+            response.set_cookie(name, session.sid, max_age=self.session_ttl,
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def invalidate_ballots(self, tenant=None):
+        # All ballots, or only those of one election
+        return self.backend.invalidate_ballots(tenant)
+
+    def stats(self):
+        return self.backend.count()
+
+
+def create_session_interface(kind, path='sessions.db', **kwargs):
+    if kind == 'sqlite':
+        return ServerSessionInterface(SQLiteSessionBackend(path), **kwargs)
+    return ServerSessionInterface(MemorySessionBackend(), **kwargs)
@@ -0,0 +1,50 @@
+import os
+import threading
+from collections import OrderedDict
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+
+class FragmentCache:
+    # Rendered template fragments keyed by (name, version, ...). Versions
+    # change whenever the data behind a fragment changes, so entries never
+    # need explicit invalidation; old ones just fall out of the LRU.
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        with self.lock:
+            html = self.entries.get(key)
+            if html is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return html
+        html = Markup(render())
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = html
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return html
+
+    def stats(self):
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def init_templates(app, cache_dir):
+    # Keep compiled template bytecode on disk so new workers skip parsing,
+    # then compile every page template once at startup
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    compiled = 0
+    for name in app.jinja_env.list_templates(filter_func=lambda n: n.endswith('.html')):
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except Exception as e:
+            print(f"Template precompile failed for {name}: {e}")
+    return compiled
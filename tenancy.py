@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from contextvars import ContextVar
+
+DEFAULT_TENANT = 'default'
+PREFIX = '/t/'
+
+_current = ContextVar('election_tenant', default=None)
+
+
+class UnknownTenant(LookupError):
+    pass
+
+
+class Tenant:
+    # Everything that belongs to one election: backend handle, caches,
+    # tally versions, pause state and final results. `setup` (see TenantRegistry) fills in
+    # the resources when the tenant is first used.
+    def __init__(self, slug, config):
+        self.slug = slug
+        self.config = config
+        self.name = config.get('name') or slug
+        self.paused = False
+        self.paused_at = None
+        # Set while an admin closes the election, then the frozen results
+        self.closing = False
+        self.final = None
+        self.created = time.time()
+        self.last_used = self.created
+        self.requests = 0
+
+    def touch(self):
+        self.last_used = time.time()
+        self.requests += 1
+
+
+def load_tenant_config(path=None, inline=None):
+    # {"slug": {"sheet_id": ..., "name": ..., "hosts": [...],
+    #           "credentials_env": "NAME_OF_ENV_VAR"}, ...}
+    configs = {}
+    if inline:
+        configs = json.loads(inline)
+    elif path and os.path.exists(path):
+        with open(path) as f:
+            configs = json.load(f)
+    for slug, config in list(configs.items()):
+        # Only the default election may fall back to GOOGLE_SHEET_ID
+        if slug != DEFAULT_TENANT and not config.get('sheet_id'):
+            print(f"Tenants: '{slug}' has no sheet_id, skipping")
+            del configs[slug]
+    return configs
+
+
+class TenantRegistry:
+    # Elections are created lazily on their first request and dropped again
+    # after `idle_ttl` seconds without one, or when more than `max_live` are
+    # loaded, least recently used first. Paused elections and the default
+    # one stay loaded so their state is never lost. `teardown` releases what
+    # `setup` opened once an election is dropped.
+    def __init__(self, configs, setup, teardown=None, idle_ttl=1800, max_live=50, sweep_every=60):
+        self.configs = configs
+        self.setup = setup
+        self.teardown = teardown
+        self.idle_ttl = idle_ttl
+        self.max_live = max_live
+        self.sweep_every = sweep_every
+        self.live = {}
+        self.building = {}  # slug -> Lock held while that election is set up
+        self.lock = threading.RLock()
+        self.last_sweep = time.time()
+        self.evicted = 0
+        self.hosts = {}
+        for slug, config in configs.items():
+            for host in config.get('hosts', []):
+                self.hosts[host.lower()] = slug
+
+    def resolve_host(self, host):
+        return self.hosts.get((host or '').split(':')[0].lower())
+
+    def get(self, slug):
+        with self.lock:
+            tenant = self.live.get(slug)
+            if tenant:
+                return tenant
+            if slug not in self.configs:
+                raise UnknownTenant(slug)
+            building = self.building.setdefault(slug, threading.Lock())
+        # Setup reads from disk and may reach Sheets: only requests for this
+        # election wait for it, the registry stays free for the others
+        with building:
+            with self.lock:
+                tenant = self.live.get(slug)
+            if not tenant:
+                tenant = Tenant(slug, self.configs[slug])
+                self.setup(tenant)
+                with self.lock:
+                    self.live[slug] = tenant
+        self.maybe_sweep(keep=tenant)
+        return tenant
+
+    def _pinned(self, tenant):
+        return tenant.slug == DEFAULT_TENANT or tenant.paused
+
+    def maybe_sweep(self, keep=None):
+        now = time.time()
+        if now - self.last_sweep >= self.sweep_every or len(self.live) > self.max_live:
+            self.sweep(now, keep)
+
+    def sweep(self, now=None, keep=None):
+        now = now or time.time()
+        evicted = []
+        with self.lock:
+            self.last_sweep = now
+            active = (_current.get(), keep)
+            candidates = sorted((t for t in self.live.values() if not self._pinned(t) and t not in active),
+                                key=lambda t: t.last_used)
+            for tenant in candidates:
+                if now - tenant.last_used > self.idle_ttl or len(self.live) > self.max_live:
+                    del self.live[tenant.slug]
+                    self.evicted += 1
+                    evicted.append(tenant)
+            live = len(self.live)
+        for tenant in evicted:
+            if self.teardown:
+                try:
+                    self.teardown(tenant)
+                except Exception as e:
+                    print(f"Tenants: could not release '{tenant.slug}': {e}")
+        return live
+
+    def each(self):
+        with self.lock:
+            return list(self.live.values())
+
+    @contextlib.contextmanager
+    def activate(self, slug):
+        token = _current.set(self.get(slug))
+        try:
+            yield _current.get()
+        finally:
+            _current.reset(token)
+
+    def bind(self, fn):
+        # Wrap a background job so it runs against the election that
+        # submitted it (passed as the `tenant` job parameter)
+        def run(job, tenant=DEFAULT_TENANT, **params):
+            with self.activate(tenant):
+                return fn(job, **params)
+        run.__name__ = fn.__name__
+        return run
+
+    def status(self):
+        with self.lock:
+            return {
+                'configured': len(self.configs),
+                'live': len(self.live),
+                'evicted': self.evicted,
+                'tenants': {t.slug: {'name': t.name, 'paused': t.paused, 'requests': t.requests,
+                                     'idle_seconds': int(time.time() - t.last_used),
+                                     'cache_bytes': getattr(getattr(t, 'cache', None), 'size', 0)}
+                            for t in self.live.values()},
+            }
+
+
+def current_tenant():
+    tenant = _current.get()
+    if tenant is None:
+        raise RuntimeError('no election selected for this request or job')
+    return tenant
+
+
+def set_current(tenant):
+    return _current.set(tenant)
+
+
+class TenantMiddleware:
+    # Selects the election for a request: '/t/<slug>/...' is moved into
+    # SCRIPT_NAME so routes and url_for() work unchanged under the prefix,
+    # otherwise the Host header is looked up in the registry.
+    def __init__(self, wsgi_app, registry):
+        self.wsgi_app = wsgi_app
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        slug = None
+        if path.startswith(PREFIX):
+            slug, _, rest = path[len(PREFIX):].partition('/')
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + PREFIX + slug
+            environ['PATH_INFO'] = '/' + rest
+        else:
+            slug = self.registry.resolve_host(environ.get('HTTP_HOST'))
+        environ['election.tenant'] = slug or DEFAULT_TENANT
+        return self.wsgi_app(environ, start_response)
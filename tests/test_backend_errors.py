@@ -0,0 +1,55 @@
+import gspread
+import pytest
+
+from local_db import LocalSheetsDB
+from resilience import BackendUnavailable, is_unavailable
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = 'error'
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': 'error', 'status': 'ERROR'}}
+
+
+def api_error(status_code):
+    return gspread.exceptions.APIError(FakeResponse(status_code))
+
+
+def failing_db(status_code):
+    db = LocalSheetsDB()
+
+    def fail(*args, **kwargs):
+        raise api_error(status_code)
+    db.spreadsheet.values_batch_get = fail
+    for sheet in db.spreadsheet.sheets.values():
+        sheet.get_all_values = fail
+    return db
+
+
+@pytest.mark.parametrize('status_code, unavailable', [(429, True), (500, True), (503, True),
+                                                      (400, False), (403, False), (404, False)])
+def test_only_throttling_and_server_errors_are_unavailable(status_code, unavailable):
+    assert is_unavailable(api_error(status_code)) is unavailable
+
+
+def test_outage_raises_backend_unavailable():
+    db = failing_db(429)
+    with pytest.raises(BackendUnavailable):
+        db.get_all_records_safe('VOTERS')
+    with pytest.raises(BackendUnavailable):
+        db.get_records_batch(['VOTERS', 'VOTES'])
+
+
+def test_permanent_error_is_raised_as_is():
+    db = failing_db(403)
+    with pytest.raises(gspread.exceptions.APIError):
+        db.get_all_records_safe('VOTERS')
+    with pytest.raises(gspread.exceptions.APIError):
+        db.get_records_batch(['VOTERS', 'VOTES'])
+
+
+def test_swallow_returns_empty():
+    assert failing_db(429).get_all_records_safe('VOTERS', swallow=True) == []
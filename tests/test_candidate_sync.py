@@ -0,0 +1,71 @@
+from local_db import LocalSheetsDB
+
+
+def candidate_rows(db):
+    return [(row[0], row[2], row[5]) for row in db._get_sheet('CANDIDATES').get_all_values()[1:]]
+
+
+def ids_by_name(db):
+    return {row[2]: row[1] for row in db._get_sheet('CANDIDATES').get_all_values()[1:]}
+
+
+def make_db(names=('A', 'B', 'C', 'D')):
+    db = LocalSheetsDB()
+    db.sync_candidates([{'Post': 'HEAD', 'Name': name, 'Active': 'TRUE'} for name in names])
+    return db
+
+
+def test_delete_in_the_middle_keeps_other_rows_and_ids():
+    db = make_db()
+    before = ids_by_name(db)
+    summary = db.sync_candidates([
+        {'Post': 'HEAD', 'Name': 'A', 'Active': 'TRUE'},
+        {'Post': 'HEAD', 'Name': 'C', 'Active': 'FALSE'},
+        {'Post': 'HEAD', 'Name': 'D', 'Active': 'TRUE'},
+        {'Post': 'HEAD', 'Name': 'E', 'Active': 'TRUE'},
+    ])
+    assert summary == {'inserted': 1, 'updated': 1, 'deleted': 1}
+    assert candidate_rows(db) == [('HEAD', 'A', 'TRUE'), ('HEAD', 'C', 'FALSE'),
+                                  ('HEAD', 'D', 'TRUE'), ('HEAD', 'E', 'TRUE')]
+    after = ids_by_name(db)
+    assert all(after[name] == before[name] for name in 'ACD')
+
+
+def test_updates_and_deletes_land_on_the_right_rows_after_a_hand_edit():
+    db = make_db()
+    sheet = db._get_sheet('CANDIDATES')
+    sheet.delete_rows(2)  # someone removes A by hand
+    db.sync_candidates([
+        {'Post': 'HEAD', 'Name': 'B', 'Active': 'FALSE'},
+        {'Post': 'HEAD', 'Name': 'D', 'Active': 'TRUE'},
+    ])
+    assert candidate_rows(db) == [('HEAD', 'B', 'FALSE'), ('HEAD', 'D', 'TRUE')]
+
+
+def test_change_made_elsewhere_is_not_skipped():
+    db = make_db(['A'])
+    sheet = db._get_sheet('CANDIDATES')
+    db.sync_candidates([{'Post': 'HEAD', 'Name': 'A', 'Active': 'TRUE'}])
+    sheet.batch_update([{'range': 'F2', 'values': [['FALSE']]}])  # another worker deactivates A
+    summary = db.sync_candidates([{'Post': 'HEAD', 'Name': 'A', 'Active': 'TRUE'}])
+    assert summary['updated'] == 1
+    assert candidate_rows(db) == [('HEAD', 'A', 'TRUE')]
+
+
+def test_every_candidate_gets_a_votes_column():
+    db = make_db(['A'])
+    votes = db._get_sheet('VOTES')
+    if not votes.row_values(1):
+        votes.append_row(['VotingID', 'A', 'Timestamp', 'VerificationCode'])
+    db.sync_candidates([{'Post': 'HEAD', 'Name': 'B', 'Active': 'TRUE'}], replace=False)
+    assert 'B' in votes.row_values(1)
+    db.store_vote('1234', {'HEAD': 'B'}, 'CODE')
+    assert db.get_all_votes()[0]['B'] == '1'
+
+
+def test_delete_candidate_finds_the_row_fresh():
+    db = make_db()
+    ids = ids_by_name(db)
+    db._get_sheet('CANDIDATES').delete_rows(2)  # A gone, rows shifted
+    db.delete_candidate(ids['C'])
+    assert [row[1] for row in candidate_rows(db)] == ['B', 'D']
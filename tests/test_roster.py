@@ -0,0 +1,74 @@
+import pytest
+
+from local_db import LocalSheetsDB
+from roster import SharedRoster
+
+
+def voters(*ids, used=()):
+    return [{'VotingID': vid, 'Class': '9', 'Section': 'A', 'RollNo': str(n),
+             'Used': 'YES' if vid in used else 'NO'} for n, vid in enumerate(ids, 1)]
+
+
+def test_publish_and_lookup(tmp_path):
+    roster = SharedRoster(str(tmp_path / 'r.roster'))
+    roster.publish(voters('B2', 'A1', 'C3', used={'C3'}), 0)
+    assert roster.lookup('A1') == {'class': '9', 'section': 'A', 'roll_no': '2', 'used': False}
+    assert roster.lookup('C3')['used'] is True
+    assert roster.lookup('Z9') is None
+
+
+def test_mark_used_reaches_other_workers_through_the_journal(tmp_path):
+    path = str(tmp_path / 'r.roster')
+    first, second = SharedRoster(path), SharedRoster(path, check_every=0)
+    first.publish(voters('A1', 'B2'), 0)
+    first.mark_used('A1')
+    assert second.lookup('A1')['used'] is True
+    assert second.lookup('B2')['used'] is False
+
+
+def test_journal_after_the_read_survives_a_publish(tmp_path):
+    roster = SharedRoster(str(tmp_path / 'r.roster'))
+    roster.publish(voters('A1', 'B2'), 0)
+    offset = roster.journal_position()
+    roster.mark_used('B2')  # written after VOTERS was read
+    roster.publish(voters('A1', 'B2'), offset)
+    assert roster.lookup('B2')['used'] is True
+
+
+@pytest.mark.parametrize('loader_result', [[], RuntimeError('quota')])
+def test_refresh_keeps_the_roster_when_the_read_fails_or_is_empty(tmp_path, loader_result):
+    def loader():
+        if isinstance(loader_result, Exception):
+            raise loader_result
+        return loader_result
+    roster = SharedRoster(str(tmp_path / 'r.roster'), loader=loader)
+    roster.publish(voters('A1', 'B2'), 0)
+    roster._refresh()
+    assert roster.stats()['voters'] == 2
+    assert roster.lookup('A1') is not None
+
+
+def test_refresh_publishes_a_real_read(tmp_path):
+    records = voters('A1')
+    roster = SharedRoster(str(tmp_path / 'r.roster'), loader=lambda: records)
+    roster.publish(records, 0)
+    records = voters('A1', 'N1')
+    roster._refresh()
+    assert roster.lookup('N1') is not None
+
+
+def test_closed_roster_finds_nothing_but_still_journals(tmp_path):
+    path = str(tmp_path / 'r.roster')
+    roster, other = SharedRoster(path), SharedRoster(path, check_every=0)
+    roster.publish(voters('A1'), 0)
+    roster.close()
+    assert roster.lookup('A1') is None
+    roster.mark_used('A1')
+    assert other.lookup('A1')['used'] is True
+
+
+def test_find_voter_sees_an_id_added_after_the_roster_was_built():
+    db = LocalSheetsDB()
+    db.add_voters_batch([{'VotingID': 'NEW1', 'Class': '8', 'Section': 'B', 'RollNo': '4'}])
+    assert db.find_voter('NEW1') == {'class': '8', 'section': 'B', 'roll_no': '4', 'used': False}
+    assert db.find_voter('NOPE') is None
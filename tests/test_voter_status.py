@@ -0,0 +1,51 @@
+from local_db import LocalSheetsDB
+
+
+def make_db(count=6):
+    db = LocalSheetsDB()
+    db.add_voters_batch([{'VotingID': f'V{n}', 'Class': '9', 'Section': 'A', 'RollNo': str(n)}
+                         for n in range(count)])
+    return db
+
+
+def used_flags(db):
+    return {row[0]: row[4] for row in db._get_sheet('VOTERS').get_all_values()[1:]}
+
+
+def test_bulk_write_after_rows_were_reordered():
+    db = make_db()
+    db._voter_index()  # cached row numbers
+    sheet = db._get_sheet('VOTERS')
+    with sheet.spreadsheet.lock:
+        sheet.rows[1:] = list(reversed(sheet.rows[1:]))  # sorted by hand
+        sheet.rows.insert(1, ['NEW', '9', 'A', '9', 'NO'])
+    report = db.set_voters_used(['V1', 'V4'], True)
+    assert report == {'V1': 'updated', 'V4': 'updated'}
+    flags = used_flags(db)
+    assert [vid for vid, used in flags.items() if used == 'YES'] == ['V4', 'V1']
+
+
+def test_unchanged_comes_from_the_sheet_not_the_cache():
+    db = make_db()
+    db._voter_index()
+    sheet = db._get_sheet('VOTERS')
+    sheet.batch_update([{'range': 'E3', 'values': [['YES']]}])  # V1, marked by another worker
+    assert db.set_voters_used(['V1', 'V2'], True) == {'V1': 'unchanged', 'V2': 'updated'}
+
+
+def test_single_id_falls_back_to_find():
+    db = make_db()
+    db._voter_index()
+    sheet = db._get_sheet('VOTERS')
+    sheet.append_row(['LATE', '9', 'A', '7', 'NO'])
+    # Force the re-read index to miss it as well
+    db._voter_index = lambda refresh=False: {}
+    assert db.mark_voting_id_used('LATE')
+    assert used_flags(db)['LATE'] == 'YES'
+
+
+def test_missing_ids_are_reported_and_nothing_else_is_touched():
+    db = make_db(3)
+    report = db.set_voters_used(['V0', 'NOPE'], True)
+    assert report == {'V0': 'updated', 'NOPE': 'not_found'}
+    assert used_flags(db) == {'V0': 'YES', 'V1': 'NO', 'V2': 'NO'}
@@ -0,0 +1,129 @@
+import json
+import time
+import hmac
+import hashlib
+import secrets
+import threading
+from flask import g, request, session
+
+# Form/query fields that identify a voter. Their values are replaced by a
+# keyed hash so one voter's requests still line up within a recording, but
+# the original IDs cannot be recovered from it. DROPPED_FIELDS never leave
+# the request at all.
+ANONYMISED_FIELDS = ('voter_id', 'roll_no', 'roll', 'q')
+DROPPED_FIELDS = ('password', 'otp')
+SKIP_PATHS = ('/admin/traffic',)
+
+
+class TrafficRecorder:
+    # Appends one JSON line per request: arrival offset and gap since the
+    # previous request, method, URL rule, anonymised form/query payload,
+    # status and time spent in the app. replay.py plays the file back.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.file = None
+        self.path = None
+        self.key = None
+        self.started_at = None
+        self.last_arrival = None
+        self.count = 0
+
+    @property
+    def enabled(self):
+        return self.file is not None
+
+    def start(self, path):
+        with self.lock:
+            if self.file:
+                self.file.close()
+            self.file = open(path, 'a', buffering=1)
+            self.path = path
+            self.key = secrets.token_bytes(32)
+            self.started_at = time.time()
+            self.last_arrival = self.started_at
+            self.count = 0
+
+    def stop(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+            self.file = None
+
+    def anonymise(self, value):
+        digest = hmac.new(self.key, str(value).encode(), hashlib.sha256).hexdigest()
+        return f"anon:{digest[:12]}"
+
+    def _clean(self, fields):
+        cleaned = {}
+        for name, value in fields.items():
+            if name in DROPPED_FIELDS:
+                continue
+            if name in ANONYMISED_FIELDS and value:
+                value = self.anonymise(value)
+            elif name == 'metadata':
+                value = self._clean_json(value)
+            cleaned[name] = value
+        return cleaned
+
+    def _clean_json(self, value):
+        try:
+            data = json.loads(value)
+        except (TypeError, ValueError):
+            return None
+        if isinstance(data, dict):
+            return json.dumps(self._clean(data))
+        return None
+
+    def record(self, arrival, duration, status):
+        sid = getattr(session, 'sid', None) or f"{request.remote_addr}|{request.user_agent.string}"
+        entry = {
+            't': round(arrival - self.started_at, 4),
+            'gap': round(max(arrival - self.last_arrival, 0), 4),
+            'client': self.anonymise(sid),
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'args': self._clean(request.args.to_dict()),
+            'form': self._clean(request.form.to_dict()),
+            'files': {name: f.content_length or 0 for name, f in request.files.items()},
+            'admin': bool(session.get('admin_logged_in')),
+            'status': status,
+            'ms': round(duration * 1000, 2),
+        }
+        line = json.dumps(entry, separators=(',', ':'))
+        with self.lock:
+            if not self.file:
+                return
+            self.last_arrival = max(self.last_arrival, arrival)
+            self.file.write(line + '\n')
+            self.count += 1
+
+    def status(self):
+        return {'enabled': self.enabled, 'path': self.path, 'requests': self.count,
+                'started_at': self.started_at}
+
+
+def init_app(app, recorder):
+    def mark_arrival():
+        if recorder.enabled:
+            g._traffic_arrival = time.time()
+            g._traffic_start = time.perf_counter()
+
+    def remember_status(response):
+        if '_traffic_start' in g:
+            g._traffic_status = response.status_code
+        return response
+
+    def write_entry(exc):
+        start = g.pop('_traffic_start', None)
+        if start is None or request.path.startswith(SKIP_PATHS):
+            return
+        try:
+            recorder.record(g.pop('_traffic_arrival'), time.perf_counter() - start,
+                            g.pop('_traffic_status', 500))
+        except Exception as e:
+            print(f"Traffic recorder: could not record request: {e}")
+
+    app.before_request(mark_arrival)
+    app.after_request(remember_status)
+    app.teardown_request(write_entry)
@@ -0,0 +1,167 @@
+import time
+import datetime
+import threading
+from collections import deque, Counter
+
+# Live turnout figures kept up to date one committed ballot at a time, so
+# the dashboard never has to re-read VOTES. Everything lives in fixed-size
+# rings: ballots per minute, recent verification-to-commit durations and
+# recent commits. Eligible and voted counts per class and section come from
+# the VOTERS Used flags whenever the roster is read, plus the commits this
+# worker made that the read did not include yet.
+SESSION_TIMESTAMP_FORMAT = '%Y%m%d_%HH%MM%SS'  # as written by start_ballot
+RATE_WINDOW = 15  # minutes behind the current ballot rate and projection
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _group(details):
+    details = details or {}
+    cls = str(details.get('class', details.get('Class', '')) or '').strip()
+    section = str(details.get('section', details.get('Section', '')) or '').strip().upper()
+    return cls, section
+
+
+class MinuteSeries:
+    # Ballots per minute for the last `size` minutes. Slot m % size holds
+    # minute m; a slot still stamped with an older minute counts as empty.
+    def __init__(self, size):
+        self.size = size
+        self.counts = [0] * size
+        self.minutes = [None] * size
+
+    def add(self, when, count=1):
+        minute = int(when // 60)
+        slot = minute % self.size
+        if self.minutes[slot] != minute:
+            self.minutes[slot] = minute
+            self.counts[slot] = 0
+        self.counts[slot] += count
+
+    def window(self, now, span):
+        # (first minute, counts) for the `span` minutes ending now
+        current = int(now // 60)
+        first = current - min(span, self.size) + 1
+        counts = []
+        for minute in range(first, current + 1):
+            slot = minute % self.size
+            counts.append(self.counts[slot] if self.minutes[slot] == minute else 0)
+        return first, counts
+
+
+class TurnoutTracker:
+    def __init__(self, minutes=480, durations=1024, recent=4096):
+        self.per_minute = MinuteSeries(minutes)
+        self.durations = deque(maxlen=durations)  # seconds from ID check to commit
+        self.recent = deque(maxlen=recent)  # (seq, voting_id, group) of commits
+        self.seq = 0
+        self.eligible = Counter()  # (class, section) -> voters
+        self.voted = Counter()
+        self.roster_loaded_at = None
+        self.lock = threading.Lock()
+
+    def record(self, voting_id, details, session_timestamp=None, now=None):
+        # One committed ballot. Demo (DUMMY section) ballots are left out.
+        now = now or time.time()
+        group = _group(details)
+        if group[1] == 'DUMMY':
+            return
+        duration = None
+        if session_timestamp:
+            try:
+                started = datetime.datetime.strptime(session_timestamp, SESSION_TIMESTAMP_FORMAT)
+                duration = now - started.timestamp()
+            except ValueError:
+                pass
+        with self.lock:
+            self.seq += 1
+            self.recent.append((self.seq, str(voting_id), group))
+            self.per_minute.add(now)
+            if duration is not None and 0 <= duration < 24 * 3600:
+                self.durations.append(duration)
+            if self.roster_loaded_at:
+                self.voted[group] += 1
+
+    def mark(self):
+        # Take before reading VOTERS and pass to load_roster()
+        with self.lock:
+            return self.seq
+
+    def load_roster(self, voters, mark):
+        eligible, voted, used = Counter(), Counter(), set()
+        for v in voters:
+            group = _group(v)
+            if group[1] == 'DUMMY':
+                continue
+            eligible[group] += 1
+            if str(v.get('Used', 'NO')).upper() == 'YES':
+                voted[group] += 1
+                used.add(str(v.get('VotingID')))
+        with self.lock:
+            # Commits made after the read started that it did not see yet
+            for seq, voting_id, group in self.recent:
+                if seq > mark and voting_id not in used:
+                    voted[group] += 1
+            self.eligible, self.voted = eligible, voted
+            self.roster_loaded_at = time.time()
+
+    @staticmethod
+    def _rollup(eligible, voted, key):
+        groups = {}
+        for group, count in eligible.items():
+            entry = groups.setdefault(key(group), {'eligible': 0, 'voted': 0})
+            entry['eligible'] += count
+            entry['voted'] += min(voted.get(group, 0), count)
+        for entry in groups.values():
+            entry['turnout'] = round(entry['voted'] / entry['eligible'], 4) if entry['eligible'] else 0
+        return groups
+
+    def feed(self, minutes=60, now=None):
+        now = now or time.time()
+        with self.lock:
+            first, counts = self.per_minute.window(now, minutes)
+            _, recent_counts = self.per_minute.window(now, RATE_WINDOW)
+            durations = list(self.durations)
+            eligible, voted = Counter(self.eligible), Counter(self.voted)
+            loaded_at = self.roster_loaded_at
+        total_eligible = sum(eligible.values())
+        total_voted = sum(min(voted.get(g, 0), n) for g, n in eligible.items())
+        remaining = total_eligible - total_voted
+        # Average over the minutes this worker has been counting, up to the window
+        rate = sum(recent_counts) / RATE_WINDOW
+        projected = None
+        if remaining <= 0 and total_eligible:
+            projected = 0
+        elif rate > 0:
+            projected = remaining / rate
+        classes = self._rollup(eligible, voted, lambda g: g[0] or '?')
+        sections = self._rollup(eligible, voted, lambda g: f"{g[0]}-{g[1]}")
+        return {
+            'generated_at': datetime.datetime.fromtimestamp(now).isoformat(timespec='seconds'),
+            'per_minute': {
+                'start': datetime.datetime.fromtimestamp(first * 60).isoformat(timespec='minutes'),
+                'counts': counts,
+            },
+            'rate_per_minute': round(rate, 2),
+            'totals': {'eligible': total_eligible, 'voted': total_voted, 'remaining': remaining,
+                       'turnout': round(total_voted / total_eligible, 4) if total_eligible else 0},
+            'classes': classes,
+            'sections': sections,
+            'lagging': sorted(sections, key=lambda s: sections[s]['turnout'])[:5],
+            'durations': {
+                'samples': len(durations),
+                'p50': round(percentile(durations, 0.5), 1) if durations else None,
+                'p90': round(percentile(durations, 0.9), 1) if durations else None,
+                'mean': round(sum(durations) / len(durations), 1) if durations else None,
+            },
+            'projected_minutes_remaining': round(projected, 1) if projected is not None else None,
+            'projected_completion': (datetime.datetime.fromtimestamp(now + projected * 60).isoformat(timespec='minutes')
+                                     if projected is not None else None),
+            'roster_loaded_at': (datetime.datetime.fromtimestamp(loaded_at).isoformat(timespec='seconds')
+                                 if loaded_at else None),
+        }
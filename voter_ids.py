@@ -0,0 +1,77 @@
+import os
+import random
+import datetime
+
+# Voting IDs carry a Damm check digit, so any single mistyped digit and any
+# swap of two adjacent digits is caught at the booth before a lookup is
+# made. Student IDs are all digits; teacher and demo IDs start with a
+# letter and carry the check digit over the digits that follow it.
+# VOTER_ID_LENGTH counts every character, check digit and prefix included.
+ID_LENGTH = max(5, int(os.environ.get('VOTER_ID_LENGTH', 7)))
+TEACHER_PREFIX = 'T'
+DUMMY_PREFIX = 'D'
+PREFIXES = (TEACHER_PREFIX, DUMMY_PREFIX)
+
+# Old 4-character IDs (1234, T001, 0001) keep working until
+# LEGACY_IDS_UNTIL (an ISO date or datetime); unset means no end date yet
+LEGACY_LENGTH = 4
+LEGACY_IDS_UNTIL = os.environ.get('LEGACY_IDS_UNTIL')
+
+_DAMM = (
+    (0, 3, 1, 7, 5, 9, 8, 6, 4, 2),
+    (7, 0, 9, 2, 1, 5, 4, 8, 6, 3),
+    (4, 2, 0, 6, 8, 7, 1, 3, 5, 9),
+    (1, 7, 5, 0, 9, 8, 3, 4, 2, 6),
+    (6, 1, 2, 3, 0, 4, 5, 9, 7, 8),
+    (3, 6, 7, 4, 2, 0, 9, 5, 8, 1),
+    (5, 8, 6, 9, 7, 2, 0, 1, 3, 4),
+    (8, 9, 4, 5, 3, 6, 2, 0, 1, 7),
+    (9, 4, 3, 8, 6, 1, 7, 2, 0, 5),
+    (2, 5, 8, 1, 4, 3, 6, 7, 9, 0),
+)
+
+
+def damm_digit(digits):
+    interim = 0
+    for d in digits:
+        interim = _DAMM[interim][int(d)]
+    return str(interim)
+
+
+def normalise_id(voting_id):
+    return str(voting_id or '').strip().upper().replace(' ', '').replace('-', '')
+
+
+def make_id(number, prefix=''):
+    # The `number`th ID with this prefix, zero-padded to fill ID_LENGTH
+    width = ID_LENGTH - len(prefix) - 1
+    body = str(number).zfill(width)
+    if len(body) > width:
+        raise ValueError(f'{number} does not fit a {ID_LENGTH}-character ID')
+    return prefix + body + damm_digit(body)
+
+
+def random_id(prefix=''):
+    width = ID_LENGTH - len(prefix) - 1
+    return make_id(random.randrange(10 ** width), prefix)
+
+
+def legacy_allowed(now=None):
+    if not LEGACY_IDS_UNTIL:
+        return True
+    return (now or datetime.datetime.now()) <= datetime.datetime.fromisoformat(LEGACY_IDS_UNTIL)
+
+
+def is_legacy_id(voting_id):
+    return len(voting_id) == LEGACY_LENGTH and voting_id.isalnum()
+
+
+def is_valid_id(voting_id):
+    # Checks the shape and check digit only; no roster lookup
+    voting_id = normalise_id(voting_id)
+    if is_legacy_id(voting_id):
+        return legacy_allowed()
+    if len(voting_id) != ID_LENGTH:
+        return False
+    body = voting_id[1:] if voting_id[:1] in PREFIXES else voting_id
+    return body.isdigit() and damm_digit(body[:-1]) == body[-1]